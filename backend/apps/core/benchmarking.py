@@ -0,0 +1,102 @@
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from .testing import TEST_SETTINGS
+
+# Helpers for the benchmark management commands
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Run against a freshly migrated test database, dropped afterwards
+    Redis-backed stores are swapped for the in-process ones, like in the tests,
+    so a benchmark never touches live data
+    """
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(**TEST_SETTINGS):
+            yield
+    finally:
+        # Worker threads may still hold connections, which would block the DROP
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                'WHERE datname = current_database() AND pid <> pg_backend_pid()'
+            )
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def run_concurrently(task, items, workers):
+    """
+    Call task(item) for every item from workers threads, released together
+    Each thread uses its own connection
+    Returns (elapsed seconds, latencies of the calls that succeeded, exceptions raised)
+    """
+    start = threading.Event()
+
+    def run(item):
+        start.wait()
+        began = time.perf_counter()
+        try:
+            task(item)
+            return time.perf_counter() - began, None
+        except Exception as e:
+            return None, e
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, item) for item in items]
+        began = time.perf_counter()
+        start.set()
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - began
+
+    latencies = [latency for latency, error in results if error is None]
+    errors = [error for _, error in results if error is not None]
+    return elapsed, latencies, errors
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of samples, fraction in [0, 1]"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def throughput(elapsed, latencies, errors=()):
+    """One line summary of a run_concurrently result"""
+    if not latencies:
+        return f'all {len(errors)} calls failed'
+
+    line = (
+        f'{len(latencies) / elapsed:10,.0f}/s'
+        f'   p50 {percentile(latencies, 0.5) * 1000:7.2f} ms'
+        f'   p99 {percentile(latencies, 0.99) * 1000:7.2f} ms'
+    )
+    if errors:
+        line += f'   {len(errors)} failed ({type(errors[0]).__name__})'
+    return line
+
+
+def count_queries(task):
+    """Number of queries task() runs"""
+    with CaptureQueriesContext(connection) as queries:
+        task()
+    return len(queries)
+
+
+def time_per_call(task, number=1000, repeat=5):
+    """Best of repeat runs of number calls to task(), in seconds per call"""
+    return min(timeit.repeat(task, number=number, repeat=repeat)) / number
+
+
+def speedup(before, after, number=1000):
+    """Time per call of two equivalent functions, and how much faster after is"""
+    before = time_per_call(before, number)
+    after = time_per_call(after, number)
+    return f'{before * 1e6:9.1f} us -> {after * 1e6:7.1f} us   {before / after:5.1f}x'
@@ -0,0 +1,8 @@
+from functools import partial
+from channels.db import database_sync_to_async
+
+# database_sync_to_async runs every call on the one thread-sensitive executor of
+# the worker, so the database work of unrelated sockets queues up behind each
+# other. This variant runs on the default thread pool; each thread uses its own
+# connection, cleaned up around the call like database_sync_to_async does
+pooled_database_sync_to_async = partial(database_sync_to_async, thread_sensitive=False)
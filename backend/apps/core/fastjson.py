@@ -0,0 +1,22 @@
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+
+# Decimal, lazy strings and datetimes go through DRF's encoder so the output
+# matches what the stdlib JSONRenderer has always produced
+_fallback = JSONEncoder().default
+_options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj):
+    """Serialize obj to compact UTF-8 JSON bytes"""
+    return orjson.dumps(obj, default=_fallback, option=_options)
+
+
+def dumps_text(obj):
+    """Serialize obj to a compact JSON str, for text frames and Redis values"""
+    return dumps(obj).decode()
+
+
+def loads(data):
+    """Parse JSON from str or bytes; raises ValueError on malformed input"""
+    return orjson.loads(data)
@@ -0,0 +1,135 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+# Clients retrying a request send the same key; the first outcome is stored
+# in the cache for IDEMPOTENCY_TTL seconds and replayed to every retry.
+# The cache is only the fast path: deposits and withdrawals also store the key
+# on their ledger row, so an evicted or released key can never book them twice
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Cache value while the first request with a key is still running
+IN_PROGRESS = 'in_progress'
+
+INVALID_KEY_MESSAGE = f'Idempotency key must be 1-{MAX_KEY_LENGTH} characters'
+IN_PROGRESS_MESSAGE = 'A request with this idempotency key is still being processed'
+MISMATCH_MESSAGE = 'This idempotency key was already used for a different request'
+
+
+def is_valid_key(key):
+    return isinstance(key, str) and 0 < len(key) <= MAX_KEY_LENGTH
+
+
+def idempotency_cache_key(user_id, scope, key):
+    """Keys are per user and per operation, so clients only need them unique for themselves"""
+    return f'idempotency:{scope}:{user_id}:{key}'
+
+
+def fingerprint(payload):
+    """Short digest of a request payload, to refuse a key reused for a different request"""
+    if not isinstance(payload, bytes):
+        payload = str(payload).encode()
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+
+def begin(cache_key):
+    """
+    Claim a key for the current request
+    Returns None when the caller should process the request, otherwise the
+    stored outcome or IN_PROGRESS
+    """
+    if cache.add(cache_key, IN_PROGRESS, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+        return None
+    return cache.get(cache_key, IN_PROGRESS)
+
+
+def complete(cache_key, outcome):
+    """Store the outcome replayed to retries"""
+    cache.set(cache_key, outcome, timeout=settings.IDEMPOTENCY_TTL)
+
+
+def abandon(cache_key):
+    """Release a key whose request failed unexpectedly so a retry runs it again"""
+    cache.delete(cache_key)
+
+
+async def abegin(cache_key):
+    """Async begin"""
+    if await cache.aadd(cache_key, IN_PROGRESS, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+        return None
+    return await cache.aget(cache_key, IN_PROGRESS)
+
+
+async def acomplete(cache_key, outcome):
+    """Async complete"""
+    await cache.aset(cache_key, outcome, timeout=settings.IDEMPOTENCY_TTL)
+
+
+async def aabandon(cache_key):
+    """Async abandon"""
+    await cache.adelete(cache_key)
+
+
+def idempotent(scope):
+    """
+    Make an APIView handler replay its response to requests repeating an Idempotency-Key
+    - Requests without the header run as before
+    - Responses below 500 are stored; server errors and exceptions release the key,
+      so handlers that move money must dedupe on the key themselves (WalletService)
+    - A response is returned even if storing it fails
+    - A retry while the first request runs gets 409, a key reused with another body 422
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return handler(view, request, *args, **kwargs)
+
+            if not is_valid_key(key):
+                return Response({
+                    'error': INVALID_KEY_MESSAGE
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            cache_key = idempotency_cache_key(request.user.pk, scope, key)
+            digest = fingerprint(request.get_full_path().encode() + b'\n' + request.body)
+
+            outcome = begin(cache_key)
+            if outcome == IN_PROGRESS:
+                return Response({
+                    'error': IN_PROGRESS_MESSAGE
+                }, status=status.HTTP_409_CONFLICT)
+            if outcome is not None:
+                if outcome['fingerprint'] != digest:
+                    return Response({
+                        'error': MISMATCH_MESSAGE
+                    }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                return Response(outcome['data'], status=outcome['status'], headers={REPLAYED_HEADER: 'true'})
+
+            try:
+                response = handler(view, request, *args, **kwargs)
+            except Exception:
+                abandon(cache_key)
+                raise
+
+            if response.status_code >= 500:
+                abandon(cache_key)
+            else:
+                try:
+                    complete(cache_key, {
+                        'fingerprint': digest,
+                        'status': response.status_code,
+                        'data': response.data
+                    })
+                except Exception:
+                    # The request already ran; its key expires with the lock
+                    pass
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,174 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from django import forms
+from django.core import exceptions
+from django.db import models
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+# Money is stored and computed as a whole number of cents in 64-bit integer
+# columns. It becomes a "10.50" string, or a Decimal, only at the API edges.
+
+
+class Money(int):
+    """
+    An amount of money in cents
+    - Money(1050) is 10.50; Money.parse('10.50') builds it from a decimal amount
+    - Adding, subtracting or negating Money, or multiplying it by an int, gives Money
+    - It compares with Money and ints as cents; comparing it with a Decimal or
+      float raises TypeError, parse them first. Only the Money-first forms can
+      be refused: Decimal('20') > Money(1050) is still compared as cents
+    - str() gives the API format, '10.50'
+    """
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Money from a decimal amount: Decimal, str, int or float ('10.5', 10.5, 10)
+        Sub-cent digits round half up, as the former numeric(10, 2) columns did
+        """
+        if isinstance(value, Money):
+            return value
+        try:
+            if not isinstance(value, Decimal):
+                value = Decimal(str(value).strip())
+            if not value.is_finite():
+                raise ValueError(f"Invalid amount: {value}")
+            return cls(int((value * 100).to_integral_value(rounding=ROUND_HALF_UP)))
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount: {value}")
+
+    def to_decimal(self):
+        """The amount as a Decimal with two places"""
+        return Decimal(int(self)).scaleb(-2)
+
+    def deconstruct(self):
+        """Lets migrations serialize Money defaults and validator limits"""
+        return 'apps.core.money.Money', (int(self),), {}
+
+    def __str__(self):
+        return '{:f}'.format(self.to_decimal())
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __format__(self, spec):
+        return format(self.to_decimal(), spec) if spec else str(self)
+
+    @staticmethod
+    def _cents(other):
+        # Mixing in a Decimal or float would silently treat it as cents
+        if not isinstance(other, int) or isinstance(other, bool):
+            raise TypeError(f"Cannot combine Money with {type(other).__name__}; use Money.parse()")
+        return int(other)
+
+    def __eq__(self, other):
+        if isinstance(other, (Decimal, float)):
+            raise TypeError(f"Cannot compare Money with {type(other).__name__}; use Money.parse()")
+        return int.__eq__(self, other)
+
+    def __ne__(self, other):
+        if isinstance(other, (Decimal, float)):
+            raise TypeError(f"Cannot compare Money with {type(other).__name__}; use Money.parse()")
+        return int.__ne__(self, other)
+
+    __hash__ = int.__hash__
+
+    def __lt__(self, other):
+        return int(self) < self._cents(other)
+
+    def __le__(self, other):
+        return int(self) <= self._cents(other)
+
+    def __gt__(self, other):
+        return int(self) > self._cents(other)
+
+    def __ge__(self, other):
+        return int(self) >= self._cents(other)
+
+    def __add__(self, other):
+        return Money(int(self) + self._cents(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Money(int(self) - self._cents(other))
+
+    def __rsub__(self, other):
+        return Money(self._cents(other) - int(self))
+
+    def __mul__(self, other):
+        return Money(int(self) * self._cents(other))
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-int(self))
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Money(abs(int(self)))
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Model field holding Money in a bigint column of cents
+    Only Money is taken as cents; anything else assigned to it (int, Decimal,
+    str, float) is a decimal amount, so balance=100 still means 100.00 and
+    admin forms and fixtures keep using "10.50"
+    """
+
+    def from_db_value(self, value, expression, connection):
+        # SUM() over bigint comes back as numeric
+        return value if value is None else Money(int(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Money):
+            return value
+        try:
+            return Money.parse(value)
+        except ValueError:
+            raise exceptions.ValidationError(
+                self.error_messages['invalid'],
+                code='invalid',
+                params={'value': value},
+            )
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None or hasattr(value, 'resolve_expression'):
+            return value
+        return int(self.to_python(value))
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'decimal_places': 2,
+            **kwargs,
+        })
+
+
+class MoneySerializerField(serializers.DecimalField):
+    """
+    Money in the API: "10.50" strings out, decimal amounts in
+    - Validated values are Money; min_value / max_value are decimal amounts
+    - max_digits limits input only; output is formatted from the cents, so
+      any stored amount can be represented
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_digits', None)
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(**kwargs)
+
+    def run_validation(self, data=serializers.empty):
+        value = super().run_validation(data)
+        return value if value is None else Money.parse(value)
+
+    def to_representation(self, value):
+        # DecimalField.quantize() would apply max_digits to stored amounts too
+        coerce_to_string = getattr(self, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        value = Money(value) if isinstance(value, int) else Money.parse(value)
+        return str(value) if coerce_to_string else value.to_decimal()
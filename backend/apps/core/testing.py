@@ -0,0 +1,103 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from apps.users.authentication import ClaimsRefreshToken
+
+# Settings the test suites run under
+# - Redis is swapped for the in-process cache, channel layer and game stores
+# - Turns go straight to the database
+# - A cheap hasher, users are created in every test
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'GAME_STATE_ENGINE': 'db',
+    'LEADERBOARD_BACKEND': 'memory',
+    'MATCHMAKING_BACKEND': 'memory',
+    'TURN_SEQUENCER_BACKEND': 'memory',
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+# Tables whose list and detail queries must always be served from an index;
+# users is only joined by primary key and may be hashed while it is small
+INDEXED_TABLES = ('rooms', 'games', 'guesses', 'transactions')
+
+
+def api_client(user):
+    """APIClient sending an access token of user"""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(user).access_token}')
+    return client
+
+
+def race(task, items, workers=32):
+    """
+    Call task(item) for every item from workers threads, released together
+    Each call runs on its own connection; returns the results in item order
+    """
+    start = threading.Event()
+
+    def run(item):
+        start.wait()
+        try:
+            return task(item)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, item) for item in items]
+        start.set()
+        return [future.result() for future in futures]
+
+
+class QueryBudgetMixin:
+    """Assertions on the number of queries a request runs"""
+
+    def assertQueryBudget(self, client, url, budget, seed):
+        """
+        GET url twice, with seed() adding rows before each request;
+        both must run exactly budget queries
+        """
+        # The first request fills the per-worker caches, e.g. the token version
+        client.get(url)
+        for _ in range(2):
+            seed()
+            with self.assertNumQueries(budget):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+
+def analyze():
+    """Refresh the planner statistics after seeding"""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def explain(sql):
+    """Text plan of an already interpolated query"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}')
+        return '\n'.join(row for row, in cursor.fetchall())
+
+
+class QueryPlanMixin:
+    """
+    Assertions on the plans of the queries a request runs
+    Seed enough rows and analyze() first, the planner scans small tables sequentially
+    """
+
+    def assertNoSeqScan(self, client, url, tables=INDEXED_TABLES):
+        """GET url and EXPLAIN each SELECT it ran; returns the response"""
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects, f'{url} ran no SELECT')
+        for sql in selects:
+            plan = explain(sql)
+            for table in tables:
+                self.assertIsNone(re.search(rf'Seq Scan on {table}\b', plan), f'{url}\n{sql}\n{plan}')
+        return response
@@ -0,0 +1,133 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db.models import F, Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import serializers
+from .money import Money, MoneySerializerField
+from .testing import TEST_SETTINGS
+
+User = get_user_model()
+
+
+class MoneyTests(SimpleTestCase):
+    """Cents in, '10.50' out, never mixed with a bare decimal amount"""
+
+    def test_parse(self):
+        for value, cents in (
+            ('10.50', 1050), ('10.5', 1050), (' 7 ', 700), (10, 1000), (10.5, 1050),
+            (Decimal('0.01'), 1), ('-2.25', -225), ('99999999.99', 9999999999),
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(Money.parse(value), Money(cents))
+                self.assertIs(type(Money.parse(value)), Money)
+
+    def test_parse_rounds_half_up(self):
+        for value, cents in (('0.005', 1), ('0.004', 0), ('1.125', 113), ('-0.005', -1), (0.1 + 0.2, 30)):
+            with self.subTest(value=value):
+                self.assertEqual(Money.parse(value), Money(cents))
+
+    def test_parse_refuses_invalid_amounts(self):
+        for value in ('', 'abc', '1,00', 'NaN', 'Infinity', Decimal('-Infinity'), float('nan')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                Money.parse(value)
+
+    def test_parse_keeps_money(self):
+        amount = Money(1050)
+        self.assertIs(Money.parse(amount), amount)
+
+    def test_format(self):
+        for cents, text in ((1050, '10.50'), (5, '0.05'), (0, '0.00'), (-5, '-0.05'), (10 ** 15, '10000000000000.00')):
+            with self.subTest(cents=cents):
+                self.assertEqual(str(Money(cents)), text)
+                self.assertEqual(f'{Money(cents)}', text)
+        self.assertEqual(f'{Money(1050):.1f}', '10.5')
+        self.assertEqual(repr(Money(1050)), "Money('10.50')")
+        self.assertEqual(Money(1050).to_decimal(), Decimal('10.50'))
+
+    def test_arithmetic(self):
+        amount = Money.parse('10.50')
+        for result, cents in ((amount + Money(50), 1100), (amount - Money(50), 1000), (amount * 3, 3150),
+                              (2 * amount, 2100), (-amount, -1050), (abs(-amount), 1050), (sum([amount, amount]), 2100)):
+            self.assertIs(type(result), Money)
+            self.assertEqual(result, cents)
+
+    def test_arithmetic_refuses_decimal_amounts(self):
+        for other in (Decimal('1.00'), 1.0, True):
+            with self.subTest(other=other), self.assertRaises(TypeError):
+                Money(1050) + other
+
+    def test_comparisons(self):
+        self.assertTrue(Money(1050) < Money.parse('20'))
+        self.assertTrue(Money(1050) >= Money.parse('10.50'))
+        self.assertTrue(Money(1050) == 1050)
+        self.assertTrue(Money(0) <= 0)
+        self.assertNotEqual(Money(0), None)
+        self.assertIn(Money(1050), {1050})
+
+    def test_comparisons_refuse_decimal_amounts(self):
+        for other in (Decimal('20'), 20.0):
+            for compare in (lambda: Money(1050) < other, lambda: Money(1050) >= other,
+                            lambda: Money(1050) == other, lambda: Money(1050) != other):
+                with self.subTest(other=other), self.assertRaises(TypeError):
+                    compare()
+
+
+class MoneySerializerFieldTests(SimpleTestCase):
+    def test_validates_to_money(self):
+        field = MoneySerializerField(max_digits=10)
+        value = field.run_validation('125.50')
+
+        self.assertIs(type(value), Money)
+        self.assertEqual(value, Money(12550))
+
+    def test_refuses_invalid_input(self):
+        field = MoneySerializerField(max_digits=10, min_value=Decimal('0.01'))
+        for data in ('1.005', 'abc', '0.00', '123456789.00'):
+            with self.subTest(data=data), self.assertRaises(serializers.ValidationError):
+                field.run_validation(data)
+
+    def test_representation(self):
+        field = MoneySerializerField(max_digits=10)
+        self.assertEqual(field.to_representation(Money(1050)), '10.50')
+        # max_digits only limits input
+        self.assertEqual(field.to_representation(Money(10 ** 15)), '10000000000000.00')
+        self.assertEqual(field.to_representation(Decimal('2.5')), '2.50')
+
+    def test_round_trip(self):
+        field = MoneySerializerField(max_digits=10)
+        for data in ('0.01', '10.50', '99999999.99'):
+            with self.subTest(data=data):
+                self.assertEqual(field.to_representation(field.run_validation(data)), data)
+
+
+@override_settings(**TEST_SETTINGS)
+class MoneyFieldTests(TestCase):
+    """User.balance, a MoneyField, stored as a bigint of cents"""
+
+    def create_user(self, email, balance):
+        return User.objects.create_user(email=email, password='secret', age=20, balance=balance)
+
+    def test_round_trip(self):
+        user = self.create_user('player@example.com', Money.parse('12.34'))
+        balance = User.objects.values_list('balance', flat=True).get(pk=user.pk)
+
+        self.assertIs(type(balance), Money)
+        self.assertEqual(balance, Money(1234))
+
+    def test_assigned_values_are_decimal_amounts(self):
+        for value in ('10.50', 100, Decimal('0.5')):
+            with self.subTest(value=value):
+                user = self.create_user(f'user{User.objects.count()}@example.com', value)
+                user.refresh_from_db()
+                self.assertEqual(user.balance, Money.parse(value))
+
+    def test_expressions_and_aggregates(self):
+        user = self.create_user('player@example.com', Money.parse('10.00'))
+        self.create_user('other@example.com', Money.parse('0.50'))
+        User.objects.filter(pk=user.pk).update(balance=F('balance') + Money.parse('0.25'))
+
+        user.refresh_from_db()
+        self.assertEqual(user.balance, Money.parse('10.25'))
+        total = User.objects.aggregate(total=Sum('balance'))['total']
+        self.assertIs(type(total), Money)
+        self.assertEqual(total, Money.parse('10.75'))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Room, BetSettings, Game, Guess
+from .models import Room, BetSettings, Game, Guess, PlayerStats
 
 
 @admin.register(BetSettings)
@@ -46,3 +46,11 @@ class GuessAdmin(admin.ModelAdmin):
     search_fields = ('game__id', 'player__email')
     readonly_fields = ('game', 'player', 'guess_number', 'feedback', 'created_at')
     ordering = ('game', 'created_at')
+
+
+@admin.register(PlayerStats)
+class PlayerStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'wins', 'games_played', 'total_wagered', 'net', 'updated_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'wins', 'games_played', 'total_wagered', 'net', 'updated_at')
+    ordering = ('-wins',)
@@ -1,23 +1,55 @@
-import json
+import asyncio
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from apps.core.db import pooled_database_sync_to_async
+from apps.core.fastjson import dumps_text
+from apps.core import idempotency
 from .models import Game, Room
 from .services import GameService
-from .serializers import GameSerializer, GuessSerializer
+from .serializers import serialize_game, serialize_room, TURN_DELTA_FIELDS
+from .engine import get_game_engine
+from .matchmaking import MatchmakingService, matchmaking_group_name
+from .lobby import LOBBY_GROUP_NAME
+from .outbox import game_group_name
+from .wire import FrameTooLarge, negotiate_codec
 
 
 class GameConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time game updates
-    URL: ws://host/ws/game/<room_id>/?token=<jwt_token>
+    URL: ws://host/ws/game/<room_id>/?token=<jwt_token>[&protocol=2]
+    Subprotocols: msgpack, msgpack+deflate (JSON text frames when none is requested)
+
+    Protocol 1 (default) sends the whole game with every turn.
+    Protocol 2 sends TURN_UPDATE / GAME_END with only the new guess, the
+    changed game fields and the state version (number of guesses played);
+    clients that miss a version send SYNC to get a full GAME_STATE.
+
+    MAKE_GUESS may carry an idempotency_key: a retried guess is not played
+    again, the sender only gets the original error back if there was one.
+
+    Game starts and database turns arrive through the outbox publisher as
+    outbox_batch messages; engine turns are broadcast by the socket itself.
     """
 
     async def connect(self):
         """Handle WebSocket connection"""
         self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'game_room_{self.room_id}'
+        self.room_group_name = game_group_name(self.room_id)
         self.user = self.scope['user']
+        self.engine = get_game_engine()
+        self.codec = negotiate_codec(self.scope.get('subprotocols', []))
+
+        query_params = parse_qs(self.scope.get('query_string', b'').decode())
+        self.protocol_version = 2 if query_params.get('protocol', ['1'])[0] == '2' else 1
+        # Latest full game state, kept current from turn deltas for protocol 1
+        self.game_snapshot = None
+        # Room with both players and the id of its game, loaded once at connect
+        self.room = None
+        self.game_id = None
+        self.game = None
 
         # Reject anonymous users
         if isinstance(self.user, AnonymousUser):
@@ -25,8 +57,8 @@ class GameConsumer(AsyncWebsocketConsumer):
             return
 
         # Verify user is a participant in the room
-        is_participant = await self.check_room_participant()
-        if not is_participant:
+        await self.load_room()
+        if not self.is_participant():
             await self.close(code=4003)
             return
 
@@ -36,14 +68,14 @@ class GameConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol=self.codec.subprotocol)
 
         # Send connection success message
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'CONNECTION_SUCCESS',
             'message': 'Connected to game room',
             'room_id': self.room_id
-        }))
+        })
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
@@ -54,22 +86,35 @@ class GameConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming WebSocket messages"""
         try:
-            data = json.loads(text_data)
+            data = self.codec.decode(text_data, bytes_data)
+        except FrameTooLarge:
+            # 1009: message too big
+            await self.close(code=1009)
+            return
+        except ValueError:
+            await self.send_error(self.codec.invalid_message)
+            return
+
+        try:
             event_type = data.get('type')
 
             if event_type == 'JOIN_GAME':
                 await self.handle_join_game()
+            elif event_type == 'SYNC':
+                await self.handle_sync()
             elif event_type == 'MAKE_GUESS':
                 guess_number = data.get('guess_number')
-                await self.handle_make_guess(guess_number)
+                idempotency_key = data.get('idempotency_key')
+                if idempotency_key is None:
+                    await self.handle_make_guess(guess_number)
+                else:
+                    await self.handle_idempotent_guess(guess_number, idempotency_key)
             else:
                 await self.send_error('Unknown event type')
 
-        except json.JSONDecodeError:
-            await self.send_error('Invalid JSON')
         except Exception as e:
             await self.send_error(str(e))
 
@@ -79,49 +124,93 @@ class GameConsumer(AsyncWebsocketConsumer):
 
         if game_data:
             # Game already exists, send current state
-            await self.send(text_data=json.dumps({
-                'type': 'GAME_STATE',
-                'game': game_data
-            }))
+            await self.send_game_state(game_data)
         else:
-            # Try to start the game
+            # Try to start the game; GAME_START reaches everyone through the outbox
             try:
-                game_data = await self.start_game()
-
-                # Broadcast game start to all participants
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'game_started',
-                        'game': game_data
-                    }
-                )
+                await self.start_game()
             except Exception as e:
                 await self.send_error(str(e))
 
+    async def handle_sync(self):
+        """Handle SYNC event sent by protocol 2 clients that detected a version gap"""
+        game_data = await self.get_game_data()
+
+        if game_data:
+            await self.send_game_state(game_data)
+        else:
+            await self.send_error('Game has not started yet')
+
+    async def send_game_state(self, game_data):
+        """Send a full GAME_STATE snapshot"""
+        self.game_snapshot = game_data
+        message = {
+            'type': 'GAME_STATE',
+            'game': game_data
+        }
+        if self.protocol_version >= 2:
+            message['version'] = len(game_data['guesses'])
+        await self.send_message(message)
+
+    async def handle_idempotent_guess(self, guess_number, idempotency_key):
+        """Handle a MAKE_GUESS event carrying an idempotency_key"""
+        if not idempotency.is_valid_key(idempotency_key):
+            await self.send_error(idempotency.INVALID_KEY_MESSAGE)
+            return
+
+        cache_key = idempotency.idempotency_cache_key(self.user.pk, f'ws_guess:{self.room_id}', idempotency_key)
+        digest = idempotency.fingerprint(guess_number)
+
+        outcome = await idempotency.abegin(cache_key)
+        if outcome == idempotency.IN_PROGRESS:
+            await self.send_error(idempotency.IN_PROGRESS_MESSAGE)
+            return
+        if outcome is not None:
+            if outcome['fingerprint'] != digest:
+                await self.send_error(idempotency.MISMATCH_MESSAGE)
+            elif outcome['error'] is not None:
+                await self.send_error(outcome['error'])
+            return
+
+        try:
+            error = await self.handle_make_guess(guess_number)
+        except BaseException:
+            # Cancelled mid-guess (socket closed); let a retry decide
+            await idempotency.aabandon(cache_key)
+            raise
+
+        await idempotency.acomplete(cache_key, {
+            'fingerprint': digest,
+            'error': error
+        })
+
     async def handle_make_guess(self, guess_number):
-        """Handle MAKE_GUESS event"""
+        """
+        Handle MAKE_GUESS event
+        Returns the error sent back to the player, if any
+        """
         if guess_number is None:
             await self.send_error('guess_number is required')
-            return
+            return 'guess_number is required'
 
         try:
             # Validate and process guess
             result = await self.process_guess(guess_number)
 
-            if result['success']:
-                guess_data = result['guess']
-                game_data = result['game']
-                is_game_over = result['is_game_over']
+            if not result['success']:
+                await self.send_error(result['error'])
+                return result['error']
 
-                if is_game_over:
+            if self.engine is not None:
+                # Engine turns are not in the database yet, so they skip the outbox.
+                # Only the turn delta is broadcast, never the whole game
+                if result['is_game_over']:
                     # Broadcast game end
                     await self.channel_layer.group_send(
                         self.room_group_name,
                         {
                             'type': 'game_ended',
-                            'game': game_data,
-                            'guess': guess_data
+                            'delta': result['delta']
                         }
                     )
                 else:
@@ -130,102 +219,195 @@ class GameConsumer(AsyncWebsocketConsumer):
                         self.room_group_name,
                         {
                             'type': 'turn_updated',
-                            'game': game_data,
-                            'guess': guess_data
+                            'delta': result['delta']
                         }
                     )
-            else:
-                await self.send_error(result['error'])
 
         except Exception as e:
             await self.send_error(str(e))
+            return str(e)
 
     # Group message handlers (called by channel_layer.group_send)
 
+    async def outbox_batch(self, event):
+        """Dispatch the events of one outbox batch in order"""
+        handlers = {
+            'game_started': self.game_started,
+            'turn_updated': self.turn_updated,
+            'game_ended': self.game_ended,
+        }
+        for message in event['events']:
+            await handlers[message['type']](message)
+
     async def game_started(self, event):
         """Broadcast GAME_START event to group"""
-        await self.send(text_data=json.dumps({
+        self.game_snapshot = event['game']
+        self.game_id = event['game']['id']
+        if self.room is not None and self.room.player2_id is None:
+            # Seated before the opponent joined; reload the room on next use
+            self.room = None
+        message = {
             'type': 'GAME_START',
             'game': event['game']
-        }))
+        }
+        if self.protocol_version >= 2:
+            message['version'] = len(event['game']['guesses'])
+        await self.send_message(message)
 
     async def turn_updated(self, event):
         """Broadcast TURN_UPDATE event to group"""
-        await self.send(text_data=json.dumps({
-            'type': 'TURN_UPDATE',
-            'game': event['game'],
-            'guess': event['guess']
-        }))
+        await self.send_turn('TURN_UPDATE', event['delta'])
 
     async def game_ended(self, event):
         """Broadcast GAME_END event to group"""
-        await self.send(text_data=json.dumps({
-            'type': 'GAME_END',
-            'game': event['game'],
-            'guess': event['guess']
-        }))
+        await self.send_turn('GAME_END', event['delta'])
+
+    async def send_turn(self, message_type, delta):
+        """Send a turn as a delta (protocol 2) or with the full game (protocol 1)"""
+        if self.protocol_version >= 2:
+            await self.send_message({
+                'type': message_type,
+                **delta
+            })
+            return
+
+        game_data = await self.apply_turn_delta(delta)
+        await self.send_message({
+            'type': message_type,
+            'game': game_data,
+            'guess': delta['guess']
+        })
+
+    async def apply_turn_delta(self, delta):
+        """Bring the cached game snapshot up to the delta's version, reloading it on a gap"""
+        snapshot = self.game_snapshot
+        if snapshot is not None and len(snapshot['guesses']) == delta['version'] - 1:
+            snapshot['guesses'].append(delta['guess'])
+            for field in TURN_DELTA_FIELDS:
+                snapshot[field] = delta[field]
+        else:
+            self.game_snapshot = await self.get_game_data()
+        return self.game_snapshot
 
     # Helper methods
 
+    async def send_message(self, message):
+        """Encode a message with the negotiated codec and send it"""
+        frame = self.codec.encode(message)
+        if self.codec.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
     async def send_error(self, message):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'ERROR',
             'error': message
-        }))
-
-    @database_sync_to_async
-    def check_room_participant(self):
-        """Check if user is a participant in the room"""
-        try:
-            room = Room.objects.get(id=self.room_id)
-            return self.user in [room.player1, room.player2]
-        except Room.DoesNotExist:
+        })
+
+    @pooled_database_sync_to_async
+    def load_room(self):
+        """Cache the room with both players and its game id in one query"""
+        return self.fetch_room()
+
+    def fetch_room(self):
+        room = Room.objects.with_players().select_related('game').filter(id=self.room_id).first()
+        self.room = room
+        if room is not None and hasattr(room, 'game'):
+            self.game_id = room.game.id
+        return room
+
+    def is_participant(self):
+        """Check if user is a participant in the cached room"""
+        if self.room is None:
             return False
+        return self.user.pk in (self.room.player1_id, self.room.player2_id)
+
+    def resolve_game(self, queryset):
+        """
+        Fetch this room's game from queryset, by the cached id when known
+        The id is unknown only when the game was started outside this socket
+        """
+        if self.game_id is not None:
+            return queryset.get(pk=self.game_id)
+
+        game = queryset.get(room_id=self.room_id)
+        self.game_id = game.id
+        return game
 
-    @database_sync_to_async
-    def get_game_data(self):
+    async def get_game_data(self):
         """Get current game state"""
+        if self.engine is None:
+            return await self.get_game_data_from_db()
+
         try:
-            room = Room.objects.get(id=self.room_id)
-            if hasattr(room, 'game'):
-                game = room.game
-                serializer = GameSerializer(game)
-                return serializer.data
+            state = await pooled_database_sync_to_async(self.engine.load)(int(self.room_id))
+            return state['game']
+        except Game.DoesNotExist:
             return None
-        except Room.DoesNotExist:
+
+    @pooled_database_sync_to_async
+    def get_game_data_from_db(self):
+        """Get current game state from the database"""
+        try:
+            game = self.resolve_game(Game.objects.with_details())
+            return serialize_game(game)
+        except Game.DoesNotExist:
             return None
 
-    @database_sync_to_async
-    def start_game(self):
+    async def start_game(self):
         """Start a new game"""
-        room = Room.objects.get(id=self.room_id)
-        game = GameService.start_game(room)
-        serializer = GameSerializer(game)
-        return serializer.data
+        # The cached room may predate the opponent joining
+        room = await self.load_room()
+        game = await GameService.astart_game(room)
+        self.game_id = game.pk
+        return game
 
-    @database_sync_to_async
-    def process_guess(self, guess_number):
+    async def process_guess(self, guess_number):
         """Process a guess and return result"""
+        if self.engine is None:
+            return await self.process_guess_in_db(guess_number)
+
         try:
-            room = Room.objects.get(id=self.room_id)
-            game = room.game
+            result = await pooled_database_sync_to_async(self.engine.make_guess)(
+                int(self.room_id), self.user.pk, guess_number
+            )
+            result['success'] = True
+            return result
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
 
-            # Make the guess using GameService
-            guess = GameService.make_guess(game, self.user, guess_number)
+    @pooled_database_sync_to_async
+    def load_game(self):
+        """
+        Cache the game row for guesses
+        Only the immutable fields are trusted; play_turn re-reads the turn state
+        """
+        self.game = self.resolve_game(Game.objects.all())
+        self.game.room = self.room
+        return self.game
+
+    async def process_guess_in_db(self, guess_number):
+        """Process a guess through the database and return result"""
+        try:
+            room = self.room
+            if room is None or room.player2_id is None:
+                room = await self.load_room()
+            player = room.player1 if self.user.pk == room.player1_id else room.player2
 
-            # Refresh game from database
-            game.refresh_from_db()
+            game = self.game
+            if game is None or game.pk != self.game_id:
+                game = await self.load_game()
 
-            # Serialize data
-            guess_serializer = GuessSerializer(guess)
-            game_serializer = GameSerializer(game)
+            # Make the guess using GameService; the turn is broadcast through the outbox
+            await GameService.amake_guess(game, player, guess_number)
 
             return {
-                'success': True,
-                'guess': guess_serializer.data,
-                'game': game_serializer.data,
-                'is_game_over': game.status == 'COMPLETED'
+                'success': True
             }
         except ValueError as e:
             return {
@@ -237,3 +419,125 @@ class GameConsumer(AsyncWebsocketConsumer):
                 'success': False,
                 'error': str(e)
             }
+
+
+class MatchmakingConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer that tells a queued player when a match is found
+    URL: ws://host/ws/matchmaking/?token=<jwt_token>
+    Closing the socket takes the player out of the matchmaking queue
+    """
+
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.user = self.scope['user']
+
+        # Reject anonymous users
+        if isinstance(self.user, AnonymousUser):
+            await self.close(code=4001)
+            return
+
+        self.group_name = matchmaking_group_name(self.user.pk)
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+            # A closed socket cannot be told about a match, so stop waiting
+            await pooled_database_sync_to_async(MatchmakingService.cancel)(self.user)
+
+    async def match_found(self, event):
+        """Send MATCH_FOUND event with the room both players were seated in"""
+        await self.send(text_data=dumps_text({
+            'type': 'MATCH_FOUND',
+            'room': event['room']
+        }))
+
+
+class LobbyConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for the live lobby
+    URL: ws://host/ws/lobby/?token=<jwt_token>
+    Sends the open rooms once, then only room deltas coalesced per time window
+    Deltas arrive from the outbox publisher, batched per tick as outbox_batch;
+    the window here only merges batches that arrive close together
+    """
+
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.user = self.scope['user']
+
+        # Reject anonymous users
+        if isinstance(self.user, AnonymousUser):
+            await self.close(code=4001)
+            return
+
+        # Subscribe before taking the snapshot so no delta falls in between
+        self.pending_deltas = {}
+        self.flush_task = None
+        await self.channel_layer.group_add(
+            LOBBY_GROUP_NAME,
+            self.channel_name
+        )
+
+        await self.accept()
+
+        rooms = await self.get_open_rooms()
+        await self.send(text_data=dumps_text({
+            'type': 'LOBBY_SNAPSHOT',
+            'rooms': rooms
+        }))
+
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        if hasattr(self, 'pending_deltas'):
+            await self.channel_layer.group_discard(
+                LOBBY_GROUP_NAME,
+                self.channel_name
+            )
+            if self.flush_task is not None:
+                self.flush_task.cancel()
+
+    async def outbox_batch(self, event):
+        """Queue the room deltas of one outbox batch in order"""
+        for message in event['events']:
+            await self.lobby_delta(message)
+
+    async def lobby_delta(self, event):
+        """Queue a room delta; only the latest delta per room is kept within a window"""
+        room_id = event['room']['id']
+        self.pending_deltas.pop(room_id, None)
+        self.pending_deltas[room_id] = {
+            'event': event['event'],
+            'room': event['room']
+        }
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_deltas())
+
+    async def flush_deltas(self):
+        """Send every delta collected during the coalescing window as one LOBBY_UPDATE"""
+        await asyncio.sleep(settings.LOBBY_COALESCE_WINDOW)
+        deltas = list(self.pending_deltas.values())
+        self.pending_deltas = {}
+        self.flush_task = None
+
+        await self.send(text_data=dumps_text({
+            'type': 'LOBBY_UPDATE',
+            'deltas': deltas
+        }))
+
+    @pooled_database_sync_to_async
+    def get_open_rooms(self):
+        """Get all open rooms for the lobby snapshot"""
+        rooms = Room.objects.filter(status='OPEN').select_related('creator', 'player1', 'player2')
+        return [serialize_room(room) for room in rooms]
@@ -0,0 +1,347 @@
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from apps.core.fastjson import dumps_text, loads
+from .models import Game, Guess
+from .serializers import serialize_game, TURN_DELTA_FIELDS
+from .services import GameService
+from .sequencer import get_turn_sequencer
+from .redis_client import get_redis
+
+_datetime_field = serializers.DateTimeField()
+
+
+class MemoryStateStore:
+    """Keeps live game states in the worker process"""
+
+    def __init__(self):
+        self._states = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def get(self, room_id):
+        raw = self._states.get(room_id)
+        return loads(raw) if raw is not None else None
+
+    def setdefault(self, room_id, state):
+        with self._lock:
+            raw = self._states.setdefault(room_id, dumps_text(state))
+        return loads(raw)
+
+    def update(self, room_id, func):
+        """Apply func to the stored state atomically and return its result"""
+        with self._lock:
+            state = loads(self._states[room_id])
+            result = func(state)
+            self._states[room_id] = dumps_text(state)
+        return result
+
+    def delete(self, room_id):
+        with self._lock:
+            self._states.pop(room_id, None)
+
+    def mark_dirty(self, room_id):
+        """Remember that room_id has turns to write behind"""
+        with self._lock:
+            self._dirty.add(room_id)
+
+    def take_dirty(self):
+        """Return and forget the rooms with turns to write behind"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+
+class RedisStateStore:
+    """Keeps live game states in Redis so every worker sees the same games"""
+
+    dirty_key = 'game_state:dirty'
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def _key(self, room_id):
+        return f'game_state:{room_id}'
+
+    def get(self, room_id):
+        raw = self.client.get(self._key(room_id))
+        return loads(raw) if raw is not None else None
+
+    def setdefault(self, room_id, state):
+        self.client.set(self._key(room_id), dumps_text(state), nx=True, ex=self.ttl)
+        return self.get(room_id)
+
+    def update(self, room_id, func):
+        """Apply func to the stored state atomically (WATCH/MULTI) and return its result"""
+        key = self._key(room_id)
+
+        def apply(pipe):
+            raw = pipe.get(key)
+            if raw is None:
+                raise KeyError(room_id)
+            state = loads(raw)
+            result = func(state)
+            pipe.multi()
+            pipe.set(key, dumps_text(state), ex=self.ttl)
+            return result
+
+        return self.client.transaction(apply, key, value_from_callable=True)
+
+    def delete(self, room_id):
+        self.client.delete(self._key(room_id))
+
+    def mark_dirty(self, room_id):
+        """Remember that room_id has turns to write behind, for any worker to flush"""
+        self.client.sadd(self.dirty_key, room_id)
+
+    def take_dirty(self):
+        """Return and forget the rooms with turns to write behind"""
+        pipe = self.client.pipeline()
+        pipe.smembers(self.dirty_key)
+        pipe.delete(self.dirty_key)
+        members, _ = pipe.execute()
+        return {int(room_id) for room_id in members}
+
+
+class GameStateEngine:
+    """
+    Authoritative live state for in-progress games
+    - Turns are validated and applied against the stored state, no SQL involved
+    - Guess rows and the final settlement are written behind by flush(), which
+      a background thread runs for every room with new turns each
+      GAME_STATE_FLUSH_INTERVAL seconds; a failed flush is retried
+    """
+
+    def __init__(self, store, flush_interval):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    @staticmethod
+    def build_state(game):
+        """Build the live state of a game from its database rows"""
+        room = game.room
+        low, high = 1, 100
+        for guess in game.guesses.all():
+            if guess.feedback == 'UP':
+                low = max(low, guess.guess_number + 1)
+            elif guess.feedback == 'DOWN':
+                high = min(high, guess.guess_number - 1)
+
+        return {
+            'game_id': game.id,
+            'room_id': room.id,
+            'secret_number': game.secret_number,
+            'player1_id': room.player1_id,
+            'player2_id': room.player2_id,
+            'emails': {
+                str(room.player1_id): room.player1.email,
+                str(room.player2_id): room.player2.email,
+            },
+            'current_turn_id': game.current_turn_id,
+            'status': game.status,
+            'winner_id': game.winner_id,
+            'low': low,
+            'high': high,
+            'game': serialize_game(game),
+            'pending': [],
+        }
+
+    def load(self, room_id):
+        """
+        Get the live state of a room's game, seeding it from the database if needed
+        - A game already settled is built from the database but not stored:
+          nothing would flush, and so delete, its state again
+        Raises Game.DoesNotExist when the room has no game yet
+        """
+        state = self.store.get(room_id)
+        if state is not None:
+            return state
+
+        game = Game.objects.with_details().get(room_id=room_id)
+        state = self.build_state(game)
+        if state['status'] == 'COMPLETED':
+            return state
+        return self.store.setdefault(room_id, state)
+
+    def make_guess(self, room_id, player_id, guess_number):
+        """
+        Process a player's guess against the live state
+        Returns the serialized guess, the serialized game, the turn delta
+        and whether the game is over
+        """
+        if self.load(room_id)['status'] != 'IN_PROGRESS':
+            raise ValueError("Game is not in progress")
+
+        def apply(state):
+            if state['status'] != 'IN_PROGRESS':
+                raise ValueError("Game is not in progress")
+
+            if state['current_turn_id'] != player_id:
+                raise ValueError("It's not your turn")
+
+            if guess_number < 1 or guess_number > 100:
+                raise ValueError("Guess must be between 1 and 100")
+
+            feedback = GameService.get_feedback(state['secret_number'], guess_number)
+            now = _datetime_field.to_representation(timezone.now())
+            game = state['game']
+            player_email = state['emails'][str(player_id)]
+
+            # Guess ids are assigned when the pending rows are flushed
+            guess = {
+                'id': None,
+                'game': state['game_id'],
+                'player': player_id,
+                'player_email': player_email,
+                'guess_number': guess_number,
+                'feedback': feedback,
+                'created_at': now,
+            }
+            game['guesses'].append(guess)
+            state['pending'].append({
+                'player_id': player_id,
+                'guess_number': guess_number,
+                'feedback': feedback,
+            })
+
+            if feedback == 'CORRECT':
+                state['status'] = 'COMPLETED'
+                state['winner_id'] = player_id
+                game.update(status='COMPLETED', winner=player_id, winner_email=player_email, ended_at=now)
+            else:
+                if feedback == 'UP':
+                    state['low'] = max(state['low'], guess_number + 1)
+                else:
+                    state['high'] = min(state['high'], guess_number - 1)
+
+                # Switch turn
+                if player_id == state['player1_id']:
+                    next_player = state['player2_id']
+                else:
+                    next_player = state['player1_id']
+                state['current_turn_id'] = next_player
+                game.update(current_turn=next_player, current_turn_email=state['emails'][str(next_player)])
+
+            delta = {'version': len(game['guesses']), 'guess': guess}
+            delta.update((field, game[field]) for field in TURN_DELTA_FIELDS)
+
+            return {
+                'guess': guess,
+                'game': game,
+                'delta': delta,
+                'is_game_over': state['status'] == 'COMPLETED',
+            }
+
+        result = self.store.update(room_id, apply)
+        self.store.mark_dirty(room_id)
+        return result
+
+    def start_flusher(self):
+        """Start the write-behind thread of this worker, once"""
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self.run_flusher, name='game-state-flusher', daemon=True)
+                self._flusher.start()
+
+    def run_flusher(self):
+        """Flush dirty rooms forever, off the request path"""
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush_dirty()
+            finally:
+                close_old_connections()
+
+    def flush_dirty(self):
+        """Flush every room with new turns; a room whose flush fails stays dirty"""
+        for room_id in self.store.take_dirty():
+            try:
+                self.flush(room_id)
+            except Exception:
+                self.store.mark_dirty(room_id)
+
+    def flush(self, room_id):
+        """
+        Persist pending guesses and, once the game is over, settle it
+        - Runs under the room's turn lease, so the flushes of a room are
+          written one after the other, in turn order
+        - Pending guesses are put back if the database write fails
+        """
+        with get_turn_sequencer().hold(room_id):
+            self._flush(room_id)
+
+    def _flush(self, room_id):
+        def take_pending(state):
+            pending = state['pending']
+            state['pending'] = []
+            return pending, dict(state)
+
+        try:
+            pending, state = self.store.update(room_id, take_pending)
+        except KeyError:
+            return
+
+        if not pending and state['status'] != 'COMPLETED':
+            return
+
+        try:
+            with transaction.atomic():
+                Guess.objects.bulk_create([
+                    Guess(
+                        game_id=state['game_id'],
+                        player_id=item['player_id'],
+                        guess_number=item['guess_number'],
+                        feedback=item['feedback']
+                    )
+                    for item in pending
+                ])
+
+                if state['status'] == 'COMPLETED':
+                    game = Game.objects.select_for_update(of=('self',)).select_related(
+                        'room__player1', 'room__player2'
+                    ).get(pk=state['game_id'])
+                    if game.status != 'COMPLETED':
+                        room = game.room
+                        winner = room.player1 if state['winner_id'] == room.player1_id else room.player2
+                        game.current_turn_id = state['current_turn_id']
+                        GameService.end_game(game, winner)
+                else:
+                    Game.objects.filter(pk=state['game_id']).update(current_turn_id=state['current_turn_id'])
+        except Exception:
+            def requeue(current):
+                current['pending'][:0] = pending
+
+            self.store.update(room_id, requeue)
+            raise
+
+        if state['status'] == 'COMPLETED':
+            # The database is authoritative again once the game is settled
+            self.store.delete(room_id)
+
+
+_engine = None
+
+
+def get_game_engine():
+    """Return the configured live state engine, or None when the database is authoritative"""
+    global _engine
+    if settings.GAME_STATE_ENGINE == 'db':
+        return None
+
+    if _engine is None:
+        if settings.GAME_STATE_ENGINE == 'redis':
+            store = RedisStateStore(get_redis(), settings.GAME_STATE_TTL)
+        elif settings.GAME_STATE_ENGINE == 'memory':
+            store = MemoryStateStore()
+        else:
+            raise ValueError(f"Unknown GAME_STATE_ENGINE: {settings.GAME_STATE_ENGINE}")
+        _engine = GameStateEngine(store, settings.GAME_STATE_FLUSH_INTERVAL)
+        _engine.start_flusher()
+    return _engine
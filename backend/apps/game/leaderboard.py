@@ -0,0 +1,245 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from .redis_client import get_redis
+
+# Players are ranked by wins. Sorted set members are zero-padded user ids, so
+# equal scores, ordered by member, rank by user id (the higher id first)
+# rather than by the id as a string
+MEMBER_WIDTH = 19
+
+ALL_TIME = 'leaderboard:wins'
+
+# Calendar windows (UTC) kept as one bucket each, dropped once the window is over
+WINDOWS = ('day', 'week', 'month')
+
+
+def window_bounds(window, now):
+    """Return (bucket name, end of the bucket) of the window containing now"""
+    now = now.astimezone(dt_timezone.utc)
+    midnight = datetime(now.year, now.month, now.day, tzinfo=dt_timezone.utc)
+
+    if window == 'day':
+        return now.strftime('%Y-%m-%d'), midnight + timedelta(days=1)
+    if window == 'week':
+        year, week, weekday = now.isocalendar()
+        return f'{year}-W{week:02d}', midnight + timedelta(days=8 - weekday)
+    if window == 'month':
+        if now.month == 12:
+            end = datetime(now.year + 1, 1, 1, tzinfo=dt_timezone.utc)
+        else:
+            end = datetime(now.year, now.month + 1, 1, tzinfo=dt_timezone.utc)
+        return now.strftime('%Y-%m'), end
+    raise ValueError(f"Unknown leaderboard window: {window}")
+
+
+def window_key(window, now):
+    """Sorted set key of the window bucket containing now"""
+    bucket, _ = window_bounds(window, now)
+    return f'{ALL_TIME}:{window}:{bucket}'
+
+
+def member(user_id):
+    """Sorted set member of a user id"""
+    return f'{user_id:0{MEMBER_WIDTH}d}'
+
+
+def games_key(key):
+    """Hash key counting games played per player for a window bucket"""
+    return key.replace(':wins', ':games', 1)
+
+
+class _Ranking:
+    """Scores kept as a sorted list, ordered like a Redis sorted set"""
+
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        self.ranked = sorted(self._entry(user_id, score) for user_id, score in self.scores.items())
+
+    @staticmethod
+    def _entry(user_id, score):
+        return (score, member(user_id))
+
+    def set(self, user_id, score):
+        previous = self.scores.get(user_id)
+        if previous is not None:
+            del self.ranked[bisect.bisect_left(self.ranked, self._entry(user_id, previous))]
+        self.scores[user_id] = score
+        bisect.insort(self.ranked, self._entry(user_id, score))
+
+    def rank(self, user_id):
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return len(self.ranked) - 1 - bisect.bisect_left(self.ranked, self._entry(user_id, score))
+
+    def range(self, start, stop):
+        size = len(self.ranked)
+        entries = self.ranked[max(size - 1 - stop, 0):max(size - start, 0)]
+        return [(int(user_id), score) for score, user_id in reversed(entries)]
+
+
+class MemoryLeaderboardStore:
+    """Rankings in the worker process"""
+
+    def __init__(self):
+        self._rankings = {}
+        self._games = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _ranking(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._rankings.pop(key, None)
+            self._games.pop(key, None)
+            self._expires.pop(key, None)
+        return self._rankings.setdefault(key, _Ranking())
+
+    def set_scores(self, scores, key=ALL_TIME):
+        """Set the score of every user_id in the {user_id: score} mapping, never lowering one"""
+        with self._lock:
+            ranking = self._ranking(key)
+            for user_id, score in scores.items():
+                previous = ranking.scores.get(user_id)
+                if previous is None or score > previous:
+                    ranking.set(user_id, score)
+
+    def record_game(self, key, winner_id, player_ids, expire_at):
+        """Count a game in a window bucket: a win for winner_id, a game for every player"""
+        with self._lock:
+            ranking = self._ranking(key)
+            games = self._games.setdefault(key, {})
+            for user_id in player_ids:
+                won = 1 if user_id == winner_id else 0
+                ranking.set(user_id, ranking.scores.get(user_id, 0) + won)
+                games[user_id] = games.get(user_id, 0) + 1
+            self._expires[key] = expire_at.timestamp()
+
+    def replace(self, batches):
+        """Replace the all-time leaderboard with the scores from an iterable of mappings"""
+        scores = {}
+        for batch in batches:
+            scores.update(batch)
+
+        ranking = _Ranking(scores)
+        with self._lock:
+            self._rankings[ALL_TIME] = ranking
+
+    def rank(self, user_id, key=ALL_TIME):
+        """0-based rank of user_id, or None when it is not ranked"""
+        with self._lock:
+            return self._ranking(key).rank(user_id)
+
+    def range(self, start, stop, key=ALL_TIME):
+        """[(user_id, score)] for ranks start..stop inclusive"""
+        with self._lock:
+            return self._ranking(key).range(start, stop)
+
+    def games(self, key, user_ids):
+        """{user_id: games played} within a window bucket"""
+        with self._lock:
+            self._ranking(key)
+            games = self._games.get(key, {})
+            return {user_id: games.get(user_id, 0) for user_id in user_ids}
+
+
+class RedisLeaderboardStore:
+    """Rankings in Redis sorted sets shared by every worker"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def members(scores):
+        """{member: score} of a {user_id: score} mapping"""
+        return {member(user_id): score for user_id, score in scores.items()}
+
+    def set_scores(self, scores, key=ALL_TIME):
+        """Set the score of every user_id in the {user_id: score} mapping, never lowering one"""
+        if scores:
+            self.client.zadd(key, self.members(scores), gt=True)
+
+    def record_game(self, key, winner_id, player_ids, expire_at):
+        """Count a game in a window bucket: a win for winner_id, a game for every player"""
+        games = games_key(key)
+        expire_at = int(expire_at.timestamp())
+
+        pipe = self.client.pipeline()
+        for user_id in player_ids:
+            pipe.zincrby(key, 1 if user_id == winner_id else 0, member(user_id))
+            pipe.hincrby(games, user_id, 1)
+        pipe.expireat(key, expire_at)
+        pipe.expireat(games, expire_at)
+        pipe.execute()
+
+    def replace(self, batches):
+        """
+        Replace the all-time leaderboard with the scores from an iterable of mappings
+        The new set is built under a temporary key and swapped in with RENAME
+        """
+        building = f'{ALL_TIME}:rebuild'
+        self.client.delete(building)
+        for batch in batches:
+            if batch:
+                self.client.zadd(building, self.members(batch))
+
+        if self.client.exists(building):
+            self.client.rename(building, ALL_TIME)
+        else:
+            self.client.delete(ALL_TIME)
+
+    def rank(self, user_id, key=ALL_TIME):
+        """0-based rank of user_id, or None when it is not ranked"""
+        return self.client.zrevrank(key, member(user_id))
+
+    def range(self, start, stop, key=ALL_TIME):
+        """[(user_id, score)] for ranks start..stop inclusive"""
+        entries = self.client.zrevrange(key, start, stop, withscores=True)
+        return [(int(user_id), int(score)) for user_id, score in entries]
+
+    def games(self, key, user_ids):
+        """{user_id: games played} within a window bucket"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        counts = self.client.hmget(games_key(key), user_ids)
+        return {user_id: int(count or 0) for user_id, count in zip(user_ids, counts)}
+
+
+_store = None
+
+
+def get_leaderboard_store():
+    """Return the configured leaderboard store"""
+    global _store
+    if _store is None:
+        if settings.LEADERBOARD_BACKEND == 'redis':
+            _store = RedisLeaderboardStore(get_redis())
+        elif settings.LEADERBOARD_BACKEND == 'memory':
+            _store = MemoryLeaderboardStore()
+        else:
+            raise ValueError(f"Unknown LEADERBOARD_BACKEND: {settings.LEADERBOARD_BACKEND}")
+    return _store
+
+
+def publish_result(scores, winner_id, ended_at):
+    """
+    Mirror a settled game into the leaderboards once the current transaction commits
+    - scores: {user_id: all-time wins} of the ranked players (role 'player')
+    - Totals only ever go up, so games settling concurrently can publish in
+      any order without leaving an older total behind
+    - The game is counted in the day, week and month buckets containing ended_at
+    A failed write is logged, not raised; rebuild_player_stats resyncs the all-time ranking
+    """
+    def send():
+        store = get_leaderboard_store()
+        store.set_scores(scores)
+        for window in WINDOWS:
+            _, expire_at = window_bounds(window, ended_at)
+            store.record_game(window_key(window, ended_at), winner_id, list(scores), expire_at)
+
+    transaction.on_commit(send, robust=True)
@@ -0,0 +1,17 @@
+from .models import GameEvent
+
+LOBBY_GROUP_NAME = 'lobby'
+
+
+def publish_room_event(event, room_data):
+    """
+    Queue a room delta for lobby subscribers in the current transaction
+    event is one of ROOM_CREATED, ROOM_FILLED, ROOM_COMPLETED
+    The outbox publisher sends all lobby deltas of a batch as one group message,
+    so the channel layer fans out once per tick instead of once per room event
+    """
+    GameEvent.objects.create(group=LOBBY_GROUP_NAME, message={
+        'type': 'lobby_delta',
+        'event': event,
+        'room': room_data
+    })
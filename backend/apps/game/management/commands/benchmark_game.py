@@ -0,0 +1,292 @@
+import asyncio
+import io
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from unittest import mock
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from apps.core.benchmarking import (
+    count_queries, run_concurrently, speedup, throughput, throwaway_database
+)
+from apps.core import fastjson
+from apps.core.money import Money
+from apps.core.parsers import ORJSONParser
+from apps.core.renderers import ORJSONRenderer
+from apps.game.models import Game, Guess, Room
+from apps.game.serializers import (
+    GameSerializer, GuessSerializer, RoomSerializer,
+    serialize_game, serialize_guess, serialize_room, serialize_turn_delta
+)
+from apps.game.services import GameService
+from apps.users.models import Transaction
+
+User = get_user_model()
+
+
+# Baselines: the wallet steps of a game as they were before WalletService
+
+
+def legacy_escrow_bets(room):
+    """escrow_bets with each player locked, checked and saved in seat order, then a ledger row each"""
+    for player_id in (room.player1_id, room.player2_id):
+        player = User.objects.select_for_update().get(pk=player_id)
+        if player.balance < room.bet_amount:
+            raise ValueError(f"Player {player.email} has insufficient balance")
+        player.balance = F('balance') - room.bet_amount
+        player.save(update_fields=['balance'])
+    for player_id in (room.player1_id, room.player2_id):
+        Transaction.objects.create(user_id=player_id, amount=room.bet_amount, type='bet')
+
+
+def legacy_settle_winnings(winner, winnings):
+    """settle_winnings with a locked read, a save and a ledger insert"""
+    winner_user = User.objects.select_for_update().get(pk=winner.pk)
+    winner_user.balance = F('balance') + winnings
+    winner_user.save(update_fields=['balance'])
+    Transaction.objects.create(user=winner, amount=winnings, type='win')
+
+
+def legacy_join(room_id, user):
+    """JoinRoomView before try_join: read the room, check it in Python, save the whole row"""
+    room = Room.objects.get(pk=room_id)
+    if room.status != 'OPEN' or room.is_full or user.pk == room.player1_id or user.balance < room.bet_amount:
+        return False
+    room.add_player(user)
+    return True
+
+
+def wallet_steps(legacy):
+    """Run GameService with the baseline wallet steps when legacy is set"""
+    if not legacy:
+        return nullcontext()
+    return mock.patch.multiple(
+        GameService, escrow_bets=legacy_escrow_bets, settle_winnings=legacy_settle_winnings
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the game hot paths against a throwaway database'
+    suites = ('escrow', 'join', 'serializers', 'json', 'async')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suites',
+            nargs='*',
+            help=f"Suites to run: {', '.join(self.suites)} (default: all)"
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32],
+            help='Numbers of concurrent connections to measure with'
+        )
+        parser.add_argument(
+            '--games',
+            type=int,
+            default=400,
+            help='Games per measurement'
+        )
+        parser.add_argument(
+            '--players',
+            type=int,
+            default=20,
+            help='Players the games are dealt between; fewer players means more contention'
+        )
+
+    def handle(self, *args, **options):
+        suites = options['suites'] or self.suites
+        unknown = set(suites) - set(self.suites)
+        if unknown:
+            raise CommandError(f"Unknown suites: {', '.join(sorted(unknown))}")
+        if options['games'] < 1 or options['players'] < 2 or min(options['workers']) < 1:
+            raise CommandError('--games and --workers must be positive, --players at least 2')
+
+        self.options = options
+        with throwaway_database():
+            for suite in suites:
+                getattr(self, f'bench_{suite}')()
+
+    def heading(self, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+
+    def row(self, label, result):
+        self.stdout.write(f'  {label:<34}{result}')
+
+    def create_players(self, count):
+        """Players rich enough to never run out during a benchmark"""
+        first = User.objects.count()
+        return User.objects.bulk_create([
+            User(email=f'bench{first + i}@example.com', age=20, balance=Money.parse('1000000.00'))
+            for i in range(count)
+        ])
+
+    def full_rooms(self, count):
+        """FULL rooms, each seating two random players of a small shared pool"""
+        players = self.create_players(self.options['players'])
+        rooms = []
+        for _ in range(count):
+            player1, player2 = random.sample(players, 2)
+            rooms.append(Room(
+                bet_amount=Money.parse('10.00'), status='FULL',
+                creator=player1, player1=player1, player2=player2
+            ))
+        return Room.objects.bulk_create(rooms)
+
+    def open_rooms(self, count):
+        """OPEN rooms, each hosted by its own player"""
+        hosts = self.create_players(count)
+        return Room.objects.bulk_create([
+            Room(bet_amount=Money.parse('10.00'), creator=host, player1=host)
+            for host in hosts
+        ])
+
+    def played_game(self, guesses):
+        """A game in progress with guesses alternating between its players, loaded for serializing"""
+        game = self.started_games(1)[0]
+        room = game.room
+        Guess.objects.bulk_create([
+            Guess(game=game, player=room.player1 if i % 2 else room.player2, guess_number=i % 100 + 1, feedback='UP')
+            for i in range(guesses)
+        ])
+        return Game.objects.with_details().get(pk=game.pk)
+
+    def started_games(self, count):
+        """Games in progress, with their room and players loaded"""
+        rooms = self.full_rooms(count)
+        for room in rooms:
+            GameService.start_game(room)
+        return list(Game.objects.select_related('room__player1', 'room__player2').filter(room__in=rooms))
+
+    def bench_escrow(self):
+        """Games started and settled per second, with players shared between concurrent games"""
+        self.heading(f"Escrow: {self.options['games']} games between {self.options['players']} players")
+        for label, legacy in (('row locks (before)', True), ('one statement', False)):
+            with wallet_steps(legacy):
+                game = self.started_games(1)[0]
+                # Both steps run inside the game's transaction
+                with transaction.atomic():
+                    started = count_queries(lambda: GameService.escrow_bets(game.room))
+                    settled = count_queries(lambda: GameService.settle_winnings(game.room.player1, game.room.bet_amount))
+                self.row(label, f'{started} queries to escrow, {settled} to settle')
+
+                for workers in self.options['workers']:
+                    rooms = self.full_rooms(self.options['games'])
+                    result = run_concurrently(GameService.start_game, rooms, workers)
+                    self.row(f'  start, {workers} workers', throughput(*result))
+
+                for workers in self.options['workers']:
+                    games = self.started_games(self.options['games'])
+                    result = run_concurrently(lambda game: GameService.end_game(game, game.room.player1), games, workers)
+                    self.row(f'  settle, {workers} workers', throughput(*result))
+
+    def bench_join(self):
+        """Joins per second and their latency, with several players racing for every seat"""
+        racers = 4
+        self.heading(f"Join: {self.options['games']} rooms, {racers} players racing for each seat")
+        for label, join in (('read, check, save (before)', legacy_join), ('conditional update', Room.try_join)):
+            for workers in self.options['workers']:
+                rooms = self.open_rooms(self.options['games'])
+                joiners = self.create_players(racers * len(rooms))
+                attempts = [(room.pk, joiner) for room, joiner in zip(rooms * racers, joiners)]
+                random.shuffle(attempts)
+
+                won = []
+
+                def attempt(args):
+                    if join(*args):
+                        won.append(args[0])
+
+                result = run_concurrently(attempt, attempts, workers)
+                self.row(f'{label}, {workers}x', f'{throughput(*result)}   {len(won) - len(set(won))} double-booked')
+
+    def bench_serializers(self):
+        """Per-message cost of the DRF serializers and their fast-path equivalents"""
+        game = self.played_game(20)
+        room = game.room
+        guess = game.guesses.all()[0]
+
+        self.heading('Serializers: DRF -> fast path, per message')
+        self.row('room', speedup(lambda: RoomSerializer(room).data, lambda: serialize_room(room)))
+        self.row('guess', speedup(lambda: GuessSerializer(guess).data, lambda: serialize_guess(guess)))
+        self.row('game, 20 guesses', speedup(lambda: GameSerializer(game).data, lambda: serialize_game(game)))
+        self.row('turn (full game -> delta)', speedup(
+            lambda: GameSerializer(game).data,
+            lambda: serialize_turn_delta(game, guess, 20)
+        ))
+
+    def bench_json(self):
+        """stdlib json against orjson, on list pages and WebSocket events"""
+        games = [self.played_game(6) for _ in range(50)]
+        rooms = RoomSerializer([game.room for game in games], many=True).data
+        games = GameSerializer(games, many=True).data
+        game = games[0]
+        event = {
+            'type': 'game_state',
+            'game': game,
+        }
+        turn = {
+            'type': 'turn_updated',
+            'delta': {'version': 6, 'guess': game['guesses'][-1], 'status': game['status']},
+        }
+        guess = json.dumps({'type': 'MAKE_GUESS', 'guess_number': 42})
+
+        self.heading('JSON: stdlib -> orjson')
+        for label, data in (('rooms page, 50 rows', rooms), ('games page, 50 rows', games)):
+            body = JSONRenderer().render(data)
+            self.row(f'render {label}', speedup(
+                lambda: JSONRenderer().render(data),
+                lambda: ORJSONRenderer().render(data)
+            ))
+            self.row(f'parse {label}', speedup(
+                lambda: JSONParser().parse(io.BytesIO(body)),
+                lambda: ORJSONParser().parse(io.BytesIO(body))
+            ))
+        self.row('encode game event', speedup(lambda: json.dumps(event), lambda: fastjson.dumps_text(event)))
+        self.row('encode turn event', speedup(lambda: json.dumps(turn), lambda: fastjson.dumps_text(turn)))
+        self.row('decode guess message', speedup(lambda: json.loads(guess), lambda: fastjson.loads(guess)))
+
+    def bench_async(self):
+        """Guesses per second of concurrent games, as the async API's thread pool grows"""
+        turns = 10
+        self.heading(f"Async: {self.options['games']} concurrent games, {turns} guesses each")
+        # database_sync_to_async runs every call on one thread, whatever the pool size
+        games = self.started_games(self.options['games'])
+        result = asyncio.run(self.play(games, turns, database_sync_to_async(GameService.play_turn), 1))
+        self.row('one shared thread (before)', throughput(*result))
+
+        for workers in self.options['workers']:
+            games = self.started_games(self.options['games'])
+            result = asyncio.run(self.play(games, turns, GameService.amake_guess, workers))
+            self.row(f'thread pool, {workers} connections', throughput(*result))
+
+    @staticmethod
+    async def play(games, turns, make_guess, workers):
+        """
+        Play turns wrong guesses in every game at once, like one socket per game
+        The loop's default executor, the async API's thread pool, gets workers threads
+        Returns (elapsed seconds, guess latencies, exceptions raised)
+        """
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=workers))
+        latencies = []
+
+        async def play_game(game):
+            room = game.room
+            for _ in range(turns):
+                player = room.player1 if game.current_turn_id == room.player1_id else room.player2
+                began = time.perf_counter()
+                await make_guess(game, player, game.secret_number % 100 + 1)
+                latencies.append(time.perf_counter() - began)
+
+        began = time.perf_counter()
+        results = await asyncio.gather(*(play_game(game) for game in games), return_exceptions=True)
+        elapsed = time.perf_counter() - began
+        return elapsed, latencies, [result for result in results if isinstance(result, Exception)]
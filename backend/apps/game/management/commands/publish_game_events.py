@@ -0,0 +1,40 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.game.outbox import publish_pending
+
+
+class Command(BaseCommand):
+    help = 'Publish committed game events from the outbox to the WebSocket groups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.OUTBOX_BATCH_SIZE,
+            help='Number of events claimed per batch'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox and exit instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['once']:
+            total = 0
+            while True:
+                published = publish_pending(batch_size)
+                total += published
+                if published < batch_size:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Published {total} events'))
+            return
+
+        self.stdout.write('Publishing game events...')
+        while True:
+            # Keep draining while full batches come back, poll once the outbox is empty
+            if publish_pending(batch_size) < batch_size:
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
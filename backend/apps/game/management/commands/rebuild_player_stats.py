@@ -0,0 +1,96 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from apps.core.money import Money
+from apps.game.models import Game, PlayerStats
+from apps.game.leaderboard import get_leaderboard_store
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild PlayerStats and the leaderboard from completed games'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of user ids aggregated per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write(self.style.WARNING('No users found'))
+            return
+
+        total = 0
+        for low in range(bounds['low'], bounds['high'] + 1, batch_size):
+            total += self.rebuild_range(low, low + batch_size)
+
+        get_leaderboard_store().replace(self.iter_scores(batch_size))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {total} players'))
+
+    def rebuild_range(self, low, high):
+        """Recompute the stats of users with low <= id < high with GROUP BY queries"""
+        completed = Game.objects.filter(status='COMPLETED')
+        totals = defaultdict(lambda: {'wins': 0, 'games_played': 0, 'won': Money(0), 'wagered': Money(0)})
+
+        for seat in ('room__player1_id', 'room__player2_id'):
+            rows = completed.filter(**{f'{seat}__gte': low, f'{seat}__lt': high}).values(seat).annotate(
+                games=Count('id'),
+                wagered=Sum('room__bet_amount')
+            )
+            for row in rows:
+                totals[row[seat]]['games_played'] += row['games']
+                totals[row[seat]]['wagered'] += row['wagered']
+
+        wins = completed.filter(winner_id__gte=low, winner_id__lt=high).values('winner_id').annotate(
+            wins=Count('id'),
+            won=Sum('room__bet_amount')
+        )
+        for row in wins:
+            totals[row['winner_id']]['wins'] += row['wins']
+            totals[row['winner_id']]['won'] += row['won']
+
+        # Each game nets +bet to its winner and -bet to its loser
+        stats = [
+            PlayerStats(
+                user_id=user_id,
+                wins=values['wins'],
+                games_played=values['games_played'],
+                total_wagered=values['wagered'],
+                net=2 * values['won'] - values['wagered']
+            )
+            for user_id, values in totals.items()
+        ]
+
+        with transaction.atomic():
+            PlayerStats.objects.filter(user_id__gte=low, user_id__lt=high).exclude(
+                user_id__in=list(totals)
+            ).delete()
+            PlayerStats.objects.bulk_create(
+                stats,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['wins', 'games_played', 'total_wagered', 'net', 'updated_at']
+            )
+
+        return len(stats)
+
+    def iter_scores(self, batch_size):
+        """Yield {user_id: wins} mappings of at most batch_size ranked players"""
+        batch = {}
+        ranked = PlayerStats.objects.filter(user__role='player').values_list('user_id', 'wins')
+        for user_id, wins in ranked.iterator(chunk_size=batch_size):
+            batch[user_id] = wins
+            if len(batch) >= batch_size:
+                yield batch
+                batch = {}
+        if batch:
+            yield batch
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from .models import Room
+from .serializers import RoomSerializer
+from .redis_client import get_redis
+
+User = get_user_model()
+
+
+def matchmaking_group_name(user_id):
+    """Channel layer group a player's matchmaking socket listens on"""
+    return f'matchmaking_user_{user_id}'
+
+
+class MemoryMatchmakingQueue:
+    """Per-bet FIFO queues in the worker process"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._buckets = defaultdict(OrderedDict)
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def pair_or_enqueue(self, user_id, bet_key):
+        """
+        Pop the longest waiting opponent for bet_key, or queue user_id and return None
+        Entries older than ttl seconds are dropped; queueing again refreshes an entry
+        """
+        now = time.time()
+        with self._lock:
+            previous = self._queued.get(user_id)
+            if previous is not None and previous != bet_key:
+                self._buckets[previous].pop(user_id, None)
+
+            # Buckets are in enqueue order, so stale entries are at the front
+            bucket = self._buckets[bet_key]
+            while bucket:
+                waiting_id, enqueued_at = next(iter(bucket.items()))
+                if enqueued_at > now - self.ttl:
+                    break
+                del bucket[waiting_id]
+                self._queued.pop(waiting_id, None)
+
+            for opponent_id in bucket:
+                if opponent_id != user_id:
+                    del bucket[opponent_id]
+                    self._queued.pop(opponent_id, None)
+                    self._queued.pop(user_id, None)
+                    bucket.pop(user_id, None)
+                    return opponent_id
+
+            bucket.pop(user_id, None)
+            bucket[user_id] = now
+            self._queued[user_id] = bet_key
+            return None
+
+    def leave(self, user_id):
+        """Remove user_id from whichever queue it waits in"""
+        with self._lock:
+            previous = self._queued.pop(user_id, None)
+            if previous is not None:
+                self._buckets[previous].pop(user_id, None)
+            return previous
+
+
+class RedisMatchmakingQueue:
+    """
+    Per-bet queues shared by every worker
+    Each bucket is a sorted set scored by enqueue time, so pairing and
+    leaving are O(log n); a hash records which bucket a player waits in.
+    Entries older than ttl seconds are dropped; queueing again refreshes an entry
+    """
+
+    PAIR_OR_ENQUEUE = """
+    local queued = KEYS[1]
+    local prefix = ARGV[4]
+    local bucket = prefix .. ARGV[2]
+    local previous = redis.call('HGET', queued, ARGV[1])
+    if previous and previous ~= ARGV[2] then
+        redis.call('ZREM', prefix .. previous, ARGV[1])
+    end
+    local stale = redis.call('ZRANGEBYSCORE', bucket, '-inf', ARGV[5])
+    for _, waiting in ipairs(stale) do
+        redis.call('HDEL', queued, waiting)
+    end
+    redis.call('ZREMRANGEBYSCORE', bucket, '-inf', ARGV[5])
+    local waiting = redis.call('ZRANGE', bucket, 0, 1)
+    for _, opponent in ipairs(waiting) do
+        if opponent ~= ARGV[1] then
+            redis.call('ZREM', bucket, opponent, ARGV[1])
+            redis.call('HDEL', queued, opponent, ARGV[1])
+            return opponent
+        end
+    end
+    redis.call('ZADD', bucket, ARGV[3], ARGV[1])
+    redis.call('HSET', queued, ARGV[1], ARGV[2])
+    return false
+    """
+
+    LEAVE = """
+    local previous = redis.call('HGET', KEYS[1], ARGV[1])
+    if previous then
+        redis.call('ZREM', ARGV[2] .. previous, ARGV[1])
+        redis.call('HDEL', KEYS[1], ARGV[1])
+    end
+    return previous
+    """
+
+    queued_key = 'matchmaking:queued'
+    bucket_prefix = 'matchmaking:bucket:'
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self._pair_or_enqueue = client.register_script(self.PAIR_OR_ENQUEUE)
+        self._leave = client.register_script(self.LEAVE)
+
+    def pair_or_enqueue(self, user_id, bet_key):
+        """Pop the longest waiting opponent for bet_key, or queue user_id and return None"""
+        now = time.time()
+        opponent_id = self._pair_or_enqueue(
+            keys=[self.queued_key],
+            args=[user_id, bet_key, now, self.bucket_prefix, now - self.ttl]
+        )
+        return int(opponent_id) if opponent_id else None
+
+    def leave(self, user_id):
+        """Remove user_id from whichever queue it waits in"""
+        return self._leave(keys=[self.queued_key], args=[user_id, self.bucket_prefix])
+
+
+_queue = None
+
+
+def get_matchmaking_queue():
+    """Return the configured matchmaking queue"""
+    global _queue
+    if _queue is None:
+        if settings.MATCHMAKING_BACKEND == 'redis':
+            _queue = RedisMatchmakingQueue(get_redis(), settings.MATCHMAKING_QUEUE_TTL)
+        elif settings.MATCHMAKING_BACKEND == 'memory':
+            _queue = MemoryMatchmakingQueue(settings.MATCHMAKING_QUEUE_TTL)
+        else:
+            raise ValueError(f"Unknown MATCHMAKING_BACKEND: {settings.MATCHMAKING_BACKEND}")
+    return _queue
+
+
+class MatchmakingService:
+    """Pairs players who want to play for the same bet"""
+
+    @staticmethod
+    def find_match(user, bet_amount):
+        """
+        Pair user with a waiting opponent for the same bet amount
+        - Returns the new FULL room with both players seated
+        - Returns None when user has been queued to wait for an opponent
+        - Waiting opponents who can no longer cover the bet are dropped from the queue
+        user's own balance is checked by CreateRoomSerializer
+        """
+        bet_key = f'{bet_amount:.2f}'
+        queue = get_matchmaking_queue()
+        while True:
+            opponent_id = queue.pair_or_enqueue(user.pk, bet_key)
+            if opponent_id is None:
+                return None
+            # The balance may have been spent while waiting; escrow would then fail
+            if User.objects.filter(pk=opponent_id, is_active=True, balance__gte=bet_amount).exists():
+                break
+
+        with transaction.atomic():
+            room = Room.objects.create(
+                bet_amount=bet_amount,
+                status='FULL',
+                creator_id=opponent_id,
+                player1_id=opponent_id,
+                player2=user
+            )
+            room = Room.objects.with_players().get(pk=room.pk)
+            room_data = RoomSerializer(room).data
+            transaction.on_commit(
+                lambda: MatchmakingService.notify_match(room_data, [opponent_id, user.pk])
+            )
+
+        return room
+
+    @staticmethod
+    def cancel(user):
+        """Take user out of the matchmaking queue"""
+        return get_matchmaking_queue().leave(user.pk) is not None
+
+    @staticmethod
+    def notify_match(room_data, user_ids):
+        """Tell both players' matchmaking sockets which room they were seated in"""
+        channel_layer = get_channel_layer()
+        for user_id in user_ids:
+            async_to_sync(channel_layer.group_send)(
+                matchmaking_group_name(user_id),
+                {
+                    'type': 'match_found',
+                    'room': room_data
+                }
+            )
@@ -1,25 +1,43 @@
-from channels.db import database_sync_to_async
+from apps.core.db import pooled_database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
 from urllib.parse import parse_qs
+from apps.users.authentication import ClaimsUser, ROLE_CLAIM, ais_revoked
 
 User = get_user_model()
 
 
-@database_sync_to_async
-def get_user_from_token(token_string):
-    """Get user from JWT token"""
+@pooled_database_sync_to_async
+def load_user(user_id):
+    """Load the user row for tokens issued without claims"""
+    try:
+        return User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return AnonymousUser()
+
+
+async def get_user_from_token(token_string):
+    """
+    Get user from JWT token
+    Tokens carrying claims are trusted without touching the users table
+    """
     try:
         access_token = AccessToken(token_string)
         user_id = access_token['user_id']
-        user = User.objects.get(id=user_id)
-        return user
-    except (TokenError, User.DoesNotExist):
+    except (TokenError, KeyError):
+        return AnonymousUser()
+
+    if await ais_revoked(access_token):
         return AnonymousUser()
 
+    if ROLE_CLAIM in access_token:
+        return ClaimsUser(access_token)
+
+    return await load_user(user_id)
+
 
 class JWTAuthMiddleware(BaseMiddleware):
     """
@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-18 08:48
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without locking the tables against writes
+    atomic = False
+
+    dependencies = [
+        ('game', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='game',
+            index=models.Index(fields=['-started_at', '-id'], name='games_started_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='game',
+            index=models.Index(fields=['status', '-started_at', '-id'], name='games_status_started_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='guess',
+            index=models.Index(fields=['game', 'created_at'], name='guesses_game_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='room',
+            index=models.Index(fields=['-created_at', '-id'], name='rooms_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='room',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='rooms_status_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='room',
+            index=models.Index(condition=models.Q(('status', 'OPEN')), fields=['-created_at', '-id'], name='rooms_open_created_idx'),
+        ),
+    ]
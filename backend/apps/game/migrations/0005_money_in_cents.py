@@ -0,0 +1,68 @@
+# Generated by Django 5.0 on 2026-10-18 09:16
+
+import apps.core.money
+import django.core.validators
+from django.db import migrations
+
+
+def to_cents(table, column, precision):
+    """Rewrite a numeric(precision, 2) money column as bigint cents, and back"""
+    return migrations.RunSQL(
+        sql=f'ALTER TABLE "{table}" ALTER COLUMN "{column}" TYPE bigint USING round("{column}" * 100)::bigint',
+        reverse_sql=(
+            f'ALTER TABLE "{table}" ALTER COLUMN "{column}" '
+            f'TYPE numeric({precision}, 2) USING "{column}" / 100.0'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_game_events'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                to_cents('bet_settings', 'min_bet', 10),
+                to_cents('bet_settings', 'max_bet', 10),
+                to_cents('bet_settings', 'step', 10),
+                to_cents('player_stats', 'total_wagered', 14),
+                to_cents('player_stats', 'net', 14),
+                to_cents('rooms', 'bet_amount', 10),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='betsettings',
+                    name='max_bet',
+                    field=apps.core.money.MoneyField(default=apps.core.money.Money(100000), validators=[django.core.validators.MinValueValidator(apps.core.money.Money(1))]),
+                ),
+                migrations.AlterField(
+                    model_name='betsettings',
+                    name='min_bet',
+                    field=apps.core.money.MoneyField(default=apps.core.money.Money(1000), validators=[django.core.validators.MinValueValidator(apps.core.money.Money(1))]),
+                ),
+                migrations.AlterField(
+                    model_name='betsettings',
+                    name='step',
+                    field=apps.core.money.MoneyField(default=apps.core.money.Money(500), validators=[django.core.validators.MinValueValidator(apps.core.money.Money(1))]),
+                ),
+                migrations.AlterField(
+                    model_name='playerstats',
+                    name='net',
+                    field=apps.core.money.MoneyField(default=apps.core.money.Money(0)),
+                ),
+                migrations.AlterField(
+                    model_name='playerstats',
+                    name='total_wagered',
+                    field=apps.core.money.MoneyField(default=apps.core.money.Money(0)),
+                ),
+                migrations.AlterField(
+                    model_name='room',
+                    name='bet_amount',
+                    field=apps.core.money.MoneyField(),
+                ),
+            ],
+        ),
+    ]
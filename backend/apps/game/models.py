@@ -1,28 +1,29 @@
-from django.db import models
+import threading
+import time
+import redis
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from apps.core.money import Money, MoneyField
+from .redis_client import get_redis
 
 
 class BetSettings(models.Model):
     """Singleton model for bet configuration"""
-    min_bet = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
-        default=10.00,
-        validators=[MinValueValidator(0.01)]
+    min_bet = MoneyField(
+        default=Money.parse('10.00'),
+        validators=[MinValueValidator(Money(1))]
     )
-    max_bet = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
-        default=1000.00,
-        validators=[MinValueValidator(0.01)]
+    max_bet = MoneyField(
+        default=Money.parse('1000.00'),
+        validators=[MinValueValidator(Money(1))]
     )
-    step = models.DecimalField(
-        max_digits=10,
-        decimal_places=2,
-        default=5.00,
-        validators=[MinValueValidator(0.01)]
+    step = MoneyField(
+        default=Money.parse('5.00'),
+        validators=[MinValueValidator(Money(1))]
     )
 
     class Meta:
@@ -48,6 +49,7 @@ class BetSettings(models.Model):
 
         self.pk = 1
         super().save(*args, **kwargs)
+        bet_settings_cache.invalidate()
 
     def delete(self, *args, **kwargs):
         # Prevent deletion
@@ -59,6 +61,74 @@ class BetSettings(models.Model):
         obj, created = cls.objects.get_or_create(pk=1)
         return obj
 
+    @classmethod
+    def get_cached(cls):
+        """Read-only singleton from the process-local cache; use get_settings() to modify it"""
+        return bet_settings_cache.get()
+
+
+class BetSettingsCache:
+    """
+    Process-local copy of the BetSettings row
+    - A version counter in Redis is compared at most every
+      BET_SETTINGS_CHECK_INTERVAL seconds; the row is reloaded when it moved
+    - Saving BetSettings bumps the counter once the transaction commits
+    """
+    version_key = 'bet_settings:version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._instance = None
+        self._version = None
+        self._checked_at = 0
+
+    def _remote_version(self):
+        """Current version counter, or None when Redis cannot be reached"""
+        try:
+            return get_redis().get(self.version_key) or '0'
+        except redis.RedisError:
+            return None
+
+    def get(self):
+        now = time.monotonic()
+        instance = self._instance
+        if instance is not None and now - self._checked_at < settings.BET_SETTINGS_CHECK_INTERVAL:
+            return instance
+
+        version = self._remote_version()
+        # Without Redis the row is simply reloaded once per interval
+        if instance is None or version is None or version != self._version:
+            instance = BetSettings.get_settings()
+
+        with self._lock:
+            self._instance = instance
+            self._version = version
+            self._checked_at = now
+        return instance
+
+    def invalidate(self):
+        """Drop this worker's copy now and every other worker's after commit"""
+        def bump():
+            get_redis().incr(self.version_key)
+            self.clear()
+
+        self.clear()
+        transaction.on_commit(bump, robust=True)
+
+    def clear(self):
+        with self._lock:
+            self._instance = None
+            self._version = None
+
+
+bet_settings_cache = BetSettingsCache()
+
+
+class RoomQuerySet(models.QuerySet):
+    def with_players(self):
+        """Load the users RoomSerializer touches in the same query"""
+        return self.select_related('creator', 'player1', 'player2')
+
 
 class Room(models.Model):
     STATUS_CHOICES = [
@@ -67,7 +137,7 @@ class Room(models.Model):
         ('COMPLETED', 'Completed'),
     ]
 
-    bet_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    bet_amount = MoneyField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='OPEN')
     creator = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -91,9 +161,21 @@ class Room(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RoomQuerySet.as_manager()
+
     class Meta:
         db_table = 'rooms'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='rooms_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='rooms_status_created_idx'),
+            # The lobby only ever lists open rooms
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status='OPEN'),
+                name='rooms_open_created_idx'
+            ),
+        ]
         verbose_name = 'Room'
         verbose_name_plural = 'Rooms'
 
@@ -103,9 +185,9 @@ class Room(models.Model):
     @property
     def players_count(self):
         count = 0
-        if self.player1:
+        if self.player1_id:
             count += 1
-        if self.player2:
+        if self.player2_id:
             count += 1
         return count
 
@@ -115,9 +197,9 @@ class Room(models.Model):
 
     def add_player(self, user):
         """Add a player to the room"""
-        if self.player1 is None:
+        if self.player1_id is None:
             self.player1 = user
-        elif self.player2 is None:
+        elif self.player2_id is None:
             self.player2 = user
         else:
             raise ValueError("Room is already full")
@@ -126,6 +208,36 @@ class Room(models.Model):
             self.status = 'FULL'
         self.save()
 
+    @classmethod
+    def try_join(cls, room_id, user):
+        """
+        Seat user as player2 with a single conditional UPDATE
+        Returns True if this call won the seat
+        """
+        joined = cls.objects.filter(
+            pk=room_id,
+            status='OPEN',
+            player2__isnull=True,
+            bet_amount__lte=user.balance
+        ).exclude(
+            player1_id=user.pk
+        ).update(
+            player2_id=user.pk,
+            status='FULL',
+            updated_at=timezone.now()
+        )
+        return joined == 1
+
+
+class GameQuerySet(models.QuerySet):
+    def with_details(self):
+        """Load everything GameSerializer touches in a fixed number of queries"""
+        return self.select_related(
+            'room__player1', 'room__player2', 'current_turn', 'winner'
+        ).prefetch_related(
+            models.Prefetch('guesses', queryset=Guess.objects.select_related('player'))
+        )
+
 
 class Game(models.Model):
     STATUS_CHOICES = [
@@ -154,9 +266,15 @@ class Game(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     ended_at = models.DateTimeField(null=True, blank=True)
 
+    objects = GameQuerySet.as_manager()
+
     class Meta:
         db_table = 'games'
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['-started_at', '-id'], name='games_started_idx'),
+            models.Index(fields=['status', '-started_at', '-id'], name='games_status_started_idx'),
+        ]
         verbose_name = 'Game'
         verbose_name_plural = 'Games'
 
@@ -186,8 +304,55 @@ class Guess(models.Model):
     class Meta:
         db_table = 'guesses'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['game', 'created_at'], name='guesses_game_created_idx'),
+        ]
         verbose_name = 'Guess'
         verbose_name_plural = 'Guesses'
 
     def __str__(self):
         return f"Guess {self.id} - {self.player.email} - {self.guess_number} ({self.feedback})"
+
+
+class PlayerStats(models.Model):
+    """
+    Running totals per player, updated when a game is settled
+    Source of the leaderboard; rebuild with `manage.py rebuild_player_stats`
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    wins = models.PositiveIntegerField(default=0)
+    games_played = models.PositiveIntegerField(default=0)
+    total_wagered = MoneyField(default=Money(0))
+    net = MoneyField(default=Money(0))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'player_stats'
+        verbose_name = 'Player Stats'
+        verbose_name_plural = 'Player Stats'
+
+    def __str__(self):
+        return f"Stats {self.user_id} - {self.wins}/{self.games_played}"
+
+
+class GameEvent(models.Model):
+    """
+    Transactional outbox of game broadcasts
+    Written in the same transaction as the state change it announces and
+    drained into the channel layer by `manage.py publish_game_events`
+    """
+    group = models.CharField(max_length=100)
+    message = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'game_events'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Event {self.id} - {self.group} - {self.message.get('type')}"
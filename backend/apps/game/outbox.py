@@ -0,0 +1,107 @@
+import asyncio
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection
+from .models import GameEvent
+
+# Session advisory locks, one per channel group, keyed (hashtext(table), hashtext(group)).
+# They outlive transactions, so sends run without row locks, and they are
+# released with the connection if a publisher dies
+_CLAIM_GROUPS_SQL = """
+    SELECT "group" FROM (
+        SELECT "group", MIN(id) AS first_id FROM {events}
+        GROUP BY "group"
+        ORDER BY first_id
+        LIMIT %(limit)s
+    ) pending
+    WHERE pg_try_advisory_lock(hashtext(%(namespace)s), hashtext("group"))
+"""
+
+_RELEASE_GROUPS_SQL = """
+    SELECT pg_advisory_unlock(hashtext(%(namespace)s), hashtext(claimed))
+    FROM unnest(%(groups)s::text[]) AS claimed
+"""
+
+
+def game_group_name(room_id):
+    """Channel layer group of the sockets watching a room's game"""
+    return f'game_room_{room_id}'
+
+
+def enqueue(room_id, message):
+    """
+    Queue a message for a room's sockets in the current transaction
+    It is only published if the transaction commits
+    """
+    GameEvent.objects.create(group=game_group_name(room_id), message=message)
+
+
+def broadcast(room_id, message):
+    """
+    Send a message to a room's sockets right away
+    Only for state that does not live in the database, i.e. engine turns
+    """
+    async_to_sync(get_channel_layer().group_send)(game_group_name(room_id), message)
+
+
+async def send_batches(batches):
+    """Send one outbox_batch per group, every group at once"""
+    channel_layer = get_channel_layer()
+    await asyncio.gather(*(
+        channel_layer.group_send(group, {
+            'type': 'outbox_batch',
+            'events': events
+        })
+        for group, events in batches.items()
+    ))
+
+
+def claim_groups(limit):
+    """
+    Take the advisory lock of up to limit groups with pending events, oldest first
+    Groups locked by another publisher are skipped
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_CLAIM_GROUPS_SQL.format(events=connection.ops.quote_name(GameEvent._meta.db_table)), {
+            'namespace': GameEvent._meta.db_table,
+            'limit': limit,
+        })
+        return [group for group, in cursor.fetchall()]
+
+
+def release_groups(groups):
+    """Release the advisory locks taken by claim_groups"""
+    with connection.cursor() as cursor:
+        cursor.execute(_RELEASE_GROUPS_SQL, {
+            'namespace': GameEvent._meta.db_table,
+            'groups': groups,
+        })
+
+
+def publish_pending(batch_size):
+    """
+    Publish up to batch_size committed events, oldest first
+    - A publisher holds a group's advisory lock while it sends, so with several
+      publishers each group (a room, the lobby) is still sent in order by one of them
+    - Events are grouped per channel group and sent as one message each
+    - No transaction is open during the sends; rows are deleted afterwards,
+      a failed send leaves them for the next run
+    Returns the number of events published
+    """
+    groups = claim_groups(batch_size)
+    if not groups:
+        return 0
+
+    try:
+        events = list(GameEvent.objects.filter(group__in=groups).order_by('id')[:batch_size])
+
+        batches = {}
+        for event in events:
+            batches.setdefault(event.group, []).append(event.message)
+
+        async_to_sync(send_batches)(batches)
+        GameEvent.objects.filter(id__in=[event.id for event in events]).delete()
+    finally:
+        release_groups(groups)
+
+    return len(events)
@@ -1,6 +1,8 @@
 from django.urls import re_path
-from .consumers import GameConsumer
+from .consumers import GameConsumer, MatchmakingConsumer, LobbyConsumer
 
 websocket_urlpatterns = [
     re_path(r'ws/game/(?P<room_id>\d+)/$', GameConsumer.as_asgi()),
+    re_path(r'ws/matchmaking/$', MatchmakingConsumer.as_asgi()),
+    re_path(r'ws/lobby/$', LobbyConsumer.as_asgi()),
 ]
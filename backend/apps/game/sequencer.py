@@ -0,0 +1,82 @@
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from redis.exceptions import LockError
+from .redis_client import get_redis
+
+BUSY_MESSAGE = "Another guess is being processed, try again"
+
+
+class MemoryTurnSequencer:
+    """One lock per room in the worker process"""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, room_id):
+        """Run the block while no other turn of room_id is being processed"""
+        with self._lock:
+            entry = self._locks.setdefault(room_id, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            if not entry[0].acquire(timeout=settings.TURN_LEASE_WAIT):
+                raise ValueError(BUSY_MESSAGE)
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[room_id]
+
+
+class RedisTurnSequencer:
+    """
+    A Redis lease per room shared by every worker
+    The lease expires after TURN_LEASE_TIMEOUT seconds so a crashed worker
+    cannot block a game
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @contextmanager
+    def hold(self, room_id):
+        """Run the block while no other turn of room_id is being processed"""
+        lease = self.client.lock(
+            f'turn_lease:{room_id}',
+            timeout=settings.TURN_LEASE_TIMEOUT,
+            blocking_timeout=settings.TURN_LEASE_WAIT
+        )
+        if not lease.acquire():
+            raise ValueError(BUSY_MESSAGE)
+
+        try:
+            yield
+        finally:
+            try:
+                lease.release()
+            except LockError:
+                # The lease already expired; nothing left to release
+                pass
+
+
+_sequencer = None
+
+
+def get_turn_sequencer():
+    """Return the configured turn sequencer"""
+    global _sequencer
+    if _sequencer is None:
+        if settings.TURN_SEQUENCER_BACKEND == 'redis':
+            _sequencer = RedisTurnSequencer(get_redis())
+        elif settings.TURN_SEQUENCER_BACKEND == 'memory':
+            _sequencer = MemoryTurnSequencer()
+        else:
+            raise ValueError(f"Unknown TURN_SEQUENCER_BACKEND: {settings.TURN_SEQUENCER_BACKEND}")
+    return _sequencer
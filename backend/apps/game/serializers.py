@@ -1,12 +1,16 @@
+from decimal import Decimal
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from decimal import Decimal
+from django.utils import timezone
+from apps.core.money import Money, MoneySerializerField
 from .models import Room, BetSettings, Game, Guess
 
 User = get_user_model()
 
 
 class PlayerSerializer(serializers.ModelSerializer):
+    balance = MoneySerializerField(read_only=True)
+
     class Meta:
         model = User
         fields = ('id', 'email', 'balance')
@@ -18,6 +22,7 @@ class RoomSerializer(serializers.ModelSerializer):
     player2_email = serializers.EmailField(source='player2.email', read_only=True, allow_null=True)
     players_count = serializers.IntegerField(read_only=True)
     is_full = serializers.BooleanField(read_only=True)
+    bet_amount = MoneySerializerField(max_digits=10)
 
     class Meta:
         model = Room
@@ -36,6 +41,8 @@ class RoomSerializer(serializers.ModelSerializer):
 
 
 class CreateRoomSerializer(serializers.ModelSerializer):
+    bet_amount = MoneySerializerField(max_digits=10)
+
     class Meta:
         model = Room
         fields = ('bet_amount',)
@@ -45,7 +52,7 @@ class CreateRoomSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Bet amount must be greater than 0")
 
         # Get bet settings
-        settings = BetSettings.get_settings()
+        settings = BetSettings.get_cached()
 
         # Validate against min_bet
         if value < settings.min_bet:
@@ -59,17 +66,11 @@ class CreateRoomSerializer(serializers.ModelSerializer):
                 f"Bet amount must not exceed {settings.max_bet}"
             )
 
-        # Validate step increment
-        if settings.step > 0:
-            # Ensure all values are Decimal for arithmetic operations
-            min_bet = Decimal(str(settings.min_bet))
-            step = Decimal(str(settings.step))
-            diff = value - min_bet
-            remainder = diff % step
-            if remainder != 0:
-                raise serializers.ValidationError(
-                    f"Bet amount must be in increments of {step} starting from {min_bet}"
-                )
+        # Validate step increment, in whole cents
+        if settings.step > 0 and (value - settings.min_bet) % settings.step != 0:
+            raise serializers.ValidationError(
+                f"Bet amount must be in increments of {settings.step} starting from {settings.min_bet}"
+            )
 
         return value
 
@@ -102,7 +103,7 @@ class GameSerializer(serializers.ModelSerializer):
     player2_email = serializers.EmailField(source='room.player2.email', read_only=True)
     current_turn_email = serializers.EmailField(source='current_turn.email', read_only=True, allow_null=True)
     winner_email = serializers.EmailField(source='winner.email', read_only=True, allow_null=True)
-    bet_amount = serializers.DecimalField(source='room.bet_amount', max_digits=10, decimal_places=2, read_only=True)
+    bet_amount = MoneySerializerField(source='room.bet_amount', read_only=True)
     guesses = GuessSerializer(many=True, read_only=True)
 
     class Meta:
@@ -131,6 +132,10 @@ class MakeGuessSerializer(serializers.Serializer):
 
 
 class BetSettingsSerializer(serializers.ModelSerializer):
+    min_bet = MoneySerializerField(max_digits=10, min_value=Decimal('0.01'), required=False)
+    max_bet = MoneySerializerField(max_digits=10, min_value=Decimal('0.01'), required=False)
+    step = MoneySerializerField(max_digits=10, min_value=Decimal('0.01'), required=False)
+
     class Meta:
         model = BetSettings
         fields = ('id', 'min_bet', 'max_bet', 'step')
@@ -157,3 +162,118 @@ class BetSettingsSerializer(serializers.ModelSerializer):
             })
 
         return attrs
+
+
+# Fast-path serializers for the WebSocket hot path
+# Hand-built equivalents of RoomSerializer, GuessSerializer and GameSerializer
+# that skip ModelSerializer field introspection and source-path traversal.
+# Output must stay identical to the DRF serializers above.
+
+
+def _serialize_datetime(value):
+    """Same output as serializers.DateTimeField with ISO 8601 format"""
+    if not value:
+        return None
+
+    value = value.astimezone(timezone.get_current_timezone())
+    output = value.isoformat()
+    if output.endswith('+00:00'):
+        output = output[:-6] + 'Z'
+    return output
+
+
+def _serialize_money(value):
+    """Same output as MoneySerializerField"""
+    return str(Money(value))
+
+
+def serialize_room(room):
+    """Fast equivalent of RoomSerializer(room).data"""
+    player1 = room.player1
+    player2 = room.player2
+    return {
+        'id': room.id,
+        'bet_amount': _serialize_money(room.bet_amount),
+        'status': room.status,
+        'creator': room.creator_id,
+        'creator_email': room.creator.email,
+        'player1': room.player1_id,
+        'player1_email': player1.email if player1 is not None else None,
+        'player2': room.player2_id,
+        'player2_email': player2.email if player2 is not None else None,
+        'players_count': room.players_count,
+        'is_full': room.is_full,
+        'created_at': _serialize_datetime(room.created_at),
+        'updated_at': _serialize_datetime(room.updated_at),
+    }
+
+
+def serialize_guess(guess):
+    """Fast equivalent of GuessSerializer(guess).data"""
+    return {
+        'id': guess.id,
+        'game': guess.game_id,
+        'player': guess.player_id,
+        'player_email': guess.player.email,
+        'guess_number': guess.guess_number,
+        'feedback': guess.feedback,
+        'created_at': _serialize_datetime(guess.created_at),
+    }
+
+
+def serialize_game(game):
+    """Fast equivalent of GameSerializer(game).data"""
+    room = game.room
+    current_turn = game.current_turn
+    winner = game.winner
+
+    data = {
+        'id': game.id,
+        'room_id': room.id,
+        'bet_amount': _serialize_money(room.bet_amount),
+        'status': game.status,
+    }
+    # GameSerializer skips the player emails when the seat is empty
+    if room.player1 is not None:
+        data['player1_email'] = room.player1.email
+    if room.player2 is not None:
+        data['player2_email'] = room.player2.email
+    data.update({
+        'current_turn': game.current_turn_id,
+        'current_turn_email': current_turn.email if current_turn is not None else None,
+        'winner': game.winner_id,
+        'winner_email': winner.email if winner is not None else None,
+        'started_at': _serialize_datetime(game.started_at),
+        'ended_at': _serialize_datetime(game.ended_at),
+        'guesses': [serialize_guess(guess) for guess in game.guesses.all()],
+    })
+    return data
+
+
+# Game fields a single guess can change, sent with every protocol v2 turn
+TURN_DELTA_FIELDS = (
+    'status', 'current_turn', 'current_turn_email',
+    'winner', 'winner_email', 'ended_at'
+)
+
+
+def serialize_turn_delta(game, guess, version):
+    """
+    What changed in a game with one guess
+    version is the number of guesses played, so clients can detect gaps
+    """
+    room = game.room
+    emails = {
+        room.player1_id: room.player1.email,
+        room.player2_id: room.player2.email,
+    }
+    return {
+        'version': version,
+        'guess': serialize_guess(guess),
+        'status': game.status,
+        'current_turn': game.current_turn_id,
+        'current_turn_email': emails.get(game.current_turn_id),
+        'winner': game.winner_id,
+        'winner_email': emails.get(game.winner_id),
+        'ended_at': _serialize_datetime(game.ended_at),
+    }
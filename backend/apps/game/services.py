@@ -1,10 +1,15 @@
 import random
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import F
-from decimal import Decimal
-from .models import Game, Guess, Room
-from apps.users.models import Transaction
+from django.db.models import Case, F, Value, When
+from .models import Game, Guess, Room, PlayerStats
+from apps.users.services import WalletService
+from .lobby import publish_room_event
+from .leaderboard import publish_result
+from .sequencer import get_turn_sequencer
+from .serializers import serialize_game, serialize_turn_delta
+from .outbox import enqueue
+from apps.core.db import pooled_database_sync_to_async
 
 
 class GameService:
@@ -18,65 +23,50 @@ class GameService:
         - Coin toss to determine first player
         - Create game instance
         - Deduct bet amount from both players
+        - Queue the GAME_START broadcast in the outbox
         """
         if room.status != 'FULL':
             raise ValueError("Room must be FULL to start a game")
 
-        if not room.player1 or not room.player2:
+        if not room.player1_id or not room.player2_id:
             raise ValueError("Room must have 2 players")
 
         if hasattr(room, 'game'):
             raise ValueError("Game already exists for this room")
 
         with transaction.atomic():
+            # Deduct bet amount from both players before creating anything
+            GameService.escrow_bets(room)
+
             # Generate secret number
             secret_number = random.randint(1, 100)
 
             # Coin toss - randomly select first player
-            first_player = random.choice([room.player1, room.player2])
+            first_player_id = random.choice([room.player1_id, room.player2_id])
 
             # Create game
             game = Game.objects.create(
                 room=room,
                 secret_number=secret_number,
-                current_turn=first_player
-            )
-
-            # Deduct bet amount from both players
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-
-            # Lock and update player1
-            player1 = User.objects.select_for_update().get(pk=room.player1.pk)
-            if player1.balance < room.bet_amount:
-                raise ValueError(f"Player {player1.email} has insufficient balance")
-
-            player1.balance = F('balance') - room.bet_amount
-            player1.save(update_fields=['balance'])
-
-            # Lock and update player2
-            player2 = User.objects.select_for_update().get(pk=room.player2.pk)
-            if player2.balance < room.bet_amount:
-                raise ValueError(f"Player {player2.email} has insufficient balance")
-
-            player2.balance = F('balance') - room.bet_amount
-            player2.save(update_fields=['balance'])
-
-            # Create transaction records
-            Transaction.objects.create(
-                user=room.player1,
-                amount=room.bet_amount,
-                type='bet'
+                current_turn_id=first_player_id
             )
 
-            Transaction.objects.create(
-                user=room.player2,
-                amount=room.bet_amount,
-                type='bet'
-            )
+            enqueue(room.pk, {
+                'type': 'game_started',
+                'game': serialize_game(Game.objects.with_details().get(pk=game.pk))
+            })
 
             return game
 
+    @staticmethod
+    def escrow_bets(room):
+        """
+        Debit the bet amount from both players through the wallet
+        Both are debited in one statement, or neither is
+        Must be called inside a transaction
+        """
+        WalletService.bet([room.player1_id, room.player2_id], room.bet_amount)
+
     @staticmethod
     def get_feedback(secret_number, guess_number):
         """
@@ -99,11 +89,12 @@ class GameService:
         - Generate feedback
         - Create guess record
         - Switch turn or end game
+        - Queue the turn broadcast in the outbox
         """
         if game.status != 'IN_PROGRESS':
             raise ValueError("Game is not in progress")
 
-        if game.current_turn != player:
+        if game.current_turn_id != player.pk:
             raise ValueError("It's not your turn")
 
         if guess_number < 1 or guess_number > 100:
@@ -128,17 +119,42 @@ class GameService:
                 # Switch turn
                 GameService.switch_turn(game)
 
+            GameService.queue_turn(game, guess)
+
             return guess
 
+    @staticmethod
+    def queue_turn(game, guess):
+        """
+        Queue the TURN_UPDATE / GAME_END delta of a guess in the outbox
+        Must be called inside the guess's transaction
+        """
+        version = Guess.objects.filter(game_id=game.pk).count()
+        enqueue(game.room_id, {
+            'type': 'game_ended' if game.status == 'COMPLETED' else 'turn_updated',
+            'delta': serialize_turn_delta(game, guess, version)
+        })
+
+    @staticmethod
+    def play_turn(game, player, guess_number):
+        """
+        make_guess sequenced per room
+        The turn state is re-read inside the room's lease, so a stale game
+        object cannot let two guesses through on the same turn
+        """
+        with get_turn_sequencer().hold(game.room_id):
+            game.refresh_from_db(fields=['status', 'current_turn', 'winner', 'ended_at'])
+            return GameService.make_guess(game, player, guess_number)
+
     @staticmethod
     def switch_turn(game):
         """Switch the current turn to the other player"""
         room = game.room
 
-        if game.current_turn == room.player1:
-            game.current_turn = room.player2
+        if game.current_turn_id == room.player1_id:
+            game.current_turn_id = room.player2_id
         else:
-            game.current_turn = room.player1
+            game.current_turn_id = room.player1_id
 
         game.save(update_fields=['current_turn'])
 
@@ -151,34 +167,73 @@ class GameService:
         - Set ended_at timestamp
         - Award winnings to winner (2x bet amount)
         - Update room status to COMPLETED
+        - Update both players' stats and leaderboard scores
         """
         with transaction.atomic():
+            ended_at = timezone.now()
+
+            # Conditional update so a game can only be settled once
+            settled = Game.objects.filter(pk=game.pk, status='IN_PROGRESS').update(
+                winner=winner,
+                status='COMPLETED',
+                ended_at=ended_at,
+                current_turn=game.current_turn_id
+            )
+            if not settled:
+                raise ValueError("Game is not in progress")
+
             game.winner = winner
             game.status = 'COMPLETED'
-            game.ended_at = timezone.now()
-            game.save()
+            game.ended_at = ended_at
 
             # Update room status
             room = game.room
+            Room.objects.filter(pk=room.pk).update(status='COMPLETED')
             room.status = 'COMPLETED'
-            room.save(update_fields=['status'])
+            publish_room_event('ROOM_COMPLETED', {'id': room.pk, 'status': 'COMPLETED'})
 
             # Award winnings (2x bet amount = original bet + opponent's bet)
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
+            GameService.settle_winnings(winner, room.bet_amount * 2)
 
-            winner_user = User.objects.select_for_update().get(pk=winner.pk)
-            winnings = room.bet_amount * 2
+            GameService.record_stats(room, winner, ended_at)
 
-            winner_user.balance = F('balance') + winnings
-            winner_user.save(update_fields=['balance'])
+    @staticmethod
+    def settle_winnings(winner, winnings):
+        """
+        Credit winnings and record the ledger row through the wallet
+        Must be called inside a transaction
+        """
+        WalletService.win(winner.pk, winnings)
 
-            # Create transaction record for winnings
-            Transaction.objects.create(
-                user=winner,
-                amount=winnings,
-                type='win'
-            )
+    @staticmethod
+    def record_stats(room, winner, ended_at):
+        """
+        Add a settled game to both players' PlayerStats in a single UPDATE
+        and mirror the result into the leaderboards on commit
+        Must be called inside a transaction
+        """
+        # Rows are inserted and locked in user id order, like the wallet's, so
+        # games settling concurrently for the same players cannot deadlock
+        player_ids = sorted([room.player1_id, room.player2_id])
+        bet = room.bet_amount
+        won = When(user_id=winner.pk, then=Value(1))
+
+        PlayerStats.objects.bulk_create(
+            [PlayerStats(user_id=user_id) for user_id in player_ids],
+            ignore_conflicts=True
+        )
+        PlayerStats.objects.filter(user_id__in=player_ids).update(
+            games_played=F('games_played') + 1,
+            total_wagered=F('total_wagered') + bet,
+            wins=F('wins') + Case(won, default=Value(0)),
+            net=F('net') + Case(When(user_id=winner.pk, then=Value(bet)), default=Value(-bet))
+        )
+
+        # Only players are ranked, like the leaderboard always did
+        scores = dict(PlayerStats.objects.filter(
+            user_id__in=player_ids, user__role='player'
+        ).values_list('user_id', 'wins'))
+        publish_result(scores, winner.pk, ended_at)
 
     @staticmethod
     def get_game_state(game):
@@ -196,3 +251,28 @@ class GameService:
             'started_at': game.started_at,
             'ended_at': game.ended_at,
         }
+
+    # Async API for consumers
+    # Django's aget()/acreate()/aupdate() run on the worker's single
+    # thread-sensitive executor, so every operation below is instead one hop
+    # onto the thread pool with its transaction and locking unchanged
+
+    @staticmethod
+    async def astart_game(room):
+        """Async start_game"""
+        return await pooled_database_sync_to_async(GameService.start_game)(room)
+
+    @staticmethod
+    async def amake_guess(game, player, guess_number):
+        """Async play_turn"""
+        return await pooled_database_sync_to_async(GameService.play_turn)(game, player, guess_number)
+
+    @staticmethod
+    async def aend_game(game, winner):
+        """Async end_game"""
+        return await pooled_database_sync_to_async(GameService.end_game)(game, winner)
+
+    @staticmethod
+    async def aget_game_state(game):
+        """Async get_game_state"""
+        return await pooled_database_sync_to_async(GameService.get_game_state)(game)
@@ -0,0 +1,584 @@
+import asyncio
+import io
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import DatabaseError, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from apps.core.fastjson import dumps
+from apps.core.money import Money
+from apps.core.testing import TEST_SETTINGS, QueryBudgetMixin, QueryPlanMixin, analyze, api_client, race
+from . import engine, leaderboard, lobby, matchmaking, outbox, sequencer
+from .models import Room, Game, GameEvent, Guess, PlayerStats
+from .serializers import (
+    RoomSerializer, GameSerializer, GuessSerializer, TURN_DELTA_FIELDS,
+    serialize_room, serialize_game, serialize_guess, serialize_turn_delta
+)
+from .services import GameService
+
+User = get_user_model()
+
+
+def reset_stores():
+    """Drop the cached stores so the next use picks up the overridden settings"""
+    engine._engine = None
+    leaderboard._store = None
+    matchmaking._queue = None
+    sequencer._sequencer = None
+
+
+@override_settings(**TEST_SETTINGS)
+class GameTestCase(TestCase):
+    def setUp(self):
+        reset_stores()
+        self.addCleanup(reset_stores)
+
+    @staticmethod
+    def create_player(email, **extra_fields):
+        return User.objects.create_user(email=email, password='secret', age=20, **extra_fields)
+
+    @staticmethod
+    def create_room(player1, player2=None, bet_amount='10.00'):
+        room = Room.objects.create(bet_amount=Money.parse(bet_amount), creator=player1, player1=player1)
+        if player2 is not None:
+            Room.try_join(room.pk, player2)
+            room.refresh_from_db()
+        return room
+
+    @staticmethod
+    def wrong_guess(game):
+        return game.secret_number % 100 + 1
+
+    @staticmethod
+    def current_player(game):
+        room = game.room
+        return room.player1 if game.current_turn_id == room.player1_id else room.player2
+
+
+class SerializerEquivalenceTests(GameTestCase):
+    """The WebSocket fast-path serializers must render exactly what the DRF ones do"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_player('alice@example.com')
+        self.bob = self.create_player('bob@example.com')
+
+    def assertSameOutput(self, fast, drf):
+        self.assertEqual(fast, drf)
+        # Key order and value types, as they reach the wire
+        self.assertEqual(dumps(fast), dumps(drf))
+
+    def assertRoomMatches(self, room_id):
+        room = Room.objects.with_players().get(pk=room_id)
+        self.assertSameOutput(serialize_room(room), RoomSerializer(room).data)
+
+    def assertGameMatches(self, game_id):
+        game = Game.objects.with_details().get(pk=game_id)
+        self.assertSameOutput(serialize_game(game), GameSerializer(game).data)
+        for guess in game.guesses.all():
+            self.assertSameOutput(serialize_guess(guess), GuessSerializer(guess).data)
+
+    def start_game(self, bet_amount='10.00'):
+        room = self.create_room(self.alice, self.bob, bet_amount)
+        return Game.objects.with_details().get(pk=GameService.start_game(room).pk)
+
+    def test_open_room(self):
+        room = self.create_room(self.alice, bet_amount='12.50')
+        self.assertRoomMatches(room.pk)
+
+    def test_full_room(self):
+        room = self.create_room(self.alice, self.bob)
+        self.assertRoomMatches(room.pk)
+
+    def test_completed_room(self):
+        game = self.start_game()
+        GameService.make_guess(game, self.current_player(game), game.secret_number)
+        self.assertRoomMatches(game.room_id)
+
+    def test_room_with_large_bet(self):
+        room = self.create_room(self.alice, bet_amount='99999999.99')
+        self.assertRoomMatches(room.pk)
+
+    def test_game_without_guesses(self):
+        game = self.start_game()
+        self.assertGameMatches(game.pk)
+
+    def test_game_in_progress(self):
+        game = self.start_game('25.05')
+        GameService.make_guess(game, self.current_player(game), self.wrong_guess(game))
+        GameService.make_guess(game, self.current_player(game), self.wrong_guess(game))
+        self.assertGameMatches(game.pk)
+
+    def test_completed_game(self):
+        game = self.start_game()
+        GameService.make_guess(game, self.current_player(game), self.wrong_guess(game))
+        GameService.make_guess(game, self.current_player(game), game.secret_number)
+        self.assertGameMatches(game.pk)
+
+    def test_game_with_empty_seat(self):
+        game = self.start_game()
+        User.objects.filter(pk=self.bob.pk).delete()
+        self.assertGameMatches(game.pk)
+
+    def test_current_timezone(self):
+        game = self.start_game()
+        GameService.make_guess(game, self.current_player(game), self.wrong_guess(game))
+        with timezone.override('America/New_York'):
+            self.assertRoomMatches(game.room_id)
+            self.assertGameMatches(game.pk)
+
+    def test_turn_delta_matches_game(self):
+        game = self.start_game()
+        for guess_number in (self.wrong_guess(game), game.secret_number):
+            guess = GameService.make_guess(game, self.current_player(game), guess_number)
+            version = Guess.objects.filter(game_id=game.pk).count()
+            delta = serialize_turn_delta(game, guess, version)
+
+            data = GameSerializer(Game.objects.with_details().get(pk=game.pk)).data
+            self.assertEqual(delta['version'], len(data['guesses']))
+            self.assertSameOutput(delta['guess'], data['guesses'][-1])
+            for field in TURN_DELTA_FIELDS:
+                self.assertEqual(delta[field], data[field], field)
+
+
+class GameStateEngineTests(GameTestCase):
+    """Live states are kept while a game runs and dropped once it is settled"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_player('alice@example.com')
+        self.bob = self.create_player('bob@example.com')
+        self.store = engine.MemoryStateStore()
+        # No flusher thread, flushes are run by the tests
+        self.engine = engine.GameStateEngine(self.store, flush_interval=1)
+        self.game = GameService.start_game(self.create_room(self.alice, self.bob))
+        self.room_id = self.game.room_id
+
+    def guess(self, correct=False):
+        state = self.engine.load(self.room_id)
+        number = state['secret_number'] if correct else self.wrong_guess(self.game)
+        return self.engine.make_guess(self.room_id, state['current_turn_id'], number)
+
+    def test_turns_are_written_behind(self):
+        self.guess()
+        self.assertEqual(self.store.get(self.room_id)['status'], 'IN_PROGRESS')
+        self.assertFalse(Guess.objects.filter(game=self.game).exists())
+
+        self.engine.flush_dirty()
+        self.assertEqual(Guess.objects.filter(game=self.game).count(), 1)
+        self.assertIsNotNone(self.store.get(self.room_id))
+
+    def test_settled_game_is_not_kept(self):
+        self.guess()
+        self.assertTrue(self.guess(correct=True)['is_game_over'])
+        self.engine.flush_dirty()
+
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.status, 'COMPLETED')
+        self.assertEqual(Guess.objects.filter(game=self.game).count(), 2)
+        self.assertEqual(self.store._states, {})
+
+        # A socket reconnecting to the finished game
+        state = self.engine.load(self.room_id)
+        self.assertEqual((state['status'], state['winner_id']), ('COMPLETED', self.game.winner_id))
+        self.assertEqual(len(state['game']['guesses']), 2)
+        with self.assertRaisesMessage(ValueError, 'Game is not in progress'):
+            self.engine.make_guess(self.room_id, state['current_turn_id'], 50)
+        self.assertEqual(self.store._states, {})
+
+
+class LeaderboardTests(GameTestCase):
+    """Rankings rebuilt from completed games, ties ordered by user id"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_player('alice@example.com')
+        self.bob = self.create_player('bob@example.com')
+
+    def play(self, winner):
+        room = self.create_room(self.alice, self.bob)
+        game = GameService.start_game(room)
+        if self.current_player(game) != winner:
+            GameService.make_guess(game, self.current_player(game), self.wrong_guess(game))
+        GameService.make_guess(game, winner, game.secret_number)
+
+    def test_rebuild_backfills_stats(self):
+        for winner in (self.alice, self.alice, self.bob):
+            self.play(winner)
+        expected = list(PlayerStats.objects.order_by('user_id').values_list('user_id', 'wins', 'games_played', 'net'))
+
+        # As after migrating an existing database and flushing Redis
+        PlayerStats.objects.all().delete()
+        reset_stores()
+        call_command('rebuild_player_stats', stdout=io.StringIO())
+
+        rebuilt = list(PlayerStats.objects.order_by('user_id').values_list('user_id', 'wins', 'games_played', 'net'))
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(leaderboard.get_leaderboard_store().range(0, 9), [(self.alice.pk, 2), (self.bob.pk, 1)])
+
+    def test_ties_rank_by_user_id(self):
+        store = leaderboard.MemoryLeaderboardStore()
+        store.set_scores({9: 1, 10: 1, 100: 1, 2: 3})
+
+        self.assertEqual(store.range(0, 3), [(2, 3), (100, 1), (10, 1), (9, 1)])
+        self.assertEqual([store.rank(user_id) for user_id in (2, 100, 10, 9)], [0, 1, 2, 3])
+
+    def test_redis_members_are_padded(self):
+        client = mock.Mock()
+        store = leaderboard.RedisLeaderboardStore(client)
+        store.set_scores({9: 1, 10: 1})
+
+        client.zadd.assert_called_once_with(
+            leaderboard.ALL_TIME, {'0000000000000000009': 1, '0000000000000000010': 1}, gt=True
+        )
+        client.zrevrange.return_value = [(b'0000000000000000010', 1.0), (b'0000000000000000009', 1.0)]
+        self.assertEqual(store.range(0, 1), [(10, 1), (9, 1)])
+
+
+class QueryBudgetTests(QueryBudgetMixin, GameTestCase):
+    """Game and room endpoints run a fixed number of queries, whatever the number of rows"""
+
+    def setUp(self):
+        super().setUp()
+        self.player = self.create_player('player@example.com')
+        self.admin = self.create_player('admin@example.com', role='admin')
+        self.player_client = api_client(self.player)
+        self.admin_client = api_client(self.admin)
+        self.game = self.create_game(self.create_player('first@example.com'))
+
+    def create_game(self, opponent):
+        """A completed game of self.player against opponent, with a guess each"""
+        room = Room.objects.create(
+            bet_amount=Money.parse('10.00'), status='COMPLETED',
+            creator=self.player, player1=self.player, player2=opponent
+        )
+        game = Game.objects.create(
+            room=room, secret_number=50, status='COMPLETED',
+            current_turn=opponent, winner=opponent, ended_at=timezone.now()
+        )
+        self.add_guesses(game)
+        PlayerStats.objects.create(user=opponent, wins=1, games_played=1)
+        leaderboard.get_leaderboard_store().set_scores({opponent.pk: 1})
+        return game
+
+    def add_guesses(self, game):
+        room = game.room
+        Guess.objects.bulk_create([
+            Guess(game=game, player=room.player1, guess_number=25, feedback='UP'),
+            Guess(game=game, player=room.player2, guess_number=75, feedback='DOWN'),
+        ])
+
+    def seed_games(self):
+        """Three more games, each against a new opponent"""
+        for _ in range(3):
+            count = User.objects.count()
+            self.create_game(self.create_player(f'opponent{count}@example.com'))
+
+    def seed_guesses(self):
+        self.add_guesses(self.game)
+
+    def test_room_list(self):
+        self.assertQueryBudget(self.player_client, '/api/game/rooms/', 1, self.seed_games)
+
+    def test_room_list_by_status(self):
+        self.assertQueryBudget(self.player_client, '/api/game/rooms/?status=COMPLETED', 1, self.seed_games)
+
+    def test_my_rooms(self):
+        self.assertQueryBudget(self.player_client, '/api/game/rooms/my/', 1, self.seed_games)
+
+    def test_room_detail(self):
+        url = f'/api/game/rooms/{self.game.room_id}/'
+        self.assertQueryBudget(self.player_client, url, 1, self.seed_games)
+
+    def test_my_games(self):
+        self.assertQueryBudget(self.player_client, '/api/game/games/my/', 2, self.seed_games)
+
+    def test_game_detail(self):
+        url = f'/api/game/games/{self.game.pk}/'
+        self.assertQueryBudget(self.player_client, url, 2, self.seed_guesses)
+
+    def test_leaderboard(self):
+        self.assertQueryBudget(self.player_client, '/api/game/leaderboard/', 1, self.seed_games)
+
+    def test_admin_rooms(self):
+        self.assertQueryBudget(self.admin_client, '/api/game/admin/rooms/', 1, self.seed_games)
+
+    def test_admin_games(self):
+        self.assertQueryBudget(self.admin_client, '/api/game/admin/games/', 2, self.seed_games)
+
+
+class QueryPlanTests(QueryPlanMixin, GameTestCase):
+    """Room and game lists stay on their indexes on a production-sized data set"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(email=f'player{i}@example.com', age=20) for i in range(2000)] +
+            [User(email='admin@example.com', age=20, role='admin')]
+        )
+        players = users[:-1]
+        cls.player = players[3]
+        cls.admin = users[-1]
+
+        # Mostly finished rooms, a few open or being played, like the live table
+        rooms = []
+        for i in range(20000):
+            status = 'OPEN' if i % 100 == 0 else 'FULL' if i % 100 == 1 else 'COMPLETED'
+            rooms.append(Room(
+                bet_amount=Money.parse('10.00'), status=status,
+                creator=players[i % 2000], player1=players[i % 2000],
+                player2=None if status == 'OPEN' else players[(i * 7 + 1) % 2000]
+            ))
+        rooms = Room.objects.bulk_create(rooms, batch_size=5000)
+
+        games = Game.objects.bulk_create([
+            Game(
+                room=room, secret_number=50, current_turn=room.player1,
+                status='IN_PROGRESS' if room.status == 'FULL' else 'COMPLETED',
+                winner=None if room.status == 'FULL' else room.player2
+            )
+            for room in rooms if room.status != 'OPEN'
+        ], batch_size=5000)
+        cls.game = next(game for game in games if game.room.player1_id == cls.player.pk)
+
+        Guess.objects.bulk_create([
+            Guess(game=game, player=player, guess_number=guess_number, feedback='UP')
+            for game in games
+            for player, guess_number in ((game.room.player1, 10), (game.room.player2, 20))
+        ], batch_size=5000)
+        analyze()
+
+    def setUp(self):
+        super().setUp()
+        self.player_client = api_client(self.player)
+        self.admin_client = api_client(self.admin)
+
+    def assertPagesUseIndexes(self, client, url):
+        """The first page and the one after it, fetched with the keyset cursor"""
+        response = self.assertNoSeqScan(client, url)
+        self.assertIsNotNone(response.data['next'], url)
+        self.assertNoSeqScan(client, response.data['next'])
+
+    def test_room_list(self):
+        self.assertPagesUseIndexes(self.player_client, '/api/game/rooms/')
+
+    def test_open_rooms(self):
+        self.assertPagesUseIndexes(self.player_client, '/api/game/rooms/?status=OPEN')
+
+    def test_room_list_by_status(self):
+        self.assertPagesUseIndexes(self.player_client, '/api/game/rooms/?status=FULL')
+
+    def test_my_rooms(self):
+        self.assertNoSeqScan(self.player_client, '/api/game/rooms/my/')
+
+    def test_room_detail(self):
+        self.assertNoSeqScan(self.player_client, f'/api/game/rooms/{self.game.room_id}/')
+
+    def test_my_games(self):
+        self.assertNoSeqScan(self.player_client, '/api/game/games/my/')
+
+    def test_game_detail(self):
+        self.assertNoSeqScan(self.player_client, f'/api/game/games/{self.game.pk}/')
+
+    def test_admin_rooms(self):
+        self.assertPagesUseIndexes(self.admin_client, '/api/game/admin/rooms/?status=COMPLETED')
+
+    def test_admin_games(self):
+        self.assertPagesUseIndexes(self.admin_client, '/api/game/admin/games/')
+
+    def test_admin_games_by_status(self):
+        self.assertPagesUseIndexes(self.admin_client, '/api/game/admin/games/?status=IN_PROGRESS')
+
+
+class JoinRoomTests(GameTestCase):
+    """The seat and its lobby delta commit together"""
+
+    def setUp(self):
+        super().setUp()
+        self.host = self.create_player('host@example.com')
+        self.joiner = self.create_player('joiner@example.com')
+        self.room = self.create_room(self.host)
+        self.url = f'/api/game/rooms/{self.room.pk}/join/'
+
+    def test_join_queues_lobby_delta(self):
+        response = api_client(self.joiner).post(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        event = GameEvent.objects.get(group=lobby.LOBBY_GROUP_NAME)
+        self.assertEqual(event.message['event'], 'ROOM_FILLED')
+        self.assertEqual(event.message['room']['player2'], self.joiner.pk)
+
+    def test_failed_publish_gives_back_the_seat(self):
+        def publish_then_fail(event, room_data):
+            lobby.publish_room_event(event, room_data)
+            raise DatabaseError('outbox unavailable')
+
+        with mock.patch('apps.game.views.publish_room_event', publish_then_fail):
+            with self.assertRaises(DatabaseError):
+                api_client(self.joiner).post(self.url)
+
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual((room.status, room.player2_id), ('OPEN', None))
+        self.assertFalse(GameEvent.objects.exists())
+
+
+@override_settings(**TEST_SETTINGS)
+class JoinRaceTests(TransactionTestCase):
+    """Parallel joins of one room, each on its own connection; exactly one may win the seat"""
+    joiners = 200
+    workers = 32
+
+    def setUp(self):
+        reset_stores()
+        self.addCleanup(reset_stores)
+        self.host = User.objects.create_user(email='host@example.com', password='secret', age=20)
+        self.room = Room.objects.create(bet_amount=Money.parse('10.00'), creator=self.host, player1=self.host)
+        self.users = User.objects.bulk_create([
+            User(email=f'joiner{i}@example.com', age=20) for i in range(self.joiners)
+        ])
+
+    def test_try_join(self):
+        results = race(lambda user: Room.try_join(self.room.pk, user), self.users, self.workers)
+
+        self.assertEqual(results.count(True), 1)
+        winner = self.users[results.index(True)]
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(room.status, 'FULL')
+        self.assertEqual((room.player1_id, room.player2_id), (self.host.pk, winner.pk))
+
+    def test_join_view(self):
+        url = f'/api/game/rooms/{self.room.pk}/join/'
+        responses = race(lambda user: api_client(user).post(url), self.users, self.workers)
+
+        statuses = [response.status_code for response in responses]
+        self.assertEqual(statuses.count(200), 1)
+        self.assertEqual(statuses.count(400), self.joiners - 1)
+
+        winner = responses[statuses.index(200)].data['room']
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(winner['player2'], room.player2_id)
+        self.assertEqual(winner['status'], 'FULL')
+
+
+@override_settings(**TEST_SETTINGS)
+class OutboxTests(TransactionTestCase):
+    """Events are published once, in order per group, and only once committed"""
+
+    def setUp(self):
+        self.channel_layer = get_channel_layer()
+        self.addCleanup(async_to_sync(self.channel_layer.flush))
+        self.channels = {}
+        for group in (outbox.game_group_name(1), outbox.game_group_name(2), lobby.LOBBY_GROUP_NAME):
+            self.channels[group] = async_to_sync(self.channel_layer.new_channel)()
+            async_to_sync(self.channel_layer.group_add)(group, self.channels[group])
+
+    def queue(self, room_id, *sequence):
+        for seq in sequence:
+            outbox.enqueue(room_id, {'type': 'game_event', 'seq': seq})
+
+    def received(self, group):
+        """Every message waiting for the group's channel"""
+        return async_to_sync(self.drain)(self.channels[group])
+
+    async def drain(self, channel):
+        messages = []
+        while True:
+            try:
+                messages.append(await asyncio.wait_for(self.channel_layer.receive(channel), 0.05))
+            except asyncio.TimeoutError:
+                return messages
+
+    def test_publishes_one_batch_per_group(self):
+        self.queue(1, 1, 2)
+        self.queue(2, 3)
+        self.queue(1, 4)
+        lobby.publish_room_event('ROOM_CREATED', {'id': 1})
+
+        self.assertEqual(outbox.publish_pending(100), 5)
+
+        batch, = self.received(outbox.game_group_name(1))
+        self.assertEqual(batch['type'], 'outbox_batch')
+        self.assertEqual([event['seq'] for event in batch['events']], [1, 2, 4])
+        batch, = self.received(outbox.game_group_name(2))
+        self.assertEqual([event['seq'] for event in batch['events']], [3])
+        batch, = self.received(lobby.LOBBY_GROUP_NAME)
+        self.assertEqual(batch['events'], [{'type': 'lobby_delta', 'event': 'ROOM_CREATED', 'room': {'id': 1}}])
+
+        # Sent rows are removed
+        self.assertFalse(GameEvent.objects.exists())
+        self.assertEqual(outbox.publish_pending(100), 0)
+
+    def test_batch_size(self):
+        self.queue(1, 1, 2, 3)
+
+        self.assertEqual(outbox.publish_pending(2), 2)
+        self.assertEqual(outbox.publish_pending(2), 1)
+        first, second = self.received(outbox.game_group_name(1))
+        self.assertEqual([event['seq'] for event in first['events'] + second['events']], [1, 2, 3])
+
+    def test_rolled_back_events_are_not_published(self):
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                self.queue(1, 1)
+                raise DatabaseError('rolled back')
+
+        self.assertEqual(outbox.publish_pending(100), 0)
+        self.assertEqual(self.received(outbox.game_group_name(1)), [])
+
+    def test_failed_send_keeps_events(self):
+        self.queue(1, 1)
+        with mock.patch.object(outbox, 'send_batches', side_effect=RuntimeError('channel layer down')):
+            with self.assertRaises(RuntimeError):
+                outbox.publish_pending(100)
+
+        self.assertEqual(GameEvent.objects.count(), 1)
+        # The group's lock was released, the next run sends it
+        self.assertEqual(outbox.publish_pending(100), 1)
+        self.assertEqual(len(self.received(outbox.game_group_name(1))), 1)
+
+    def test_skips_groups_locked_by_another_publisher(self):
+        self.queue(1, 1)
+        self.queue(2, 2)
+        locked = outbox.game_group_name(1)
+
+        # Another publisher, on its own connection, holds room 1's group
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_lock(hashtext(%s), hashtext(%s))', [GameEvent._meta.db_table, locked]
+            )
+
+        self.assertEqual(outbox.publish_pending(100), 1)
+        self.assertEqual(self.received(locked), [])
+        self.assertEqual(len(self.received(outbox.game_group_name(2))), 1)
+
+        other.close()
+        self.assertEqual(outbox.publish_pending(100), 1)
+        self.assertEqual(len(self.received(locked)), 1)
+
+    def test_concurrent_publishers_send_each_event_once(self):
+        for seq in range(300):
+            self.queue(seq % 5, seq)
+
+        sent = []
+
+        async def record(batches):
+            for group, events in batches.items():
+                sent.extend((group, event['seq']) for event in events)
+
+        def publish(_):
+            while outbox.publish_pending(7):
+                pass
+
+        with mock.patch.object(outbox, 'send_batches', record):
+            race(publish, range(8), workers=8)
+
+        self.assertEqual(sorted(seq for _, seq in sent), list(range(300)))
+        for room_id in range(5):
+            sequence = [seq for group, seq in sent if group == outbox.game_group_name(room_id)]
+            self.assertEqual(sequence, sorted(sequence))
+        self.assertFalse(GameEvent.objects.exists())
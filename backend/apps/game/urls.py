@@ -1,9 +1,10 @@
 from django.urls import path
 from .views import (
     RoomListView, CreateRoomView, RoomDetailView,
-    JoinRoomView, MyRoomsView,
+    JoinRoomView, MyRoomsView, MatchmakingView,
     StartGameView, GameDetailView, MakeGuessView, MyGamesView,
-    AdminRoomsListView, AdminGamesListView, BetSettingsView, LeaderboardView
+    AdminRoomsListView, AdminGamesListView, BetSettingsView, LeaderboardView,
+    MyLeaderboardView
 )
 
 app_name = 'game'
@@ -17,6 +18,9 @@ urlpatterns = [
     path('rooms/<int:pk>/join/', JoinRoomView.as_view(), name='join_room'),
     path('rooms/<int:pk>/start/', StartGameView.as_view(), name='start_game'),
 
+    # Matchmaking
+    path('matchmaking/', MatchmakingView.as_view(), name='matchmaking'),
+
     # Game endpoints
     path('games/my/', MyGamesView.as_view(), name='my_games'),
     path('games/<int:pk>/', GameDetailView.as_view(), name='game_detail'),
@@ -27,6 +31,7 @@ urlpatterns = [
 
     # Leaderboard
     path('leaderboard/', LeaderboardView.as_view(), name='leaderboard'),
+    path('leaderboard/me/', MyLeaderboardView.as_view(), name='my_leaderboard'),
 
     # Admin endpoints
     path('admin/rooms/', AdminRoomsListView.as_view(), name='admin_rooms_list'),
@@ -5,12 +5,19 @@ from rest_framework.permissions import IsAuthenticated, BasePermission
 from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from .models import Room, Game, Guess, BetSettings
+from django.utils import timezone
+from .models import Room, Game, Guess, BetSettings, PlayerStats
 from .serializers import (
     RoomSerializer, CreateRoomSerializer,
     GameSerializer, GuessSerializer, MakeGuessSerializer, BetSettingsSerializer
 )
 from .services import GameService
+from .engine import get_game_engine
+from .matchmaking import MatchmakingService
+from .lobby import publish_room_event
+from .outbox import broadcast
+from .leaderboard import get_leaderboard_store, window_key, ALL_TIME, WINDOWS
+from apps.core.idempotency import idempotent
 
 
 # Admin permission class
@@ -27,7 +34,7 @@ class RoomListView(generics.ListAPIView):
     def get_queryset(self):
         # Can filter by status if needed
         status_filter = self.request.query_params.get('status', None)
-        queryset = Room.objects.all()
+        queryset = Room.objects.with_players()
 
         if status_filter:
             queryset = queryset.filter(status=status_filter)
@@ -58,10 +65,12 @@ class CreateRoomView(APIView):
             creator=request.user,
             player1=request.user
         )
+        room_data = RoomSerializer(room).data
+        publish_room_event('ROOM_CREATED', room_data)
 
         return Response({
             'message': 'Room created successfully',
-            'room': RoomSerializer(room).data
+            'room': room_data
         }, status=status.HTTP_201_CREATED)
 
 
@@ -69,7 +78,7 @@ class RoomDetailView(generics.RetrieveAPIView):
     """Get room details"""
     permission_classes = (IsAuthenticated,)
     serializer_class = RoomSerializer
-    queryset = Room.objects.all()
+    queryset = Room.objects.with_players()
 
 
 class JoinRoomView(APIView):
@@ -78,6 +87,17 @@ class JoinRoomView(APIView):
 
     @transaction.atomic
     def post(self, request, pk):
+        # Take the seat with one conditional update, racing joins cannot both win
+        if Room.try_join(pk, request.user):
+            room = Room.objects.with_players().get(pk=pk)
+            room_data = RoomSerializer(room).data
+            publish_room_event('ROOM_FILLED', room_data)
+            return Response({
+                'message': 'Successfully joined the room',
+                'room': room_data
+            }, status=status.HTTP_200_OK)
+
+        # The seat was not taken, work out why
         room = get_object_or_404(Room, pk=pk)
 
         # Validate room status
@@ -86,14 +106,8 @@ class JoinRoomView(APIView):
                 'error': 'Room is not available for joining'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check if room is full
-        if room.is_full:
-            return Response({
-                'error': 'Room is already full'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
         # Check if user is already in the room
-        if room.player1 == request.user or room.player2 == request.user:
+        if request.user.pk in (room.player1_id, room.player2_id):
             return Response({
                 'error': 'You are already in this room'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -104,18 +118,9 @@ class JoinRoomView(APIView):
                 'error': 'Insufficient balance'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Add player to room
-        try:
-            room.add_player(request.user)
-        except ValueError as e:
-            return Response({
-                'error': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
-
         return Response({
-            'message': 'Successfully joined the room',
-            'room': RoomSerializer(room).data
-        }, status=status.HTTP_200_OK)
+            'error': 'Room is already full'
+        }, status=status.HTTP_400_BAD_REQUEST)
 
 
 class MyRoomsView(generics.ListAPIView):
@@ -125,11 +130,44 @@ class MyRoomsView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return Room.objects.filter(
-            Q(player1=user) | Q(player2=user)
+        return Room.objects.with_players().filter(
+            Q(player1_id=user.pk) | Q(player2_id=user.pk)
         )
 
 
+class MatchmakingView(APIView):
+    """Queue for an opponent with the same bet amount"""
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = CreateRoomSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        bet_amount = serializer.validated_data['bet_amount']
+        room = MatchmakingService.find_match(request.user, bet_amount)
+
+        if room is None:
+            return Response({
+                'message': 'Waiting for an opponent',
+                'bet_amount': f'{bet_amount:.2f}'
+            }, status=status.HTTP_202_ACCEPTED)
+
+        return Response({
+            'message': 'Match found',
+            'room': RoomSerializer(room).data
+        }, status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        if not MatchmakingService.cancel(request.user):
+            return Response({
+                'error': 'You are not in the matchmaking queue'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': 'Left the matchmaking queue'
+        }, status=status.HTTP_200_OK)
+
+
 class StartGameView(APIView):
     """Start a game for a FULL room"""
     permission_classes = (IsAuthenticated,)
@@ -138,7 +176,7 @@ class StartGameView(APIView):
         room = get_object_or_404(Room, pk=pk)
 
         # Check if user is a participant
-        if request.user not in [room.player1, room.player2]:
+        if request.user.pk not in (room.player1_id, room.player2_id):
             return Response({
                 'error': 'You are not a participant in this room'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -147,14 +185,14 @@ class StartGameView(APIView):
         if hasattr(room, 'game'):
             return Response({
                 'error': 'Game already started for this room',
-                'game': GameSerializer(room.game).data
+                'game': GameSerializer(Game.objects.with_details().get(pk=room.game.pk)).data
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             game = GameService.start_game(room)
             return Response({
                 'message': 'Game started successfully',
-                'game': GameSerializer(game).data
+                'game': GameSerializer(Game.objects.with_details().get(pk=game.pk)).data
             }, status=status.HTTP_201_CREATED)
         except ValueError as e:
             return Response({
@@ -171,8 +209,8 @@ class GameDetailView(generics.RetrieveAPIView):
     def get_queryset(self):
         # Only show games where user is a participant
         user = self.request.user
-        return Game.objects.filter(
-            Q(room__player1=user) | Q(room__player2=user)
+        return Game.objects.with_details().filter(
+            Q(room__player1_id=user.pk) | Q(room__player2_id=user.pk)
         )
 
 
@@ -180,11 +218,12 @@ class MakeGuessView(APIView):
     """Make a guess in the game"""
     permission_classes = (IsAuthenticated,)
 
+    @idempotent('guess')
     def post(self, request, pk):
-        game = get_object_or_404(Game, pk=pk)
+        game = get_object_or_404(Game.objects.select_related('room__player1', 'room__player2'), pk=pk)
 
         # Check if user is a participant
-        if request.user not in [game.room.player1, game.room.player2]:
+        if request.user.pk not in (game.room.player1_id, game.room.player2_id):
             return Response({
                 'error': 'You are not a participant in this game'
             }, status=status.HTTP_403_FORBIDDEN)
@@ -194,11 +233,35 @@ class MakeGuessView(APIView):
 
         guess_number = serializer.validated_data['guess_number']
 
+        engine = get_game_engine()
+        if engine is not None:
+            try:
+                result = engine.make_guess(game.room_id, request.user.pk, guess_number)
+            except ValueError as e:
+                return Response({
+                    'error': str(e)
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # Engine turns are not in the database yet, so they skip the outbox;
+            # the engine writes them behind
+            broadcast(game.room_id, {
+                'type': 'game_ended' if result['is_game_over'] else 'turn_updated',
+                'delta': result['delta']
+            })
+
+            return Response({
+                'message': 'Guess recorded',
+                'guess': result['guess'],
+                'game': result['game']
+            }, status=status.HTTP_200_OK)
+
         try:
-            guess = GameService.make_guess(game, request.user, guess_number)
+            room = game.room
+            player = room.player1 if request.user.pk == room.player1_id else room.player2
+            guess = GameService.play_turn(game, player, guess_number)
 
-            # Refresh game from database to get latest state
-            game.refresh_from_db()
+            # Reload game from database to get latest state
+            game = Game.objects.with_details().get(pk=game.pk)
 
             return Response({
                 'message': 'Guess recorded',
@@ -215,11 +278,12 @@ class MyGamesView(generics.ListAPIView):
     """List games where the user is a participant"""
     permission_classes = (IsAuthenticated,)
     serializer_class = GameSerializer
+    cursor_field = 'started_at'
 
     def get_queryset(self):
         user = self.request.user
-        return Game.objects.filter(
-            Q(room__player1=user) | Q(room__player2=user)
+        return Game.objects.with_details().filter(
+            Q(room__player1_id=user.pk) | Q(room__player2_id=user.pk)
         )
 
 
@@ -228,7 +292,7 @@ class AdminRoomsListView(generics.ListAPIView):
     """Admin: List all rooms with filters"""
     permission_classes = (IsAdminUser,)
     serializer_class = RoomSerializer
-    queryset = Room.objects.all().order_by('-created_at')
+    queryset = Room.objects.with_players().order_by('-created_at')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -243,7 +307,8 @@ class AdminGamesListView(generics.ListAPIView):
     """Admin: List all games with filters"""
     permission_classes = (IsAdminUser,)
     serializer_class = GameSerializer
-    queryset = Game.objects.all().order_by('-started_at')
+    queryset = Game.objects.with_details().order_by('-started_at')
+    cursor_field = 'started_at'
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -260,7 +325,7 @@ class BetSettingsView(APIView):
 
     def get(self, request):
         """Anyone can view bet settings"""
-        settings = BetSettings.get_settings()
+        settings = BetSettings.get_cached()
         return Response(BetSettingsSerializer(settings).data, status=status.HTTP_200_OK)
 
     def put(self, request):
@@ -281,34 +346,95 @@ class BetSettingsView(APIView):
         }, status=status.HTTP_200_OK)
 
 
+def leaderboard_key(request):
+    """
+    Sorted set key for the ?window= query param
+    - Omitted or 'all' for all-time, otherwise day, week or month
+    Returns None for an unknown window
+    """
+    window = request.query_params.get('window', 'all')
+    if window == 'all':
+        return ALL_TIME
+    if window not in WINDOWS:
+        return None
+    return window_key(window, timezone.now())
+
+
+def leaderboard_rows(entries, first_rank, key=ALL_TIME):
+    """Build leaderboard rows for [(user_id, wins)] ranked from first_rank"""
+    user_ids = [user_id for user_id, _ in entries]
+    stats = PlayerStats.objects.select_related('user').in_bulk(user_ids)
+    window_games = get_leaderboard_store().games(key, user_ids) if key != ALL_TIME else None
+
+    rows = []
+    for rank, (user_id, wins) in enumerate(entries, first_rank):
+        player_stats = stats.get(user_id)
+        if player_stats is None:
+            continue
+        rows.append({
+            'rank': rank,
+            'id': user_id,
+            'email': player_stats.user.email,
+            'balance': float(player_stats.user.balance.to_decimal()),
+            'total_games': window_games[user_id] if window_games is not None else player_stats.games_played,
+            'wins': wins,
+        })
+    return rows
+
+
+def invalid_window_response():
+    return Response(
+        {'error': f"window must be one of: all, {', '.join(WINDOWS)}"},
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
 class LeaderboardView(APIView):
-    """Get leaderboard - top players by wins and balance"""
+    """
+    Get leaderboard - top players by wins
+    ?window=day|week|month ranks wins in the current UTC day, ISO week or month
+    """
     permission_classes = (IsAuthenticated,)
+    size = 50
 
     def get(self, request):
-        from django.contrib.auth import get_user_model
-        from django.db.models import Count, Q
-
-        User = get_user_model()
-
-        # Get all players with their win count and total games
-        # Count games where user is player1 or player2
-        players = User.objects.filter(role='player').annotate(
-            wins=Count('won_games', filter=Q(won_games__status='COMPLETED'), distinct=True),
-            games_as_p1=Count('rooms_as_player1__game', filter=Q(rooms_as_player1__game__status='COMPLETED'), distinct=True),
-            games_as_p2=Count('rooms_as_player2__game', filter=Q(rooms_as_player2__game__status='COMPLETED'), distinct=True)
-        ).order_by('-wins', '-balance')[:50]  # Top 50 players
-
-        leaderboard_data = []
-        for idx, player in enumerate(players, 1):
-            total_games = player.games_as_p1 + player.games_as_p2
-            leaderboard_data.append({
-                'rank': idx,
-                'id': player.id,
-                'email': player.email,
-                'balance': float(player.balance),
-                'total_games': total_games,
-                'wins': player.wins,
-            })
+        key = leaderboard_key(request)
+        if key is None:
+            return invalid_window_response()
+
+        entries = get_leaderboard_store().range(0, self.size - 1, key)
+        return Response(leaderboard_rows(entries, 1, key), status=status.HTTP_200_OK)
 
-        return Response(leaderboard_data, status=status.HTTP_200_OK)
+
+class MyLeaderboardView(APIView):
+    """
+    Get the current user's leaderboard rank and the k players above and below
+    Accepts the same ?window= as the leaderboard
+    """
+    permission_classes = (IsAuthenticated,)
+    max_k = 25
+
+    def get(self, request):
+        try:
+            k = min(max(int(request.query_params.get('k', 5)), 0), self.max_k)
+        except ValueError:
+            return Response(
+                {'error': 'k must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        key = leaderboard_key(request)
+        if key is None:
+            return invalid_window_response()
+
+        store = get_leaderboard_store()
+        rank = store.rank(request.user.pk, key)
+        if rank is None:
+            return Response({'rank': None, 'players': []}, status=status.HTTP_200_OK)
+
+        start = max(rank - k, 0)
+        entries = store.range(start, rank + k, key)
+        return Response(
+            {'rank': rank + 1, 'players': leaderboard_rows(entries, start + 1, key)},
+            status=status.HTTP_200_OK
+        )
@@ -0,0 +1,95 @@
+import zlib
+import msgpack
+from apps.core import fastjson
+
+# Wire formats a game socket can negotiate through Sec-WebSocket-Protocol.
+# JSON text frames stay the default when the client asks for nothing we know.
+
+# Largest client message once decompressed; client events are a few bytes
+MAX_FRAME_SIZE = 64 * 1024
+
+
+class FrameTooLarge(ValueError):
+    """A compressed client frame inflates past MAX_FRAME_SIZE"""
+
+
+class JSONCodec:
+    """JSON text frames"""
+    subprotocol = None
+    binary = False
+    invalid_message = 'Invalid JSON'
+
+    def encode(self, message):
+        return fastjson.dumps_text(message)
+
+    def decode(self, text_data=None, bytes_data=None):
+        return fastjson.loads(text_data if text_data is not None else bytes_data)
+
+
+class MsgpackCodec:
+    """MessagePack binary frames with the same keys as the JSON events"""
+    subprotocol = 'msgpack'
+    binary = True
+    invalid_message = 'Invalid MessagePack'
+
+    def encode(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            raise ValueError('Expected a binary frame')
+        try:
+            return msgpack.unpackb(bytes_data, raw=False)
+        except msgpack.UnpackException as e:
+            raise ValueError(str(e))
+
+
+class DeflateMsgpackCodec(MsgpackCodec):
+    """
+    MessagePack frames with per-message deflate
+    Every frame starts with a flag byte: 0 plain, 1 deflated.
+    Small frames are sent plain since compressing them does not pay off
+    """
+    subprotocol = 'msgpack+deflate'
+    min_compress_size = 256
+
+    def encode(self, message):
+        packed = super().encode(message)
+        if len(packed) < self.min_compress_size:
+            return b'\x00' + packed
+        return b'\x01' + zlib.compress(packed)
+
+    def decode(self, text_data=None, bytes_data=None):
+        if not bytes_data:
+            raise ValueError('Expected a binary frame')
+
+        flag, payload = bytes_data[0], bytes_data[1:]
+        if flag == 1:
+            # Bounded, so a small frame cannot inflate into gigabytes
+            decompressor = zlib.decompressobj()
+            try:
+                payload = decompressor.decompress(payload, MAX_FRAME_SIZE)
+            except zlib.error as e:
+                raise ValueError(str(e))
+            if decompressor.unconsumed_tail:
+                raise FrameTooLarge('Frame too large')
+            if not decompressor.eof:
+                raise ValueError('Truncated frame')
+        elif flag != 0:
+            raise ValueError('Unknown frame flag')
+        return super().decode(bytes_data=payload)
+
+
+CODECS = {
+    codec.subprotocol: codec
+    for codec in (MsgpackCodec(), DeflateMsgpackCodec())
+}
+DEFAULT_CODEC = JSONCodec()
+
+
+def negotiate_codec(subprotocols):
+    """Pick the first subprotocol offered by the client that we support"""
+    for subprotocol in subprotocols:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol]
+    return DEFAULT_CODEC
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import User, Transaction
+from .authentication import revoke_tokens
 
 
 @admin.register(User)
@@ -22,11 +23,27 @@ class UserAdmin(BaseUserAdmin):
     search_fields = ('email',)
     ordering = ('email',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and {'role', 'is_active'} & set(form.changed_data):
+            revoke_tokens(obj.pk)
+
+    def delete_model(self, request, obj):
+        user_id = obj.pk
+        super().delete_model(request, obj)
+        revoke_tokens(user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = list(queryset.values_list('pk', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            revoke_tokens(user_id)
+
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'type', 'amount', 'created_at')
     list_filter = ('type', 'created_at')
-    search_fields = ('user__email',)
+    search_fields = ('user__email', 'external_id')
     readonly_fields = ('created_at',)
     ordering = ('-created_at',)
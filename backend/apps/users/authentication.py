@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F, Model
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.core.db import pooled_database_sync_to_async
+
+ROLE_CLAIM = 'role'
+VERSION_CLAIM = 'ver'
+
+# A token is revoked once its ver claim is below the user's token_version.
+# The database holds the version; the cache only keeps it for
+# TOKEN_VERSION_CACHE_TTL seconds, so losing the cache never revives a token
+# and changes made outside revoke_tokens() apply within that time
+
+
+def token_version_key(user_id):
+    return f'auth_token_version:{user_id}'
+
+
+def revoke_tokens(user_id):
+    """
+    Reject every token issued to user_id before now
+    Role and is_active changes bump the version in the database on their own;
+    calling this makes them apply right away instead of after the cache TTL
+    """
+    get_user_model().objects.filter(pk=user_id).update(token_version=F('token_version') + 1)
+    cache.delete(token_version_key(user_id))
+
+
+def current_token_version(user_id):
+    """The user's token_version, or None when the user no longer exists"""
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = get_user_model().objects.filter(pk=user_id).values_list('token_version', flat=True).first()
+        cache.set(key, -1 if version is None else version, timeout=settings.TOKEN_VERSION_CACHE_TTL)
+    return None if version == -1 else version
+
+
+def is_revoked(token):
+    """Check whether token was issued before its user's tokens were revoked"""
+    version = current_token_version(token[api_settings.USER_ID_CLAIM])
+    return version is None or token.get(VERSION_CLAIM, 0) < version
+
+
+async def ais_revoked(token):
+    """Async version of is_revoked for WebSocket connects"""
+    user_id = token[api_settings.USER_ID_CLAIM]
+    version = await cache.aget(token_version_key(user_id))
+    if version is None:
+        version = await pooled_database_sync_to_async(current_token_version)(user_id)
+    elif version == -1:
+        version = None
+    return version is None or token.get(VERSION_CLAIM, 0) < version
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token (and the access tokens derived from it) carrying the user's role"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[ROLE_CLAIM] = user.role
+        token[VERSION_CLAIM] = user.token_version
+        return token
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    User backed by signed token claims
+    - id, pk, role and the auth flags are answered from the token
+    - Anything else loads the User row on first use
+    Tokens are only issued to active users; deactivation bumps token_version
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: get_user_model().objects.get(pk=user_id))
+        self.__dict__['_claims'] = {
+            'id': user_id,
+            'role': token[ROLE_CLAIM],
+        }
+
+    @property
+    def __class__(self):
+        return get_user_model()
+
+    @property
+    def _meta(self):
+        return get_user_model()._meta
+
+    @property
+    def id(self):
+        return self._claims['id']
+
+    @property
+    def pk(self):
+        return self._claims['id']
+
+    @property
+    def role(self):
+        return self._claims['role']
+
+    @property
+    def is_active(self):
+        return True
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        if isinstance(other, ClaimsUser):
+            return other.pk == self.pk
+        if isinstance(other, Model):
+            return other._meta.concrete_model is get_user_model() and other.pk == self.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request user SELECT
+    Tokens carrying a role claim become a ClaimsUser; older tokens load the
+    row as before. Revoked tokens are rejected by token_version
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        if is_revoked(validated_token):
+            raise InvalidToken('Token has been revoked')
+
+        if ROLE_CLAIM in validated_token:
+            return ClaimsUser(validated_token)
+
+        return super().get_user(validated_token)
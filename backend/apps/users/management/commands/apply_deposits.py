@@ -0,0 +1,61 @@
+import csv
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.core.money import Money
+from apps.users.services import WalletService
+
+
+class Command(BaseCommand):
+    help = 'Apply a payment provider settlement file (CSV: user_id,amount,external_id) as deposits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a user_id,amount,external_id header')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of entries applied per statement'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = {'applied': 0, 'duplicates': 0, 'unknown_users': 0}
+
+        with open(options['path'], newline='') as settlements:
+            entries = (self.parse(line, row) for line, row in enumerate(csv.DictReader(settlements), start=2))
+            while True:
+                batch = list(islice(entries, batch_size))
+                if not batch:
+                    break
+
+                result = WalletService.bulk_deposit(batch)
+                for key in totals:
+                    totals[key] += len(result[key])
+                for external_id in result['unknown_users']:
+                    self.stdout.write(self.style.WARNING(f'Unknown user for {external_id}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Applied {totals['applied']} deposits, "
+            f"skipped {totals['duplicates']} duplicates and {totals['unknown_users']} unknown users"
+        ))
+
+    def parse(self, line, row):
+        """(user_id, amount, external_id) of a CSV row"""
+        try:
+            user_id = int(row['user_id'])
+            amount = Decimal(row['amount'])
+            external_id = row['external_id'].strip()
+            if not amount.is_finite():
+                raise ValueError(amount)
+        except (KeyError, TypeError, ValueError, InvalidOperation, AttributeError):
+            raise CommandError(f'Line {line}: expected user_id,amount,external_id')
+
+        if amount <= 0 or amount != amount.quantize(Decimal('0.01')):
+            raise CommandError(f'Line {line}: amount must be positive with at most 2 decimals')
+        if amount > Decimal(settings.WALLET_MAX_AMOUNT):
+            raise CommandError(f'Line {line}: amount must be at most {settings.WALLET_MAX_AMOUNT}')
+        if not external_id or len(external_id) > 100:
+            raise CommandError(f'Line {line}: external_id must be 1-100 characters')
+        return user_id, Money.parse(amount), external_id
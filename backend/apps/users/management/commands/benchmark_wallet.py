@@ -0,0 +1,157 @@
+import itertools
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from rest_framework import serializers
+from apps.core.benchmarking import count_queries, run_concurrently, speedup, throughput, throwaway_database
+from apps.core.money import Money, MoneySerializerField
+from apps.users.models import Transaction
+from apps.users.services import WalletService
+
+User = get_user_model()
+
+
+def legacy_change(user_id, amount, transaction_type):
+    """DepositView / WithdrawView before WalletService: locked read, save, re-read, ledger insert"""
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(pk=user_id)
+        if transaction_type == 'withdraw':
+            if user.balance < amount:
+                raise ValueError("Insufficient balance")
+            user.balance = F('balance') - amount
+        else:
+            user.balance = F('balance') + amount
+        user.save(update_fields=['balance'])
+        user.refresh_from_db()
+        return Transaction.objects.create(user=user, amount=amount, type=transaction_type)
+
+
+def wallet_change(user_id, amount, transaction_type):
+    """The same change through WalletService"""
+    if transaction_type == 'withdraw':
+        return WalletService.withdraw(user_id, amount)
+    return WalletService.deposit(user_id, amount)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark wallet balance changes against a throwaway database'
+    suites = ('wallet', 'money')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suites',
+            nargs='*',
+            help=f"Suites to run: {', '.join(self.suites)} (default: all)"
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[1, 8, 32],
+            help='Numbers of concurrent connections to measure with'
+        )
+        parser.add_argument(
+            '--operations',
+            type=int,
+            default=1000,
+            help='Balance changes per measurement'
+        )
+        parser.add_argument(
+            '--ledger-rows',
+            type=int,
+            default=500000,
+            help='Ledger rows summed by the money suite'
+        )
+
+    def handle(self, *args, **options):
+        suites = options['suites'] or self.suites
+        unknown = set(suites) - set(self.suites)
+        if unknown:
+            raise CommandError(f"Unknown suites: {', '.join(sorted(unknown))}")
+        if min(options['operations'], options['ledger_rows'], *options['workers']) < 1:
+            raise CommandError('--operations, --ledger-rows and --workers must be positive')
+
+        self.options = options
+        with throwaway_database():
+            for suite in suites:
+                getattr(self, f'bench_{suite}')()
+
+    def heading(self, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+
+    def row(self, label, result):
+        self.stdout.write(f'  {label:<34}{result}')
+
+    def bench_wallet(self):
+        """Deposits and withdrawals per second, all on one hot account"""
+        amount = Money.parse('1.00')
+        operations = self.options['operations']
+        self.heading(f'Wallet: {operations} deposits and withdrawals on one account')
+
+        for label, change in (('locked read and save (before)', legacy_change), ('one statement', wallet_change)):
+            user = User.objects.create(email=f'hot{User.objects.count()}@example.com', age=20)
+            queries = count_queries(lambda: change(user.pk, amount, 'deposit'))
+            self.row(label, f'{queries} queries per change')
+
+            for workers in self.options['workers']:
+                types = list(itertools.islice(itertools.cycle(('deposit', 'withdraw')), operations))
+                result = run_concurrently(lambda transaction_type: change(user.pk, amount, transaction_type), types, workers)
+                self.row(f'  {workers} workers', throughput(*result))
+
+            if not self.ledger_matches(user.pk):
+                self.stdout.write(self.style.ERROR('  balance does not match the ledger'))
+
+    @staticmethod
+    def ledger_matches(user_id):
+        """Whether the balance is the opening balance plus the ledger rows"""
+        totals = dict(Transaction.objects.filter(user_id=user_id).values_list('type').annotate(Sum('amount')))
+        opening = User._meta.get_field('balance').get_default()
+        balance = User.objects.values_list('balance', flat=True).get(pk=user_id)
+        return balance == opening + totals.get('deposit', 0) - totals.get('withdraw', 0)
+
+    def bench_money(self):
+        """Integer cents against numeric(10, 2) amounts, in validation and ledger sums"""
+        self.heading('Money: Decimal / numeric -> integer cents')
+
+        decimal_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+        money_field = MoneySerializerField(max_digits=10)
+        self.row('validate an amount', speedup(
+            lambda: decimal_field.run_validation('125.50'),
+            lambda: money_field.run_validation('125.50')
+        ))
+
+        # CreateRoomSerializer's step check: (bet - min_bet) % step
+        bet, min_bet, step = Decimal('125.00'), Decimal('10.00'), Decimal('5.00')
+        bet_cents, min_bet_cents, step_cents = Money.parse(bet), Money.parse(min_bet), Money.parse(step)
+        self.row('check a bet step', speedup(
+            lambda: (bet - min_bet) % step != 0,
+            lambda: (bet_cents - min_bet_cents) % step_cents != 0
+        ))
+
+        rows = self.options['ledger_rows']
+        users = User.objects.bulk_create([User(email=f'ledger{i}@example.com', age=20) for i in range(1000)])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO transactions (user_id, amount, type, created_at) '
+                'SELECT %s + i %% 1000, i %% 100000 + 1, %s, now() FROM generate_series(1, %s) AS i',
+                [users[0].pk, 'bet', rows]
+            )
+            # The same ledger as the former numeric(10, 2) column
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ledger_numeric AS '
+                'SELECT user_id, (amount / 100.0)::numeric(10, 2) AS amount FROM transactions'
+            )
+            cursor.execute('ANALYZE transactions')
+            cursor.execute('ANALYZE ledger_numeric')
+
+            def total(table):
+                cursor.execute(f'SELECT user_id, SUM(amount) FROM {table} GROUP BY user_id')
+                return cursor.fetchall()
+
+            self.row(f'sum {rows} ledger rows per user', speedup(
+                lambda: total('ledger_numeric'),
+                lambda: total('transactions'),
+                number=5
+            ))
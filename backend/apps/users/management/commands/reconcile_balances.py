@@ -0,0 +1,151 @@
+import csv
+import multiprocessing
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+from apps.core.money import Money
+from apps.users.models import Transaction
+
+User = get_user_model()
+
+# How each ledger row type moves the balance
+SIGNS = {
+    'deposit': 1,
+    'win': 1,
+    'refund': 1,
+    'withdraw': -1,
+    'bet': -1,
+}
+
+REPORT_HEADER = ('user_id', 'email', 'balance', 'opening_balance', 'ledger_total', 'expected', 'difference')
+
+
+def reconcile_range(low, high, opening, chunk_size):
+    """
+    Compare the balances of users with low <= id < high against their ledger
+    - Ledger rows are streamed with a server-side cursor into per-user totals
+    - Both reads share one REPEATABLE READ snapshot, so concurrent wallet
+      changes (balance and ledger row in one statement) cannot show up as drift
+    Returns (users checked, ledger rows scanned, discrepancy report rows)
+    """
+    totals = defaultdict(int)
+    scanned = 0
+    checked = 0
+    discrepancies = []
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+        ledger = Transaction.objects.filter(user_id__gte=low, user_id__lt=high).values_list('user_id', 'type', 'amount')
+        for user_id, transaction_type, amount in ledger.iterator(chunk_size=chunk_size):
+            totals[user_id] += SIGNS[transaction_type] * amount
+            scanned += 1
+
+        users = User.objects.filter(id__gte=low, id__lt=high).values_list('id', 'email', 'balance')
+        for user_id, email, balance in users.iterator(chunk_size=chunk_size):
+            checked += 1
+            ledger_total = Money(totals.get(user_id, 0))
+            expected = opening + ledger_total
+            if balance != expected:
+                discrepancies.append((user_id, email, balance, opening, ledger_total, expected, balance - expected))
+
+    return checked, scanned, discrepancies
+
+
+class Command(BaseCommand):
+    help = (
+        'Check every user balance against the sum of their Transaction rows and write a CSV report; '
+        'exits with status 1 when any balance differs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default='balance_discrepancies.csv',
+            help='Path of the CSV discrepancy report'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Number of user ids reconciled per task; bounds the totals kept in memory'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Rows fetched per round trip from the server-side cursors'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of processes reconciling user id ranges in parallel'
+        )
+        parser.add_argument(
+            '--opening-balance',
+            default=None,
+            help='Balance every user started with (default: the User.balance default)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if batch_size < 1 or chunk_size < 1 or workers < 1:
+            raise CommandError('--batch-size, --chunk-size and --workers must be positive')
+
+        if options['opening_balance'] is None:
+            opening = User._meta.get_field('balance').get_default()
+        else:
+            try:
+                opening = Money.parse(options['opening_balance'])
+            except ValueError:
+                raise CommandError('--opening-balance must be a decimal amount')
+
+        bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write(self.style.WARNING('No users found'))
+            return
+
+        ranges = range(bounds['low'], bounds['high'] + 1, batch_size)
+        tasks = (
+            list(ranges),
+            [low + batch_size for low in ranges],
+            [opening] * len(ranges),
+            [chunk_size] * len(ranges),
+        )
+
+        checked = scanned = found = 0
+        with open(options['output'], 'w', newline='') as report:
+            writer = csv.writer(report)
+            writer.writerow(REPORT_HEADER)
+
+            for users, rows, discrepancies in self.run(tasks, workers):
+                checked += users
+                scanned += rows
+                found += len(discrepancies)
+                writer.writerows(discrepancies)
+
+        message = f"Checked {checked} users against {scanned} ledger rows, {found} discrepancies written to {options['output']}"
+        # A non-zero exit status lets cron and CI alert on drift
+        if found:
+            raise CommandError(message)
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def run(self, tasks, workers):
+        """Yield reconcile_range results in user id order"""
+        if workers == 1:
+            yield from map(reconcile_range, *tasks)
+            return
+
+        # Forked workers must open their own connections, not share the parent's
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            yield from executor.map(reconcile_range, *tasks)
@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-18 09:16
+
+import apps.core.money
+from django.db import migrations
+
+
+def to_cents(table, column, precision):
+    """Rewrite a numeric(precision, 2) money column as bigint cents, and back"""
+    return migrations.RunSQL(
+        sql=f'ALTER TABLE "{table}" ALTER COLUMN "{column}" TYPE bigint USING round("{column}" * 100)::bigint',
+        reverse_sql=(
+            f'ALTER TABLE "{table}" ALTER COLUMN "{column}" '
+            f'TYPE numeric({precision}, 2) USING "{column}" / 100.0'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_transaction_external_id'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                to_cents('users', 'balance', 10),
+                to_cents('transactions', 'amount', 10),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='transaction',
+                    name='amount',
+                    field=apps.core.money.MoneyField(),
+                ),
+                migrations.AlterField(
+                    model_name='user',
+                    name='balance',
+                    field=apps.core.money.MoneyField(default=apps.core.money.Money(100000)),
+                ),
+            ],
+        ),
+    ]
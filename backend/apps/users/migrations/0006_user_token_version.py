@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+# Every path that changes role or is_active (admin, API, shell, queryset.update(),
+# raw SQL) revokes the user's tokens. token_version never goes down, so saving
+# a stale instance cannot bring revoked tokens back
+BUMP_TOKEN_VERSION_SQL = """
+    CREATE FUNCTION users_bump_token_version() RETURNS trigger AS $$
+    BEGIN
+        NEW.token_version := GREATEST(NEW.token_version, OLD.token_version);
+        IF NEW.role IS DISTINCT FROM OLD.role OR NEW.is_active IS DISTINCT FROM OLD.is_active THEN
+            NEW.token_version := NEW.token_version + 1;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER users_bump_token_version
+    BEFORE UPDATE OF role, is_active, token_version ON users
+    FOR EACH ROW EXECUTE FUNCTION users_bump_token_version();
+"""
+
+DROP_TOKEN_VERSION_TRIGGER_SQL = """
+    DROP TRIGGER users_bump_token_version ON users;
+    DROP FUNCTION users_bump_token_version();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_transaction_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(sql=BUMP_TOKEN_VERSION_SQL, reverse_sql=DROP_TOKEN_VERSION_TRIGGER_SQL),
+    ]
@@ -2,6 +2,7 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseU
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils import timezone
+from apps.core.money import Money, MoneyField
 
 
 class UserManager(BaseUserManager):
@@ -37,10 +38,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True, max_length=255)
     age = models.IntegerField(validators=[MinValueValidator(18)])
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='player')
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=1000.00)
+    balance = MoneyField(default=Money.parse('1000.00'))
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Tokens carry the version they were issued at; bumping it revokes them.
+    # A database trigger bumps it whenever role or is_active changes
+    token_version = models.PositiveIntegerField(default=0)
     date_joined = models.DateTimeField(default=timezone.now)
 
     objects = UserManager()
@@ -50,6 +54,9 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         db_table = 'users'
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='users_date_joined_idx'),
+        ]
         verbose_name = 'User'
         verbose_name_plural = 'Users'
 
@@ -67,13 +74,27 @@ class Transaction(models.Model):
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField()
     type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
+    # Payment provider reference; a settlement is applied at most once
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    # Client Idempotency-Key of a deposit or withdrawal; booked once per user and type
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'transactions'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='tx_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='tx_user_created_idx'),
+            models.Index(fields=['type', '-created_at', '-id'], name='tx_type_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'type', 'idempotency_key'], name='tx_idempotency_key_uniq'
+            ),
+        ]
         verbose_name = 'Transaction'
         verbose_name_plural = 'Transactions'
 
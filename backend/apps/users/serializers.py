@@ -1,12 +1,20 @@
+from decimal import Decimal
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from apps.core.money import MoneySerializerField
 from .models import Transaction
+from .authentication import ClaimsRefreshToken, is_revoked
 
 User = get_user_model()
 
 
 class UserSerializer(serializers.ModelSerializer):
+    balance = MoneySerializerField(read_only=True)
+
     class Meta:
         model = User
         fields = ('id', 'email', 'age', 'role', 'balance', 'date_joined')
@@ -47,8 +55,31 @@ class LoginSerializer(serializers.Serializer):
 
 class TransactionSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source='user.email', read_only=True)
+    amount = MoneySerializerField(max_digits=10)
 
     class Meta:
         model = Transaction
-        fields = ('id', 'user', 'user_email', 'amount', 'type', 'created_at')
-        read_only_fields = ('id', 'user', 'created_at')
+        fields = ('id', 'user', 'user_email', 'amount', 'type', 'external_id', 'created_at')
+        read_only_fields = ('id', 'user', 'external_id', 'created_at')
+
+
+class BulkDepositEntrySerializer(serializers.Serializer):
+    user = serializers.IntegerField()
+    amount = MoneySerializerField(
+        max_digits=10, min_value=Decimal('0.01'), max_value=Decimal(settings.WALLET_MAX_AMOUNT)
+    )
+    external_id = serializers.CharField(max_length=100)
+
+
+class BulkDepositSerializer(serializers.Serializer):
+    entries = BulkDepositEntrySerializer(many=True, allow_empty=False, max_length=1000)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens issued before their user's tokens were revoked"""
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        if is_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken('Token has been revoked')
+        return super().validate(attrs)
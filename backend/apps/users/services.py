@@ -0,0 +1,238 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from apps.core.money import Money
+from .models import Transaction
+
+User = get_user_model()
+
+# One statement per balance change: the UPDATE ... RETURNING and the ledger
+# INSERT run as a single CTE, so the row lock is held for one round trip.
+# Rows are locked in primary key order so changes touching several users
+# (a game's bets) cannot deadlock with each other. FOR NO KEY UPDATE is the
+# lock an UPDATE of the balance takes anyway; FOR UPDATE would also block the
+# foreign key checks of concurrent inserts referencing the user (ledger rows,
+# guesses, PlayerStats) and deadlock with them.
+_CHANGE_SQL = """
+    WITH locked AS (
+        SELECT id FROM {users}
+        WHERE id = ANY(%(user_ids)s) AND balance + %(delta)s >= 0
+        ORDER BY id
+        FOR NO KEY UPDATE
+    ), changed AS (
+        UPDATE {users} SET balance = {users}.balance + %(delta)s
+        FROM locked
+        WHERE {users}.id = locked.id AND {users}.balance + %(delta)s >= 0
+        RETURNING {users}.id, {users}.email, {users}.balance
+    ), ledger AS (
+        INSERT INTO {transactions} (user_id, amount, type, idempotency_key, created_at)
+        SELECT id, %(amount)s, %(type)s, %(idempotency_key)s, %(created_at)s FROM changed
+        RETURNING id, user_id
+    )
+    SELECT ledger.id, changed.id, changed.email, changed.balance
+    FROM changed JOIN ledger ON ledger.user_id = changed.id
+    ORDER BY changed.id
+"""
+
+
+# Settlement batches from the payment provider in one statement: ledger rows
+# are inserted unless their external_id is already booked, and the balances
+# move by the per-user sum of the rows actually inserted. Postgres runs every
+# data-modifying CTE to completion, so changed needs no reader
+_BULK_DEPOSIT_SQL = """
+    WITH entries AS (
+        SELECT * FROM unnest(%(user_ids)s::bigint[], %(amounts)s::bigint[], %(external_ids)s::text[])
+            WITH ORDINALITY AS entry(user_id, amount, external_id, position)
+    ), inserted AS (
+        INSERT INTO {transactions} (user_id, amount, type, external_id, created_at)
+        SELECT entries.user_id, entries.amount, 'deposit', entries.external_id, %(created_at)s
+        FROM entries JOIN {users} ON {users}.id = entries.user_id
+        ON CONFLICT (external_id) DO NOTHING
+        RETURNING user_id, amount, external_id
+    ), totals AS (
+        SELECT user_id, SUM(amount) AS amount FROM inserted GROUP BY user_id
+    ), locked AS (
+        SELECT {users}.id, totals.amount
+        FROM {users} JOIN totals ON totals.user_id = {users}.id
+        ORDER BY {users}.id
+        FOR NO KEY UPDATE OF {users}
+    ), changed AS (
+        UPDATE {users} SET balance = {users}.balance + locked.amount
+        FROM locked
+        WHERE {users}.id = locked.id
+        RETURNING {users}.id
+    )
+    SELECT entries.external_id, {users}.id IS NOT NULL, inserted.external_id IS NOT NULL
+    FROM entries
+    LEFT JOIN {users} ON {users}.id = entries.user_id
+    LEFT JOIN inserted ON inserted.external_id = entries.external_id
+    ORDER BY entries.position
+"""
+
+
+class WalletService:
+    """
+    Every balance change goes through here
+    - deposit, win and refund credit a user
+    - withdraw and bet debit users, refusing to go below zero
+    - bulk_deposit applies payment provider settlement batches
+    Amounts are Money, or decimal amounts parsed with Money.parse.
+    Each returns the ledger Transaction rows; row.user is loaded with its
+    id, email and new balance
+    deposit and withdraw take the client's idempotency key. It is stored on
+    the ledger row in the same statement, so a retried key returns the row
+    already booked (with replayed set) instead of moving money twice
+    """
+
+    @staticmethod
+    def deposit(user_id, amount, idempotency_key=None):
+        """Credit a deposit, returns the ledger row"""
+        return WalletService._change_once(user_id, amount, 'deposit', idempotency_key)
+
+    @staticmethod
+    def withdraw(user_id, amount, idempotency_key=None):
+        """Debit a withdrawal, returns the ledger row"""
+        record = WalletService._change_once(user_id, -amount, 'withdraw', idempotency_key)
+        if record is None:
+            raise ValueError("Insufficient balance")
+        return record
+
+    @staticmethod
+    def bet(user_ids, amount):
+        """
+        Debit the same bet from every user, or from none of them
+        Returns the ledger rows in user id order
+        """
+        user_ids = sorted(user_ids)
+        with transaction.atomic():
+            records = WalletService._change(user_ids, -amount, 'bet')
+            if len(records) != len(user_ids):
+                transaction.set_rollback(True)
+
+        if len(records) != len(user_ids):
+            debited = {record.user_id for record in records}
+            email = User.objects.filter(
+                pk__in=[user_id for user_id in user_ids if user_id not in debited]
+            ).values_list('email', flat=True).first()
+            raise ValueError(f"Player {email} has insufficient balance")
+        return records
+
+    @staticmethod
+    def win(user_id, amount):
+        """Credit game winnings, returns the ledger row"""
+        return WalletService._change([user_id], amount, 'win')[0]
+
+    @staticmethod
+    def refund(user_id, amount):
+        """Give back a bet, returns the ledger row"""
+        return WalletService._change([user_id], amount, 'refund')[0]
+
+    @staticmethod
+    def bulk_deposit(entries):
+        """
+        Apply a batch of provider settlements as deposits
+        - entries: iterable of (user_id, amount, external_id)
+        - external_ids already in the ledger, or repeated in the batch, are skipped
+        - One statement inserts the ledger rows and applies one UPDATE per user
+        Returns {'applied': [...], 'duplicates': [...], 'unknown_users': [...]}
+        of external_ids; applied and unknown_users keep the batch order
+        """
+        batch = {}
+        duplicates = []
+        for user_id, amount, external_id in entries:
+            if external_id in batch:
+                duplicates.append(external_id)
+            else:
+                batch[external_id] = (user_id, amount)
+
+        result = {'applied': [], 'duplicates': duplicates, 'unknown_users': []}
+        if not batch:
+            return result
+
+        sql = _BULK_DEPOSIT_SQL.format(
+            users=connection.ops.quote_name(User._meta.db_table),
+            transactions=connection.ops.quote_name(Transaction._meta.db_table)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'user_ids': [user_id for user_id, _ in batch.values()],
+                'amounts': [int(Money.parse(amount)) for _, amount in batch.values()],
+                'external_ids': list(batch),
+                'created_at': timezone.now(),
+            })
+            rows = cursor.fetchall()
+
+        for external_id, known_user, inserted in rows:
+            if inserted:
+                result['applied'].append(external_id)
+            elif known_user:
+                result['duplicates'].append(external_id)
+            else:
+                result['unknown_users'].append(external_id)
+        return result
+
+    @staticmethod
+    def _change_once(user_id, delta, transaction_type, idempotency_key):
+        """
+        _change for one user, applied at most once per idempotency key
+        Returns the ledger row, or None when the balance would go negative
+        """
+        if idempotency_key is None:
+            records = WalletService._change([user_id], delta, transaction_type)
+            return records[0] if records else None
+
+        record = WalletService._booked(user_id, transaction_type, idempotency_key)
+        if record is not None:
+            return record
+        try:
+            with transaction.atomic():
+                records = WalletService._change([user_id], delta, transaction_type, idempotency_key)
+        except IntegrityError:
+            # A concurrent request with the same key was booked first
+            return WalletService._booked(user_id, transaction_type, idempotency_key)
+        return records[0] if records else None
+
+    @staticmethod
+    def _booked(user_id, transaction_type, idempotency_key):
+        """The ledger row already booked for an idempotency key, or None"""
+        record = Transaction.objects.select_related('user').filter(
+            user_id=user_id, type=transaction_type, idempotency_key=idempotency_key
+        ).first()
+        if record is not None:
+            record.replayed = True
+        return record
+
+    @staticmethod
+    def _change(user_ids, delta, transaction_type, idempotency_key=None):
+        """
+        Add delta to the balance of user_ids and write a ledger row for each
+        Users whose balance would go negative are left untouched and get no row
+        """
+        delta = Money.parse(delta)
+        sql = _CHANGE_SQL.format(
+            users=connection.ops.quote_name(User._meta.db_table),
+            transactions=connection.ops.quote_name(Transaction._meta.db_table)
+        )
+        created_at = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'user_ids': list(user_ids),
+                'delta': int(delta),
+                'amount': int(abs(delta)),
+                'type': transaction_type,
+                'idempotency_key': idempotency_key,
+                'created_at': created_at,
+            })
+            rows = cursor.fetchall()
+
+        return [
+            Transaction(
+                id=transaction_id,
+                user=User.from_db(connection.alias, ['id', 'email', 'balance'], [user_id, email, Money(balance)]),
+                amount=abs(delta),
+                type=transaction_type,
+                idempotency_key=idempotency_key,
+                created_at=created_at
+            )
+            for transaction_id, user_id, email, balance in rows
+        ]
@@ -0,0 +1,568 @@
+import csv
+import io
+import os
+import tempfile
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from apps.core import idempotency
+from apps.core.money import Money
+from apps.core.testing import TEST_SETTINGS, QueryBudgetMixin, QueryPlanMixin, analyze, api_client, race
+from .authentication import ClaimsJWTAuthentication, ClaimsRefreshToken, ClaimsUser, revoke_tokens
+from .models import Transaction
+from .services import WalletService
+
+User = get_user_model()
+
+
+@override_settings(**TEST_SETTINGS)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Wallet and admin user endpoints run a fixed number of queries, whatever the number of rows"""
+
+    def setUp(self):
+        self.player = self.create_user('player@example.com')
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.player_client = api_client(self.player)
+        self.admin_client = api_client(self.admin)
+
+    @staticmethod
+    def create_user(email, **extra_fields):
+        return User.objects.create_user(email=email, password='secret', age=20, **extra_fields)
+
+    def seed(self):
+        """Three more users, each with ledger rows, and more rows for self.player"""
+        for _ in range(3):
+            user = self.create_user(f'user{User.objects.count()}@example.com')
+            Transaction.objects.bulk_create([
+                Transaction(user=user, amount=Money.parse('5.00'), type='deposit'),
+                Transaction(user=self.player, amount=Money.parse('2.50'), type='withdraw'),
+            ])
+
+    def test_transaction_history(self):
+        self.assertQueryBudget(self.player_client, '/api/auth/wallet/transactions/', 1, self.seed)
+
+    def test_profile(self):
+        self.assertQueryBudget(self.player_client, '/api/auth/profile/', 1, self.seed)
+
+    def test_admin_transactions(self):
+        self.assertQueryBudget(self.admin_client, '/api/auth/admin/transactions/', 1, self.seed)
+
+    def test_admin_transactions_by_type(self):
+        self.assertQueryBudget(self.admin_client, '/api/auth/admin/transactions/?type=deposit', 1, self.seed)
+
+    def test_admin_users(self):
+        self.assertQueryBudget(self.admin_client, '/api/auth/admin/users/', 1, self.seed)
+
+    def test_admin_user_detail(self):
+        url = f'/api/auth/admin/users/{self.player.pk}/'
+        self.assertQueryBudget(self.admin_client, url, 1, self.seed)
+
+
+@override_settings(**TEST_SETTINGS)
+class QueryPlanTests(QueryPlanMixin, TestCase):
+    """Ledger and user lists stay on their indexes on a production-sized data set"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(email=f'user{i}@example.com', age=20) for i in range(2000)] +
+            [User(email='admin@example.com', age=20, role='admin')]
+        )
+        cls.player = users[0]
+        cls.admin = users[-1]
+
+        # Mostly bets and wins, the odd deposit, withdrawal or refund
+        types = ['bet', 'win'] * 48 + ['deposit', 'deposit', 'withdraw', 'refund']
+        Transaction.objects.bulk_create([
+            Transaction(user=users[i % 2000], amount=Money.parse('10.00'), type=types[i % len(types)])
+            for i in range(40000)
+        ], batch_size=5000)
+        analyze()
+
+    def setUp(self):
+        self.player_client = api_client(self.player)
+        self.admin_client = api_client(self.admin)
+
+    def test_transaction_history(self):
+        self.assertNoSeqScan(self.player_client, '/api/auth/wallet/transactions/')
+
+    def test_admin_transactions(self):
+        response = self.assertNoSeqScan(self.admin_client, '/api/auth/admin/transactions/')
+        self.assertNoSeqScan(self.admin_client, response.data['next'])
+
+    def test_admin_transactions_by_type(self):
+        self.assertNoSeqScan(self.admin_client, '/api/auth/admin/transactions/?type=refund')
+
+    def test_admin_transactions_by_user(self):
+        self.assertNoSeqScan(self.admin_client, f'/api/auth/admin/transactions/?user_id={self.player.pk}')
+
+    def test_admin_users(self):
+        response = self.assertNoSeqScan(self.admin_client, '/api/auth/admin/users/', tables=('users',))
+        self.assertNoSeqScan(self.admin_client, response.data['next'], tables=('users',))
+
+
+@override_settings(**TEST_SETTINGS)
+class TokenTests(TestCase):
+    """Claims tokens authenticate without a user SELECT and stop working once revoked"""
+
+    def setUp(self):
+        self.player = User.objects.create_user(email='player@example.com', password='secret', age=20)
+        self.admin = User.objects.create_user(email='admin@example.com', password='secret', age=20, role='admin')
+        self.refresh = ClaimsRefreshToken.for_user(self.player)
+
+    def authenticate(self, token):
+        authentication = ClaimsJWTAuthentication()
+        return authentication.get_user(authentication.get_validated_token(str(token)))
+
+    def token_version(self):
+        return User.objects.values_list('token_version', flat=True).get(pk=self.player.pk)
+
+    def test_claims_user_from_token(self):
+        self.authenticate(self.refresh.access_token)
+        # The token version is cached now, the user comes from the claims alone
+        with self.assertNumQueries(0):
+            user = self.authenticate(self.refresh.access_token)
+
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.role), (self.player.pk, 'player'))
+        self.assertEqual(user, self.player)
+        self.assertEqual(user.email, 'player@example.com')
+
+    def test_token_without_claims_loads_user(self):
+        user = self.authenticate(RefreshToken.for_user(self.player).access_token)
+
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertEqual(user.pk, self.player.pk)
+
+    def test_revoked_token_rejected(self):
+        self.authenticate(self.refresh.access_token)
+        revoke_tokens(self.player.pk)
+
+        with self.assertRaises(InvalidToken):
+            self.authenticate(self.refresh.access_token)
+        # Tokens issued afterwards work
+        self.player.refresh_from_db()
+        self.assertEqual(api_client(self.player).get('/api/auth/profile/').status_code, 200)
+
+    def test_deleted_user_rejected(self):
+        self.player.delete()
+        with self.assertRaises(InvalidToken):
+            self.authenticate(self.refresh.access_token)
+
+    def test_revoked_refresh_rejected(self):
+        url = '/api/auth/token/refresh/'
+        response = self.client.post(url, {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 200)
+
+        revoke_tokens(self.player.pk)
+        response = self.client.post(url, {'refresh': response.data['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_trigger_bumps_version_on_claim_changes(self):
+        User.objects.filter(pk=self.player.pk).update(age=30)
+        self.assertEqual(self.token_version(), 0)
+
+        User.objects.filter(pk=self.player.pk).update(role='admin')
+        self.assertEqual(self.token_version(), 1)
+
+        User.objects.filter(pk=self.player.pk).update(is_active=False)
+        self.assertEqual(self.token_version(), 2)
+
+    def test_stale_save_keeps_version(self):
+        revoke_tokens(self.player.pk)
+        # self.player still holds token_version 0
+        self.player.age = 30
+        self.player.save()
+        self.assertEqual(self.token_version(), 1)
+
+    def test_admin_edit_keeps_tokens(self):
+        url = f'/api/auth/admin/users/{self.player.pk}/'
+        response = api_client(self.admin).patch(url, {'age': 30, 'email': 'renamed@example.com'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.token_version(), 0)
+        self.assertIsInstance(self.authenticate(self.refresh.access_token), ClaimsUser)
+
+    def test_admin_delete_revokes_tokens(self):
+        client = api_client(self.player)
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 200)
+
+        response = api_client(self.admin).delete(f'/api/auth/admin/users/{self.player.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 401)
+
+
+def balance(user):
+    return User.objects.values_list('balance', flat=True).get(pk=user.pk)
+
+
+@override_settings(**TEST_SETTINGS)
+class WalletTests(TestCase):
+    """Single-statement balance changes and the ledger rows they return"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(email='alice@example.com', password='secret', age=20)
+        self.bob = User.objects.create_user(
+            email='bob@example.com', password='secret', age=20, balance=Money.parse('5.00')
+        )
+
+    def assertLedgerRow(self, record, user, amount, transaction_type):
+        row = Transaction.objects.get(pk=record.pk)
+        self.assertEqual((row.user_id, row.amount, row.type), (user.pk, Money.parse(amount), transaction_type))
+        self.assertEqual((record.user_id, record.amount, record.type), (user.pk, Money.parse(amount), transaction_type))
+        self.assertEqual(record.user.balance, balance(user))
+
+    def test_deposit(self):
+        record = WalletService.deposit(self.alice.pk, Money.parse('12.50'))
+
+        self.assertLedgerRow(record, self.alice, '12.50', 'deposit')
+        self.assertEqual(balance(self.alice), Money.parse('1012.50'))
+        self.assertEqual(record.user.email, 'alice@example.com')
+
+    def test_withdraw(self):
+        record = WalletService.withdraw(self.bob.pk, Money.parse('5.00'))
+
+        self.assertLedgerRow(record, self.bob, '5.00', 'withdraw')
+        self.assertEqual(balance(self.bob), 0)
+
+    def test_withdraw_refuses_overdraft(self):
+        with self.assertRaises(ValueError):
+            WalletService.withdraw(self.bob.pk, Money.parse('5.01'))
+
+        self.assertEqual(balance(self.bob), Money.parse('5.00'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_bet(self):
+        records = WalletService.bet([self.bob.pk, self.alice.pk], Money.parse('5.00'))
+
+        # In user id order, whatever the order asked for
+        self.assertEqual([record.user_id for record in records], [self.alice.pk, self.bob.pk])
+        self.assertLedgerRow(records[0], self.alice, '5.00', 'bet')
+        self.assertLedgerRow(records[1], self.bob, '5.00', 'bet')
+
+    def test_bet_is_all_or_nothing(self):
+        with self.assertRaisesMessage(ValueError, 'bob@example.com'):
+            WalletService.bet([self.alice.pk, self.bob.pk], Money.parse('10.00'))
+
+        self.assertEqual(balance(self.alice), Money.parse('1000.00'))
+        self.assertEqual(balance(self.bob), Money.parse('5.00'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_win(self):
+        record = WalletService.win(self.bob.pk, Money.parse('20.00'))
+
+        self.assertLedgerRow(record, self.bob, '20.00', 'win')
+        self.assertEqual(balance(self.bob), Money.parse('25.00'))
+
+    def test_refund(self):
+        record = WalletService.refund(self.bob.pk, Money.parse('10.00'))
+
+        self.assertLedgerRow(record, self.bob, '10.00', 'refund')
+        self.assertEqual(balance(self.bob), Money.parse('15.00'))
+
+
+@override_settings(**TEST_SETTINGS)
+class BulkDepositTests(TestCase):
+    """Settlement batches: every entry is applied, skipped as a duplicate or an unknown user"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(email='alice@example.com', password='secret', age=20)
+        self.bob = User.objects.create_user(email='bob@example.com', password='secret', age=20)
+        self.unknown_id = self.bob.pk + 1000
+
+    def test_applies_per_user_totals(self):
+        result = WalletService.bulk_deposit([
+            (self.alice.pk, Money.parse('10.00'), 'ext-1'),
+            (self.bob.pk, Money.parse('2.50'), 'ext-2'),
+            (self.alice.pk, Money.parse('0.25'), 'ext-3'),
+        ])
+
+        self.assertEqual(result, {'applied': ['ext-1', 'ext-2', 'ext-3'], 'duplicates': [], 'unknown_users': []})
+        self.assertEqual(balance(self.alice), Money.parse('1010.25'))
+        self.assertEqual(balance(self.bob), Money.parse('1002.50'))
+        self.assertEqual(Transaction.objects.filter(type='deposit').count(), 3)
+
+    def test_duplicates_in_batch(self):
+        result = WalletService.bulk_deposit([
+            (self.alice.pk, Money.parse('10.00'), 'ext-1'),
+            (self.alice.pk, Money.parse('10.00'), 'ext-1'),
+        ])
+
+        self.assertEqual(result, {'applied': ['ext-1'], 'duplicates': ['ext-1'], 'unknown_users': []})
+        self.assertEqual(balance(self.alice), Money.parse('1010.00'))
+
+    def test_already_booked(self):
+        WalletService.bulk_deposit([(self.alice.pk, Money.parse('10.00'), 'ext-1')])
+        result = WalletService.bulk_deposit([
+            (self.alice.pk, Money.parse('10.00'), 'ext-1'),
+            (self.bob.pk, Money.parse('5.00'), 'ext-2'),
+        ])
+
+        self.assertEqual(result, {'applied': ['ext-2'], 'duplicates': ['ext-1'], 'unknown_users': []})
+        self.assertEqual(balance(self.alice), Money.parse('1010.00'))
+        self.assertEqual(balance(self.bob), Money.parse('1005.00'))
+
+    def test_unknown_users(self):
+        result = WalletService.bulk_deposit([
+            (self.unknown_id, Money.parse('10.00'), 'ext-1'),
+            (self.bob.pk, Money.parse('5.00'), 'ext-2'),
+        ])
+
+        self.assertEqual(result, {'applied': ['ext-2'], 'duplicates': [], 'unknown_users': ['ext-1']})
+        self.assertFalse(Transaction.objects.filter(external_id='ext-1').exists())
+        self.assertEqual(balance(self.bob), Money.parse('1005.00'))
+
+    def apply(self, lines, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as settlements:
+            settlements.write('\n'.join(['user_id,amount,external_id', *lines]) + '\n')
+            settlements.flush()
+            out = io.StringIO()
+            call_command('apply_deposits', settlements.name, stdout=out, **options)
+            return out.getvalue()
+
+    def test_apply_deposits(self):
+        WalletService.bulk_deposit([(self.bob.pk, Money.parse('1.00'), 'ext-0')])
+        output = self.apply([
+            f'{self.alice.pk},10.00,ext-1',
+            f'{self.alice.pk},10.00,ext-1',
+            f'{self.bob.pk},1.00,ext-0',
+            f'{self.unknown_id},3.00,ext-2',
+            f'{self.bob.pk},4.50,ext-3',
+        ], batch_size=2)
+
+        self.assertIn('Applied 2 deposits, skipped 2 duplicates and 1 unknown users', output)
+        self.assertIn('Unknown user for ext-2', output)
+        self.assertEqual(balance(self.alice), Money.parse('1010.00'))
+        self.assertEqual(balance(self.bob), Money.parse('1005.50'))
+
+    def test_apply_deposits_rejects_bad_lines(self):
+        for line in (f'{self.alice.pk},NaN,ext-1', f'{self.alice.pk},1.005,ext-1', f'{self.alice.pk},-1,ext-1'):
+            with self.assertRaises(CommandError):
+                self.apply([line])
+        self.assertFalse(Transaction.objects.exists())
+
+
+@override_settings(**TEST_SETTINGS)
+class IdempotencyTests(TestCase):
+    """Deposits and withdrawals retried with the same Idempotency-Key move money once"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.player = User.objects.create_user(email='player@example.com', password='secret', age=20)
+        self.client = api_client(self.player)
+
+    def post(self, operation, amount, key='key-1', client=None):
+        return (client or self.client).post(
+            f'/api/auth/wallet/{operation}/', {'amount': amount}, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_replay(self):
+        first = self.post('deposit', '10.00')
+        retry = self.post('deposit', '10.00')
+
+        self.assertEqual((first.status_code, retry.status_code), (200, 200))
+        self.assertNotIn(idempotency.REPLAYED_HEADER, first)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(balance(self.player), Money.parse('1010.00'))
+        self.assertEqual(Transaction.objects.filter(user=self.player).count(), 1)
+
+    def test_replays_refusals(self):
+        first = self.post('withdraw', '2000.00')
+        self.post('deposit', '1000.00', key='key-2')
+        retry = self.post('withdraw', '2000.00')
+
+        self.assertEqual((first.status_code, retry.status_code), (400, 400))
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(balance(self.player), Money.parse('2000.00'))
+
+    def test_key_reused_with_different_body(self):
+        self.post('withdraw', '10.00')
+        response = self.post('withdraw', '20.00')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(balance(self.player), Money.parse('990.00'))
+
+    def test_retry_while_running(self):
+        # As while the first request with the key is still running
+        idempotency.begin(idempotency.idempotency_cache_key(self.player.pk, 'deposit', 'key-1'))
+        response = self.post('deposit', '10.00')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(balance(self.player), Money.parse('1000.00'))
+
+    def test_ledger_replay_after_cache_loss(self):
+        first = self.post('deposit', '10.00')
+        cache.clear()
+        retry = self.post('deposit', '10.00')
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(retry.data['transaction']['id'], first.data['transaction']['id'])
+        self.assertEqual(balance(self.player), Money.parse('1010.00'))
+
+    def test_ledger_refuses_different_amount_after_cache_loss(self):
+        self.post('withdraw', '10.00')
+        cache.clear()
+        response = self.post('withdraw', '20.00')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(balance(self.player), Money.parse('990.00'))
+
+    def test_failed_request_releases_key(self):
+        with mock.patch.object(WalletService, 'deposit', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post('deposit', '10.00')
+        response = self.post('deposit', '10.00')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(balance(self.player), Money.parse('1010.00'))
+
+    def test_keys_are_per_user_and_operation(self):
+        other = User.objects.create_user(email='other@example.com', password='secret', age=20)
+        self.post('deposit', '10.00')
+        self.post('withdraw', '10.00')
+        self.post('deposit', '10.00', client=api_client(other))
+
+        self.assertEqual(balance(self.player), Money.parse('1000.00'))
+        self.assertEqual(balance(other), Money.parse('1010.00'))
+
+    def test_invalid_key(self):
+        response = self.post('deposit', '10.00', key='x' * (idempotency.MAX_KEY_LENGTH + 1))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(balance(self.player), Money.parse('1000.00'))
+
+
+@override_settings(**TEST_SETTINGS)
+class WalletRaceTests(TransactionTestCase):
+    """Concurrent balance changes, each on its own connection"""
+
+    def create_users(self, count, amount):
+        return User.objects.bulk_create([
+            User(email=f'user{i}@example.com', age=20, balance=Money.parse(amount)) for i in range(count)
+        ])
+
+    def test_concurrent_withdrawals(self):
+        user, = self.create_users(1, '100.00')
+
+        def withdraw(_):
+            try:
+                return WalletService.withdraw(user.pk, Money.parse('10.00'))
+            except ValueError:
+                return None
+
+        records = race(withdraw, range(25))
+
+        self.assertEqual(len([record for record in records if record is not None]), 10)
+        self.assertEqual(balance(user), 0)
+        self.assertEqual(Transaction.objects.filter(user=user, type='withdraw').count(), 10)
+
+    def test_concurrent_bets_between_shared_players(self):
+        users = self.create_users(4, '1000.00')
+        # Every pair, seated both ways round, several times over
+        pairs = [(a.pk, b.pk) for a in users for b in users if a != b] * 10
+
+        records = race(lambda pair: WalletService.bet(pair, Money.parse('1.00')), pairs)
+
+        self.assertEqual(len(records), len(pairs))
+        for user in users:
+            bets = Transaction.objects.filter(user=user, type='bet').count()
+            self.assertEqual(bets, 60)
+            self.assertEqual(balance(user), Money.parse('1000.00') - Money.parse('1.00') * bets)
+
+    def test_hot_account(self):
+        user, = self.create_users(1, '100.00')
+        changes = [WalletService.deposit, WalletService.withdraw] * 100
+
+        race(lambda change: change(user.pk, Money.parse('1.00')), changes)
+
+        self.assertEqual(balance(user), Money.parse('100.00'))
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 200)
+
+    def test_concurrent_retries(self):
+        user, = self.create_users(1, '100.00')
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        def deposit(_):
+            return api_client(user).post(
+                '/api/auth/wallet/deposit/', {'amount': '10.00'}, format='json', HTTP_IDEMPOTENCY_KEY='key-1'
+            )
+
+        responses = race(deposit, range(20), workers=8)
+
+        booked = [response for response in responses if response.status_code == 200]
+        self.assertTrue(booked)
+        self.assertEqual(len({response.data['transaction']['id'] for response in booked}), 1)
+        self.assertEqual({response.status_code for response in responses} - {200, 409}, set())
+        self.assertEqual(balance(user), Money.parse('110.00'))
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 1)
+
+    def test_concurrent_retries_without_cache(self):
+        user, = self.create_users(1, '100.00')
+
+        # As if the cache had lost the key: only the ledger's unique key dedupes them
+        records = race(lambda _: WalletService.deposit(user.pk, Money.parse('10.00'), 'key-1'), range(20), workers=8)
+
+        self.assertEqual(len({record.pk for record in records}), 1)
+        self.assertEqual(balance(user), Money.parse('110.00'))
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 1)
+
+
+@override_settings(**TEST_SETTINGS)
+class ReconcileBalancesTests(TransactionTestCase):
+    """reconcile_balances reports balances that differ from their ledger, and fails"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f'user{i}@example.com', password='secret', age=20) for i in range(5)
+        ]
+        for user in self.users:
+            WalletService.deposit(user.pk, Money.parse('10.00'))
+            WalletService.withdraw(user.pk, Money.parse('2.50'))
+        WalletService.bet([self.users[0].pk, self.users[1].pk], Money.parse('5.00'))
+        WalletService.win(self.users[0].pk, Money.parse('10.00'))
+
+        report = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+        report.close()
+        self.addCleanup(os.remove, report.name)
+        self.output = report.name
+
+    def reconcile(self, workers=1):
+        out = io.StringIO()
+        call_command('reconcile_balances', output=self.output, workers=workers, batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def report(self):
+        with open(self.output, newline='') as report:
+            return list(csv.DictReader(report))
+
+    def test_balances_match(self):
+        output = self.reconcile()
+
+        self.assertIn('Checked 5 users against 13 ledger rows, 0 discrepancies', output)
+        self.assertEqual(self.report(), [])
+
+    def test_reports_drift(self):
+        corrupted = self.users[3]
+        # A balance changed without a ledger row
+        User.objects.filter(pk=corrupted.pk).update(balance=F('balance') + Money.parse('1.25'))
+
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                with self.assertRaisesMessage(CommandError, '1 discrepancies'):
+                    self.reconcile(workers)
+
+                row, = self.report()
+                self.assertEqual(row['user_id'], str(corrupted.pk))
+                self.assertEqual(row['email'], corrupted.email)
+                self.assertEqual(row['balance'], '1008.75')
+                self.assertEqual(row['expected'], '1007.50')
+                self.assertEqual(row['difference'], '1.25')
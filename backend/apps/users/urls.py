@@ -3,7 +3,8 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     RegisterView, LoginView, UserProfileView, LogoutView,
     TransactionHistoryView, DepositView, WithdrawView,
-    AdminUsersListView, AdminUserDetailView, AdminTransactionsListView
+    AdminUsersListView, AdminUserDetailView, AdminTransactionsListView,
+    AdminBulkDepositView
 )
 
 app_name = 'users'
@@ -24,4 +25,5 @@ urlpatterns = [
     path('admin/users/', AdminUsersListView.as_view(), name='admin_users_list'),
     path('admin/users/<int:pk>/', AdminUserDetailView.as_view(), name='admin_user_detail'),
     path('admin/transactions/', AdminTransactionsListView.as_view(), name='admin_transactions_list'),
+    path('admin/wallet/bulk-deposit/', AdminBulkDepositView.as_view(), name='admin_bulk_deposit'),
 ]
@@ -3,12 +3,19 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
-from django.db import transaction
-from django.db.models import F
-from decimal import Decimal
-from .serializers import RegisterSerializer, UserSerializer, LoginSerializer, TransactionSerializer
+from .serializers import (
+    RegisterSerializer, UserSerializer, LoginSerializer, TransactionSerializer,
+    BulkDepositSerializer
+)
 from .models import Transaction
+from .authentication import ClaimsRefreshToken, revoke_tokens
+from .services import WalletService
+from apps.core.idempotency import (
+    IDEMPOTENCY_HEADER, MISMATCH_MESSAGE, REPLAYED_HEADER, idempotent, is_valid_key
+)
+from apps.core.money import Money
 
 User = get_user_model()
 
@@ -24,7 +31,7 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
 
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
 
         return Response({
             'user': UserSerializer(user).data,
@@ -60,7 +67,7 @@ class LoginView(APIView):
             }, status=status.HTTP_403_FORBIDDEN)
 
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
 
         return Response({
             'user': UserSerializer(user).data,
@@ -103,13 +110,34 @@ class TransactionHistoryView(generics.ListAPIView):
     serializer_class = TransactionSerializer
 
     def get_queryset(self):
-        return Transaction.objects.filter(user=self.request.user)
+        return Transaction.objects.select_related('user').filter(user_id=self.request.user.pk)
+
+
+def ledger_idempotency_key(request):
+    """The request's Idempotency-Key, stored on the ledger row so a retry never books twice"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    return key if is_valid_key(key) else None
+
+
+def wallet_response(message, transaction_record, amount):
+    """Deposit / withdraw response; a row replayed from the ledger carries the current balance"""
+    replayed = getattr(transaction_record, 'replayed', False)
+    if replayed and transaction_record.amount != amount:
+        return Response({
+            'error': MISMATCH_MESSAGE
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    return Response({
+        'message': message,
+        'transaction': TransactionSerializer(transaction_record).data,
+        'new_balance': transaction_record.user.balance.to_decimal()
+    }, status=status.HTTP_200_OK, headers={REPLAYED_HEADER: 'true'} if replayed else None)
 
 
 class DepositView(APIView):
     permission_classes = (IsAuthenticated,)
 
-    @transaction.atomic
+    @idempotent('deposit')
     def post(self, request):
         amount = request.data.get('amount')
 
@@ -119,8 +147,8 @@ class DepositView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            amount = Decimal(str(amount))
-        except Exception:
+            amount = Money.parse(amount)
+        except ValueError:
             return Response({
                 'error': 'Invalid amount format'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -130,30 +158,22 @@ class DepositView(APIView):
                 'error': 'Amount must be greater than 0'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Atomic balance update
-        user = User.objects.select_for_update().get(pk=request.user.pk)
-        user.balance = F('balance') + amount
-        user.save(update_fields=['balance'])
-        user.refresh_from_db()
-
-        # Create transaction record
-        transaction_record = Transaction.objects.create(
-            user=user,
-            amount=amount,
-            type='deposit'
-        )
+        max_amount = Money.parse(settings.WALLET_MAX_AMOUNT)
+        if amount > max_amount:
+            return Response({
+                'error': f'Amount must be at most {max_amount}'
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            'message': 'Deposit successful',
-            'transaction': TransactionSerializer(transaction_record).data,
-            'new_balance': user.balance
-        }, status=status.HTTP_200_OK)
+        # Balance update and ledger row in one statement
+        transaction_record = WalletService.deposit(request.user.pk, amount, ledger_idempotency_key(request))
+
+        return wallet_response('Deposit successful', transaction_record, amount)
 
 
 class WithdrawView(APIView):
     permission_classes = (IsAuthenticated,)
 
-    @transaction.atomic
+    @idempotent('withdraw')
     def post(self, request):
         amount = request.data.get('amount')
 
@@ -163,8 +183,8 @@ class WithdrawView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            amount = Decimal(str(amount))
-        except Exception:
+            amount = Money.parse(amount)
+        except ValueError:
             return Response({
                 'error': 'Invalid amount format'
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -174,30 +194,21 @@ class WithdrawView(APIView):
                 'error': 'Amount must be greater than 0'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Atomic balance update with lock
-        user = User.objects.select_for_update().get(pk=request.user.pk)
-
-        if user.balance < amount:
+        max_amount = Money.parse(settings.WALLET_MAX_AMOUNT)
+        if amount > max_amount:
             return Response({
-                'error': 'Insufficient balance'
+                'error': f'Amount must be at most {max_amount}'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        user.balance = F('balance') - amount
-        user.save(update_fields=['balance'])
-        user.refresh_from_db()
-
-        # Create transaction record
-        transaction_record = Transaction.objects.create(
-            user=user,
-            amount=amount,
-            type='withdraw'
-        )
+        # Balance check, update and ledger row in one statement
+        try:
+            transaction_record = WalletService.withdraw(request.user.pk, amount, ledger_idempotency_key(request))
+        except ValueError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            'message': 'Withdrawal successful',
-            'transaction': TransactionSerializer(transaction_record).data,
-            'new_balance': user.balance
-        }, status=status.HTTP_200_OK)
+        return wallet_response('Withdrawal successful', transaction_record, amount)
 
 
 # Admin-only permission class
@@ -213,6 +224,7 @@ class AdminUsersListView(generics.ListAPIView):
     permission_classes = (IsAdminUser,)
     serializer_class = UserSerializer
     queryset = User.objects.all().order_by('-date_joined')
+    cursor_field = 'date_joined'
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -234,11 +246,25 @@ class AdminUserDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializer
     queryset = User.objects.all()
 
+    def perform_update(self, serializer):
+        user = serializer.instance
+        claims = (user.role, user.is_active)
+        super().perform_update(serializer)
+        # Only role and is_active reach the tokens; the trigger already bumped
+        # token_version, revoking clears the cached version right away
+        if (user.role, user.is_active) != claims:
+            revoke_tokens(user.pk)
+
+    def perform_destroy(self, instance):
+        user_id = instance.pk
+        super().perform_destroy(instance)
+        revoke_tokens(user_id)
+
 
 class AdminTransactionsListView(generics.ListAPIView):
     permission_classes = (IsAdminUser,)
     serializer_class = TransactionSerializer
-    queryset = Transaction.objects.all().order_by('-created_at')
+    queryset = Transaction.objects.select_related('user').order_by('-created_at')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -253,3 +279,23 @@ class AdminTransactionsListView(generics.ListAPIView):
             queryset = queryset.filter(type=transaction_type)
 
         return queryset
+
+
+class AdminBulkDepositView(APIView):
+    """
+    Apply a batch of payment provider settlements
+    Body: {"entries": [{"user": id, "amount": "10.00", "external_id": "..."}]}
+    Entries whose external_id was already applied are reported, not re-applied
+    """
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request):
+        serializer = BulkDepositSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = WalletService.bulk_deposit(
+            (entry['user'], entry['amount'], entry['external_id'])
+            for entry in serializer.validated_data['entries']
+        )
+
+        return Response(result, status=status.HTTP_200_OK)
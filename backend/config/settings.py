@@ -155,13 +155,27 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.users.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.KeysetPagination',
+    'DEFAULT_RENDERER_CLASSES': (
+        'apps.core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'apps.core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Seconds a user's token_version is cached; tokens revoked outside
+# revoke_tokens() (shell, queryset.update()) stop working within this time
+TOKEN_VERSION_CACHE_TTL = int(os.getenv('TOKEN_VERSION_CACHE_TTL', 60))
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -173,6 +187,7 @@ SIMPLE_JWT = {
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
+    'TOKEN_REFRESH_SERIALIZER': 'apps.users.serializers.ClaimsTokenRefreshSerializer',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
@@ -196,14 +211,26 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
 ]
 
-# Channels (WebSocket)
+# Redis
 # Railway provides REDIS_URL
+REDIS_URL = os.getenv('REDIS_URL') or f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', 6379)}/0"
+
+# Cache shared by every worker (token revocation markers, idempotency keys)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+
+# Channels (WebSocket)
 if os.getenv('REDIS_URL'):
     CHANNEL_LAYERS = {
         'default': {
@@ -224,6 +251,49 @@ else:
         },
     }
 
+# Live game state engine
+# 'db' keeps the database authoritative for every turn, 'memory' keeps live games
+# in the worker process and 'redis' shares them between workers
+GAME_STATE_ENGINE = os.getenv('GAME_STATE_ENGINE', 'db')
+GAME_STATE_TTL = int(os.getenv('GAME_STATE_TTL', 24 * 60 * 60))
+# Seconds between write-behind flushes of live game turns to the database
+GAME_STATE_FLUSH_INTERVAL = float(os.getenv('GAME_STATE_FLUSH_INTERVAL', 0.5))
+
+# Matchmaking queues: 'redis' shares them between workers, 'memory' is per process
+MATCHMAKING_BACKEND = os.getenv('MATCHMAKING_BACKEND', 'redis')
+# Seconds a player waits in a matchmaking queue before the entry expires
+MATCHMAKING_QUEUE_TTL = int(os.getenv('MATCHMAKING_QUEUE_TTL', 300))
+
+# Turn sequencing for database-backed games: 'redis' leases are shared between
+# workers, 'memory' locks are per process. The lease expires after
+# TURN_LEASE_TIMEOUT seconds; a guess waits TURN_LEASE_WAIT seconds for it
+TURN_SEQUENCER_BACKEND = os.getenv('TURN_SEQUENCER_BACKEND', 'redis')
+TURN_LEASE_TIMEOUT = float(os.getenv('TURN_LEASE_TIMEOUT', 10))
+TURN_LEASE_WAIT = float(os.getenv('TURN_LEASE_WAIT', 5))
+
+# Leaderboard ranking: 'redis' shares it between workers, 'memory' is per process
+LEADERBOARD_BACKEND = os.getenv('LEADERBOARD_BACKEND', 'redis')
+
+# Seconds a worker trusts its cached BetSettings before checking the version in Redis
+BET_SETTINGS_CHECK_INTERVAL = float(os.getenv('BET_SETTINGS_CHECK_INTERVAL', 5))
+
+# Game broadcasts go through the game_events outbox: the publisher claims up to
+# OUTBOX_BATCH_SIZE events at a time and polls every OUTBOX_POLL_INTERVAL seconds when idle
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.05))
+
+# Outcomes of requests sent with an Idempotency-Key are replayed to retries for
+# IDEMPOTENCY_TTL seconds; a request still running holds its key for at most
+# IDEMPOTENCY_LOCK_TIMEOUT seconds
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 30))
+
+# Lobby deltas arriving within this many seconds go out as one message
+LOBBY_COALESCE_WINDOW = float(os.getenv('LOBBY_COALESCE_WINDOW', 0.1))
+
+# Largest single deposit or withdrawal, as a decimal amount
+WALLET_MAX_AMOUNT = os.getenv('WALLET_MAX_AMOUNT', '99999999.99')
+
 # Production Security Settings
 if not DEBUG:
     # Trust Railway's proxy SSL header to avoid redirect loops
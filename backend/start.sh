@@ -49,6 +49,24 @@ else
     echo "⚠️  Continuing anyway"
 fi
 
+# Rebuild player stats and the leaderboard, they are derived from completed games
+# and missing after the first migration or a Redis flush
+echo ""
+echo "Rebuilding player stats and leaderboard..."
+python manage.py rebuild_player_stats
+
+if [ $? -eq 0 ]; then
+    echo "✓ Player stats rebuilt"
+else
+    echo "✗ Player stats rebuild failed!"
+    echo "⚠️  Continuing anyway - the leaderboard may be incomplete until it is rerun"
+fi
+
+# Start the game event publisher, restarting it if it exits
+echo ""
+echo "Starting game event publisher..."
+(while true; do python manage.py publish_game_events; echo "✗ Game event publisher exited, restarting"; sleep 1; done) &
+
 # Check if PORT is set (Railway provides this)
 if [ -z "$PORT" ]; then
     echo "WARNING: PORT not set, using default 8000"
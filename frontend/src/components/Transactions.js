@@ -19,7 +19,7 @@ const Transactions = () => {
     try {
       setLoading(true);
       const response = await api.get('/api/auth/wallet/transactions/');
-      setTransactions(response.data);
+      setTransactions(response.data.results);
     } catch (err) {
       console.error('Error loading transactions:', err);
       setError('Failed to load transactions');
@@ -4,7 +4,7 @@ const adminService = {
   // Users management
   getUsers: async (params = {}) => {
     const response = await api.get('/api/auth/admin/users/', { params });
-    return response.data;
+    return response.data.results;
   },
 
   getUserDetail: async (userId) => {
@@ -25,19 +25,19 @@ const adminService = {
   // Transactions
   getTransactions: async (params = {}) => {
     const response = await api.get('/api/auth/admin/transactions/', { params });
-    return response.data;
+    return response.data.results;
   },
 
   // Rooms
   getRooms: async (params = {}) => {
     const response = await api.get('/api/game/admin/rooms/', { params });
-    return response.data;
+    return response.data.results;
   },
 
   // Games
   getGames: async (params = {}) => {
     const response = await api.get('/api/game/admin/games/', { params });
-    return response.data;
+    return response.data.results;
   },
 
   // Bet settings
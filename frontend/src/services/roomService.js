@@ -5,13 +5,13 @@ const roomService = {
   getRooms: async (status = null) => {
     const params = status ? { status } : {};
     const response = await api.get('/api/game/rooms/', { params });
-    return response.data;
+    return response.data.results;
   },
 
   // Get user's rooms
   getMyRooms: async () => {
     const response = await api.get('/api/game/rooms/my/');
-    return response.data;
+    return response.data.results;
   },
 
   // Get specific room details